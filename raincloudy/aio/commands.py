@@ -0,0 +1,155 @@
+"""RainCloudy action command queue."""
+from __future__ import annotations
+
+import asyncio
+import time
+from itertools import groupby
+from typing import TYPE_CHECKING, Any
+
+from ..commands import SETTERS, Command
+from ..helpers import command_value, order_by_selection
+
+if TYPE_CHECKING:
+    from .core import RainCloudy
+    from .faucet import RainCloudyFaucetZone
+
+
+class CommandQueue:
+    """
+    Send the zone settings of a RainCloudy object one after another.
+
+    Settings are queued and sent by a worker task, so actions never
+    interleave their forms with the selection of the session. A setting
+    queued again for the same zone before being sent replaces the former
+    one, whose future is cancelled. Settings queued together are sent
+    grouped by faucet, starting with the selected one, and a faucet with
+    several settings receives them in a single batch form.
+    """
+
+    def __init__(self, parent: RainCloudy):
+        """
+        Initialize CommandQueue object.
+
+        :param parent: RainCloudy object
+        :type parent: RainCloudy object
+        :return: CommandQueue object
+        :rtype: CommandQueue object
+        """
+        self._parent = parent
+        self._pending: dict[tuple[RainCloudyFaucetZone, str], Command] = {}
+        self._worker: asyncio.Task | None = None
+
+    def __repr__(self) -> str:
+        """Object representation."""
+        return f"<{self.__class__.__name__}: {self.depth} queued>"
+
+    @property
+    def depth(self) -> int:
+        """Return the number of settings waiting to be sent."""
+        return len(self._pending)
+
+    def submit(
+        self, zone: RainCloudyFaucetZone, field: str, value: Any
+    ) -> asyncio.Future:
+        """
+        Queue a zone setting.
+
+        :param zone: zone to change
+        :param field: "manual_watering", "rain_delay" or "auto_watering"
+        :param value: value given to the zone setter
+        :return: future of the form value sent, None for ignored settings.
+            Completed once every form of the setting was sent
+        :raises ValueError: if the setting is not valid
+        """
+        future = asyncio.get_running_loop().create_future()
+        if command_value(field, value) is None:
+            future.set_result(None)
+            return future
+
+        metrics = self._parent.metrics
+        superseded = self._pending.pop((zone, field), None)
+        if superseded is not None:
+            superseded.future.cancel()
+            metrics["commands_merged"] += 1
+
+        self._pending[(zone, field)] = Command(zone, field, value, future)
+        metrics["commands_queued"] += 1
+        metrics["command_queue_max_depth"] = max(
+            metrics["command_queue_max_depth"], len(self._pending)
+        )
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+        return future
+
+    async def join(self) -> None:
+        """Wait until every queued setting was sent."""
+        while self._worker is not None:
+            await asyncio.shield(self._worker)
+
+    async def _run(self) -> None:
+        """Send queued settings until the queue is empty."""
+        try:
+            while self._pending:
+                commands = [
+                    command
+                    for command in self._pending.values()
+                    if not command.future.cancelled()
+                ]
+                self._pending = {}
+
+                try:
+                    selection = await self._parent.selection()
+                    commands = order_by_selection(
+                        commands, lambda command: command.target, selection
+                    )
+                except Exception as err:  # pylint: disable=broad-except
+                    for command in commands:
+                        _settle(command.future, exception=err)
+                    continue
+
+                for _, group in groupby(commands, lambda command: command.target):
+                    await self._send(list(group))
+        finally:
+            self._worker = None
+
+    async def _send(self, commands: list[Command]) -> None:
+        """Send the settings of one faucet and complete their futures."""
+        try:
+            if len(commands) == 1:
+                command = commands[0]
+                await getattr(command.zone, SETTERS[command.field])(command.value)
+            else:
+                # pylint: disable=protected-access
+                batch = commands[0].zone._faucet.batch()
+                for command in commands:
+                    setter = getattr(batch, "set_" + command.field)
+                    setter(command.zone.id, command.value)
+                await batch._submit()
+        except Exception as err:  # pylint: disable=broad-except
+            for command in commands:
+                _settle(command.future, exception=err)
+            return
+
+        metrics = self._parent.metrics
+        for command in commands:
+            latency = time.monotonic() - command.queued_at
+            metrics["command_latency"] = latency
+            metrics["command_latency_max"] = max(
+                metrics["command_latency_max"], latency
+            )
+            _settle(command.future, command_value(command.field, command.value))
+
+
+def _settle(
+    future: asyncio.Future, result: Any = None, exception: Exception | None = None
+) -> None:
+    """Complete a future, unless its caller cancelled it meanwhile."""
+    if future.done():
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+
+
+# vim:sw=4:ts=4:et:
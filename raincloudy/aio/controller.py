@@ -6,6 +6,7 @@ from typing import TYPE_CHECKING, Any
 
 from ..const import SETUP_ENDPOINT
 from ..helpers import find_controller_or_faucet_name
+from ..status import FaucetStatus
 from .faucet import RainCloudyFaucet, RainCloudyFaucetCore
 
 if TYPE_CHECKING:
@@ -38,7 +39,7 @@ class RainCloudyController:
         self.home = parent.html["home"]
         self._controller_id = controller_id
         self.index = index
-        self.attributes: dict[str, Any] = {}
+        self.snapshot: FaucetStatus | None = None
         # faucets associated with controller
         self._faucets = self._create_faucets(faucets)
 
@@ -93,15 +94,22 @@ class RainCloudyController:
         }
         await self._parent.post(data, url=SETUP_ENDPOINT, referer=SETUP_ENDPOINT)
 
+    @property
+    def attributes(self) -> dict[str, Any]:
+        """Return the last status in the shape of the status endpoint."""
+        if self.snapshot is None:
+            return {}
+        return self.snapshot.to_dict()
+
     @property
     def status(self) -> str:
         """Return controller status."""
-        return self.attributes["controller_status"]
+        return self.snapshot.controller_status
 
     @property
     def current_time(self) -> str:
         """Return controller current time."""
-        return self.attributes["current_time"]
+        return self.snapshot.current_time
 
     @property
     def faucets(self) -> list[RainCloudyFaucetCore]:
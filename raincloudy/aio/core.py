@@ -2,30 +2,74 @@
 from __future__ import annotations
 
 import asyncio
+import functools
+import logging
 import os
 import ssl
+import time
+from concurrent.futures import Executor
+from contextlib import asynccontextmanager
+from http.cookiejar import http2time
+from http.cookies import Morsel
 from pathlib import Path
-from typing import Any
+from typing import (
+    Any,
+    AsyncContextManager,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+)
 
-from aiohttp.client import ClientSession
+from aiohttp.client import ClientError, ClientResponseError, ClientSession
 from aiohttp.client_reqrep import ClientResponse
-from bs4 import BeautifulSoup
+from yarl import URL
 
 from ..const import (
     HEADERS,
     HOME_ENDPOINT,
+    HTML_PARSER,
     INITIAL_DATA,
     LOGIN_ENDPOINT,
     LOGOUT_ENDPOINT,
+    RELOGIN_ATTEMPTS,
+    RELOGIN_BACKOFF,
+    SESSION_COOKIES,
     SETUP_ENDPOINT,
+    TURN_OFF_DELAY,
+    WATCH_QUEUE_SIZE,
 )
+from ..exceptions import RainCloudyException
 from ..helpers import (
+    HOME_SELECTS,
+    PARSE_CACHE,
+    LazyPage,
+    PageModel,
+    ParseCache,
     controller_serial_finder,
     faucet_serial_finder,
+    find_selected_controller_or_faucet_index,
     find_zone_names,
-    generate_soup_html,
+    parse_page,
+    selection_after_form,
+    session_is_valid,
+    stream_page_model,
+    topology_matches_page,
 )
+from ..status import FaucetStatus, StatusChange, diff_status
+from .commands import CommandQueue
 from .controller import RainCloudyController
+from .faucet import RainCloudyFaucetCore, RainCloudyFaucetZone
+from .scheduler import PollScheduler
+from .watch import StatusEvent, Subscription, WatchHub
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def _no_slot() -> AsyncIterator[None]:
+    """Allow a request right away, async with nullcontext needs Python 3.10."""
+    yield
 
 
 class RainCloudy:
@@ -38,6 +82,20 @@ class RainCloudy:
         client_session: ClientSession = None,
         http_proxy: str = None,
         ssl_verify: bool = True,
+        html_parser: str = HTML_PARSER,
+        forms_only: bool = False,
+        stream_home: bool = False,
+        parse_cache: ParseCache | None = PARSE_CACHE,
+        parse_executor: Executor | None = None,
+        discovery_concurrency: int = 1,
+        topology_store: Any = None,
+        session_store: Any = None,
+        relogin_attempts: int = RELOGIN_ATTEMPTS,
+        relogin_backoff: float = RELOGIN_BACKOFF,
+        poll_scheduler: PollScheduler | None = None,
+        status_max_age: float | None = None,
+        turn_off_delay: float = TURN_OFF_DELAY,
+        json_decoder: str | None = None,
     ):
         """
         Initialize RainCloud object.
@@ -48,12 +106,59 @@ class RainCloudy:
         :param https_proxy: HTTPs proxy information (127.0.0.1:8080)
         :param ssl_warnings: Show SSL warnings
         :param ssl_verify: Verify SSL server certificate
+        :param html_parser: HTML parser backend (html5lib, lxml, html.parser
+            or selectolax)
+        :param forms_only: Only parse the select elements of each page
+        :param stream_home: Scan action responses for the selected
+            controller and faucet without building a document
+        :param parse_cache: ParseCache shared by repeated pages, None
+            disables caching
+        :param parse_executor: thread or process pool used to parse pages off
+            the event loop, may be shared by several RainCloudy objects. Pages
+            are parsed on the event loop when None
+        :param discovery_concurrency: Setup pages of controllers and faucets
+            fetched at once during login, each with its own session. Pages
+            are fetched one after another when 1
         :type username: string
         :type password: string
         :type http_proxy: string
         :type https_proxy: string
         :type ssl_warnings: boolean
         :type ssl_verify: boolean
+        :type html_parser: string
+        :type forms_only: boolean
+        :type stream_home: boolean
+        :type parse_cache: ParseCache object
+        :type parse_executor: concurrent.futures.Executor object
+        :param topology_store: store keeping the controllers, faucets and
+            zones of the account between runs, see raincloudy.store. When
+            a saved topology matches the home page the setup pages are
+            not crawled
+        :param session_store: store keeping the session cookies between
+            runs, see raincloudy.store. A saved session that is still
+            accepted by the site skips the login requests
+        :param relogin_attempts: login attempts when the site rejects the
+            session
+        :param relogin_backoff: seconds to wait before the second attempt,
+            doubled after every failure
+        :param poll_scheduler: PollScheduler shared with other accounts,
+            limiting their concurrent status requests. The account is
+            registered with it
+        :param status_max_age: seconds a faucet status is trusted before
+            actions fetch it again. None fetches it before every action
+        :param turn_off_delay: seconds between the ON and the OFF forms
+            turning a zone off
+        :param json_decoder: decoder of the status responses (json, orjson
+            or msgspec), the fastest installed when None
+        :type discovery_concurrency: integer
+        :type topology_store: JSONFileStore object
+        :type session_store: JSONFileStore object
+        :type relogin_attempts: integer
+        :type relogin_backoff: float
+        :type poll_scheduler: PollScheduler object
+        :type status_max_age: float
+        :type turn_off_delay: float
+        :type json_decoder: string
         :rtype: RainCloudy object
         """
         if client_session:
@@ -63,6 +168,39 @@ class RainCloudy:
             self.client = ClientSession()
             self._client_provided = False
         self._ssl_verify = ssl_verify
+        self._html_parser = html_parser
+        self._forms_only = forms_only
+        self._stream_home = stream_home
+        self._parse_cache = parse_cache
+        self._parse_executor = parse_executor
+        self._discovery_concurrency = discovery_concurrency
+        self._topology_store = topology_store
+        self._session_store = session_store
+        self._relogin_attempts = relogin_attempts
+        self._relogin_backoff = relogin_backoff
+        self._poll_scheduler = poll_scheduler
+        self.status_max_age = status_max_age
+        self.turn_off_delay = turn_off_delay
+        self.json_decoder = json_decoder
+        if poll_scheduler is not None:
+            poll_scheduler.register(self)
+        self._login_lock = asyncio.Lock()
+        self.session_generation = 0
+        self.metrics = {
+            "relogins": 0,
+            "relogins_shared": 0,
+            "relogin_failures": 0,
+            "status_requests": 0,
+            "status_coalesced": 0,
+            "commands_queued": 0,
+            "commands_merged": 0,
+            "command_queue_max_depth": 0,
+            "command_latency": 0.0,
+            "command_latency_max": 0.0,
+        }
+        self.commands = CommandQueue(self)
+        self.watcher = WatchHub(self)
+        self._status_fetches: dict[tuple[str, str], asyncio.Future] = {}
 
         # define credentials
         self._username = username
@@ -70,8 +208,13 @@ class RainCloudy:
 
         # initialize future attributes
         self._controllers: list[RainCloudyController] = []
+        self._controllers_by_serial: dict[str, RainCloudyController] = {}
+        self._faucets_by_serial: dict[str, RainCloudyFaucetCore] = {}
+        self._listeners: list[Callable] = []
         self.is_connected = False
-        self.html: dict[str, BeautifulSoup | None] = {
+        self._selection: tuple[int, int] | None = None
+        self._selection_from_home = False
+        self.html: dict[str, PageModel | LazyPage | None] = {
             "home": None,
             "setup": None,
             "program": None,
@@ -93,43 +236,314 @@ class RainCloudy:
 
         cert_file = Path(__location__, "../wifiaquatimer_com_chain.cer").resolve()
 
+        self._args["ssl"] = ssl.create_default_context(cafile=str(cert_file))
+        # self.client.verify = cert_file.resolve()
+        home = await self._restore_session()
+        if home is None:
+            await self._login_session(self.client)
+            self.session_generation += 1
+            self._save_session()
+            async with self.client.get(url=HOME_ENDPOINT, **self._args) as req:
+                home = await req.text()
+
+        self.html["home"] = LazyPage(home, self._parse_home)
+        self._selection = None
+        self._selection_from_home = True
+
+        topology = await self._load_topology()
+        if topology is not None:
+            try:
+                await self._create_controllers(topology)
+            except ClientResponseError:
+                # the status of a saved faucet could not be read
+                topology = None
+
+        if topology is None:
+            async with self.client.get(
+                SETUP_ENDPOINT, headers=HEADERS, **self._args
+            ) as setup:
+                # populate device list
+                self.html["setup"] = await self._parse_page_async(await setup.text())
+
+            topology = await self._discover()
+            await self._create_controllers(topology)
+            self._save_topology(topology)
+
+        self.is_connected = True
+
+    def export_session(self) -> dict[str, Any] | None:
+        """
+        Return the session cookies of the client.
+
+        :return: dict with the sessionid and csrftoken cookies and the
+            expiry timestamp of the session, None when not logged in
+        :rtype: dict
+        """
+        state: dict[str, Any] = {"expires": None}
+        for cookie in self.client.cookie_jar:
+            if cookie.key in SESSION_COOKIES:
+                state[cookie.key] = cookie.value
+                if cookie.key == "sessionid":
+                    state["expires"] = self._cookie_expiry(cookie)
+
+        if state.get("sessionid") is None:
+            return None
+        return state
+
+    @staticmethod
+    def _cookie_expiry(cookie: Morsel) -> float | None:
+        """Return the expiry timestamp of a cookie, None for session cookies."""
+        if cookie["max-age"]:
+            try:
+                return time.time() + int(cookie["max-age"])
+            except ValueError:
+                pass
+        if cookie["expires"]:
+            return http2time(cookie["expires"])
+        return None
+
+    def import_session(self, state: dict[str, Any]) -> None:
+        """
+        Add saved session cookies to the client.
+
+        :param state: dict returned by export_session
+        :type state: dict
+        """
+        self.session_generation += 1
+        self.client.cookie_jar.update_cookies(
+            {
+                name: state[name]
+                for name in SESSION_COOKIES
+                if state.get(name) is not None
+            },
+            URL(HOME_ENDPOINT),
+        )
+
+    @property
+    def _session_key(self) -> str:
+        """Return the session_store key of the account."""
+        return f"session:{self._username}"
+
+    async def _restore_session(self) -> str | None:
+        """Return the home page when a saved session is still valid."""
+        if self._session_store is None:
+            return None
+
+        state = self._session_store.load(self._session_key)
+        if not session_is_valid(state):
+            return None
+
+        self.import_session(state)
+        # an expired session is redirected to the login page
+        async with self.client.get(
+            url=HOME_ENDPOINT, allow_redirects=False, **self._args
+        ) as req:
+            if req.status == 200:
+                return await req.text()
+
+        self._session_store.delete(self._session_key)
+        return None
+
+    def _save_session(self) -> None:
+        """Save the session cookies to session_store."""
+        state = self.export_session()
+        if self._session_store is not None and state is not None:
+            self._session_store.save(self._session_key, state)
+
+    async def _create_controllers(
+        self, topology: list[tuple[str, list[dict[str, Any]]]]
+    ) -> None:
+        """Create and update a RainCloudyController for every controller."""
+        self._controllers = [
+            RainCloudyController(self, controller_serial, index, faucets)
+            for index, (controller_serial, faucets) in enumerate(topology)
+        ]
+        self._index_controllers()
+        await asyncio.gather(*[controller.update() for controller in self._controllers])
+
+    def _index_controllers(self) -> None:
+        """Index the controllers and faucets by serial."""
+        self._controllers_by_serial = {
+            controller.serial: controller for controller in self._controllers
+        }
+        self._faucets_by_serial = {
+            faucet.serial: faucet
+            for controller in self._controllers
+            for faucet in controller.faucets
+        }
+
+    def add_listener(
+        self, listener: Callable[[RainCloudyFaucetCore, list[StatusChange]], Any]
+    ) -> Callable[[], None]:
+        """
+        Call listener with the changes of every new faucet status.
+
+        Listeners are called with the faucet and a list of
+        raincloudy.status.StatusChange once a refresh or a setting sent
+        stored a new status. They are not called when nothing changed,
+        nor for the first status of a faucet. Errors raised by a listener
+        are logged.
+
+        :param listener: function called with (faucet, changes)
+        :return: function removing the listener
+        """
+        self._listeners.append(listener)
+
+        def remove() -> None:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return remove
+
+    def notify_changes(
+        self,
+        faucet: RainCloudyFaucetCore,
+        old: FaucetStatus | None,
+        new: FaucetStatus,
+    ) -> None:
+        """Call the listeners with the changes between two snapshots."""
+        if not self._listeners or old is None:
+            return
+        changes = diff_status(old, new)
+        if not changes:
+            return
+        for listener in list(self._listeners):
+            try:
+                listener(faucet, changes)
+            except Exception:  # pylint: disable=broad-except
+                # a failing listener must not abort the update storing
+                # the status, nor the other listeners
+                _LOGGER.exception("Error in status listener %r", listener)
+
+    def get_controller(self, serial: str) -> RainCloudyController | None:
+        """
+        Return a controller by serial without scanning the controllers.
+
+        :param serial: controller serial
+        :return: RainCloudyController object, None if unknown
+        """
+        return self._controllers_by_serial.get(serial)
+
+    def get_faucet(self, serial: str) -> RainCloudyFaucetCore | None:
+        """
+        Return a faucet of any controller by serial.
+
+        :param serial: faucet serial
+        :return: RainCloudyFaucet object, None if unknown
+        """
+        return self._faucets_by_serial.get(serial)
+
+    def get_zone(self, faucet_serial: str, zone_id: int) -> RainCloudyFaucetZone | None:
+        """
+        Return a zone by faucet serial and zone id.
+
+        :param faucet_serial: faucet serial
+        :param zone_id: zone id, from 1 to 4
+        :return: RainCloudyFaucetZone object, None if unknown
+        """
+        faucet = self.get_faucet(faucet_serial)
+        if faucet is None:
+            return None
+        # pylint: disable=protected-access
+        return faucet._find_zone_by_id(zone_id)
+
+    @property
+    def _topology_key(self) -> str:
+        """Return the topology_store key of the account."""
+        return f"topology:{self._username}"
+
+    async def _load_topology(self) -> list[tuple[str, list[dict[str, Any]]]] | None:
+        """Return the saved topology if it matches the home page."""
+        if self._topology_store is None:
+            return None
+
+        topology = self._topology_store.load(self._topology_key)
+        if topology is None:
+            return None
+        if not topology_matches_page(topology, await self.parsed_home()):
+            self.invalidate_topology()
+            return None
+        return topology
+
+    def _save_topology(self, topology: list[tuple[str, list[dict[str, Any]]]]) -> None:
+        """Save the discovered topology to topology_store."""
+        if self._topology_store is not None:
+            self._topology_store.save(self._topology_key, topology)
+
+    def invalidate_topology(self) -> None:
+        """Forget the saved topology so the next login crawls the setup pages."""
+        if self._topology_store is not None:
+            self._topology_store.delete(self._topology_key)
+
+    async def reauthenticate(self, generation: int | None = None) -> None:
+        """
+        Log in again after the site rejected the session.
+
+        Concurrent callers share a single login: a caller passing the
+        session_generation it used returns as soon as another caller
+        replaced that session.
+
+        :param generation: session_generation of the rejected session
+        :type generation: integer
+        :raises aiohttp.ClientError: if every attempt failed
+        """
+        async with self._login_lock:
+            if generation is not None and generation != self.session_generation:
+                self.metrics["relogins_shared"] += 1
+                return
+
+            for attempt in range(self._relogin_attempts):
+                if attempt:
+                    await asyncio.sleep(self._relogin_backoff * 2 ** (attempt - 1))
+                try:
+                    await self._login_session(self.client)
+                except ClientError:
+                    self.metrics["relogin_failures"] += 1
+                    if attempt == self._relogin_attempts - 1:
+                        raise
+                    continue
+
+                self.session_generation += 1
+                self._selection = None
+                self._selection_from_home = False
+                self.metrics["relogins"] += 1
+                self._save_session()
+                return
+
+    async def _login_session(self, client: ClientSession) -> None:
+        """Log a ClientSession in to the account."""
         # to obtain csrftoken, remove Referer from headers
         headers = HEADERS.copy()
         headers.pop("Referer")
 
         # initial GET request
-        # self.client = requests.Session()
-        # self._client_session.proxies = self._proxies
-        self._args["ssl"] = ssl.create_default_context(cafile=str(cert_file))
-        # self.client.verify = cert_file.resolve()
-        await self.client.get(LOGIN_ENDPOINT, headers=headers, **self._args)
+        async with client.get(LOGIN_ENDPOINT, headers=headers, **self._args) as req:
+            await req.read()
 
         # set headers to submit POST request
         token = INITIAL_DATA.copy()
-        token["csrfmiddlewaretoken"] = self.csrftoken
+        token["csrfmiddlewaretoken"] = self._session_csrftoken(client)
         token["email"] = self._username
         token["password"] = self._password
 
-        async with self.client.post(
+        async with client.post(
             LOGIN_ENDPOINT,
             data=token,
             headers=HEADERS,
+            allow_redirects=False,
             **self._args,
         ) as req:
             if req.status != 302:
                 req.raise_for_status()
 
-        async with self.client.get(url=HOME_ENDPOINT, **self._args) as home:
-            self.html["home"] = generate_soup_html(await home.text())
-
-        async with self.client.get(
-            SETUP_ENDPOINT, headers=HEADERS, **self._args
-        ) as setup:
-            # populate device list
-            self.html["setup"] = generate_soup_html(await setup.text())
-
+    async def _discover(self) -> list[tuple[str, list[dict[str, Any]]]]:
+        """Return the serial and faucets of every controller."""
         controller_serials = controller_serial_finder(self.html["setup"])
 
+        if self._discovery_concurrency > 1:
+            return await self._discover_concurrently(controller_serials)
+
+        topology = []
         for index, controller_serial in enumerate(controller_serials):
 
             # We need to do a form submit for other controllers to get
@@ -138,7 +552,7 @@ class RainCloudy:
                 data = {"select_controller": index}
                 resp = await self.post(data, url=SETUP_ENDPOINT, referer=SETUP_ENDPOINT)
                 if resp:
-                    self.html["setup"] = generate_soup_html(await resp.text())
+                    self.html["setup"] = await self._parse_page_async(await resp.text())
 
             faucet_serials = faucet_serial_finder(self.html["setup"])
 
@@ -153,30 +567,171 @@ class RainCloudy:
                         data, url=SETUP_ENDPOINT, referer=SETUP_ENDPOINT
                     )
                     if resp:
-                        self.html["setup"] = generate_soup_html(await resp.text())
+                        self.html["setup"] = await self._parse_page_async(
+                            await resp.text()
+                        )
 
                 zone_names = find_zone_names(self.html["setup"])
                 faucets.append({"serial": faucet_serial, "zones": zone_names})
 
-            self._controllers.append(
-                RainCloudyController(self, controller_serial, index, faucets)
+            topology.append((controller_serial, faucets))
+        return topology
+
+    async def _discover_concurrently(
+        self, controller_serials: list[str]
+    ) -> list[tuple[str, list[dict[str, Any]]]]:
+        """
+        Fetch the setup page of every controller and faucet concurrently.
+
+        The setup form only lists the faucets and zones of the controller and
+        faucet selected in the server side session, so every branch is
+        crawled with its own session to keep concurrent selections apart.
+        """
+        semaphore = asyncio.Semaphore(self._discovery_concurrency)
+
+        async def fetch(controller_index: int, faucet_index: int) -> PageModel:
+            async with semaphore:
+                return await self._branch_setup_page(controller_index, faucet_index)
+
+        # setup pages listing the faucets of every controller
+        pages = [self.html["setup"]] + list(
+            await asyncio.gather(
+                *[fetch(index, 0) for index in range(1, len(controller_serials))]
             )
-        await asyncio.gather(*[controller.update() for controller in self._controllers])
-        self.is_connected = True
+        )
+
+        # setup pages listing the zones of every other faucet
+        branches = [
+            (index, faucet_index)
+            for index, page in enumerate(pages)
+            for faucet_index in range(1, len(faucet_serial_finder(page)))
+        ]
+        faucet_pages = dict(
+            zip(branches, await asyncio.gather(*[fetch(*b) for b in branches]))
+        )
+
+        topology = []
+        for index, (controller_serial, page) in enumerate(
+            zip(controller_serials, pages)
+        ):
+            faucets = []
+            for faucet_index, faucet_serial in enumerate(faucet_serial_finder(page)):
+                zone_page = faucet_pages.get((index, faucet_index), page)
+                faucets.append(
+                    {"serial": faucet_serial, "zones": find_zone_names(zone_page)}
+                )
+            topology.append((controller_serial, faucets))
+        return topology
+
+    async def _branch_setup_page(
+        self, controller_index: int, faucet_index: int
+    ) -> PageModel:
+        """Return the setup page with a controller and faucet selected."""
+        async with ClientSession(
+            connector=self.client.connector, connector_owner=False
+        ) as client:
+            await self._login_session(client)
+
+            forms: list[dict[str, Any]] = []
+            if controller_index > 0:
+                forms.append({"select_controller": controller_index})
+            if faucet_index > 0:
+                forms.append({"select_faucet": faucet_index})
+
+            for data in forms:
+                resp = await self._post(client, data, SETUP_ENDPOINT, SETUP_ENDPOINT)
+                if resp is None:
+                    raise RainCloudyException(
+                        f"Could not select controller {controller_index} "
+                        f"faucet {faucet_index}"
+                    )
+            return await self._parse_page_async(await resp.text())
+
+    @staticmethod
+    def _session_csrftoken(client: ClientSession) -> str:
+        """Return the csrftoken cookie of a ClientSession."""
+        for cookie in client.cookie_jar:
+            if cookie.key == "csrftoken":
+                return cookie.value
+        return ""
 
     @property
     def csrftoken(self) -> str:
         """Return current csrftoken from request session."""
         if self.client:
-            for cookie in self.client.cookie_jar:
-                if cookie.key == "csrftoken":
-                    return cookie.value
+            return self._session_csrftoken(self.client)
         return ""
 
+    async def coalesce_status(
+        self, key: tuple[str, str], fetch: Callable[[], Awaitable[FaucetStatus]]
+    ) -> FaucetStatus:
+        """
+        Share one status fetch between concurrent callers.
+
+        :param key: (controller_serial, faucet_serial) of the faucet
+        :param fetch: coroutine function requesting the status
+        :return: FaucetStatus, the same immutable object for every caller
+        """
+        task = self._status_fetches.get(key)
+        if task is not None:
+            self.metrics["status_coalesced"] += 1
+        else:
+            self.metrics["status_requests"] += 1
+            task = self._status_fetches[key] = asyncio.ensure_future(fetch())
+
+            def forget(done: asyncio.Future) -> None:
+                if self._status_fetches.get(key) is done:
+                    del self._status_fetches[key]
+
+            task.add_done_callback(forget)
+
+        # a cancelled caller must not cancel the fetch shared with others
+        return await asyncio.shield(task)
+
+    def status_slot(self, url: str) -> AsyncContextManager[Any]:
+        """Return a context waiting for the poll_scheduler to allow url."""
+        if self._poll_scheduler is None:
+            return _no_slot()
+        return self._poll_scheduler.slot(url)
+
     async def update(self) -> None:
-        """Update controller._attributes."""
+        """Update the status snapshot of every faucet."""
         await asyncio.gather(*[controller.update() for controller in self._controllers])
 
+    async def watch(
+        self,
+        controller: str | None = None,
+        faucet: str | None = None,
+        zone: int | None = None,
+        fields: Iterable[str] | None = None,
+        maxsize: int = WATCH_QUEUE_SIZE,
+        overflow: str = "coalesce",
+    ) -> AsyncIterator[StatusEvent]:
+        """
+        Yield the changes of the status of the account as they are found.
+
+        The faucets are polled by watcher while at least one watch runs,
+        so every subscriber shares the same status requests. Changes of
+        the settings sent meanwhile are yielded as well. Close the
+        iterator, with aclose or by leaving async for, to unsubscribe.
+
+        :param controller: only changes of this controller serial
+        :param faucet: only changes of this faucet serial
+        :param zone: only changes of this zone id
+        :param fields: only changes of these fields
+        :param maxsize: events waiting before the oldest is dropped
+        :param overflow: "drop" or "coalesce" changes of a field still
+            waiting into a single event
+        :return: StatusEvent objects
+        """
+        subscription = Subscription(maxsize, overflow, controller, faucet, zone, fields)
+        self.watcher.subscribe(subscription)
+        try:
+            while True:
+                yield await subscription.get()
+        finally:
+            self.watcher.unsubscribe(subscription)
+
     @property
     def controllers(self) -> list[RainCloudyController]:
         """Show current linked controllers."""
@@ -184,16 +739,113 @@ class RainCloudy:
             return self._controllers
         raise AttributeError("There is no controller assigned.")
 
+    def _parse_page(self, data: str) -> PageModel:
+        """Parse a page with the configured parser options."""
+        return parse_page(
+            data, self._html_parser, self._forms_only, cache=self._parse_cache
+        )
+
+    def _parse_home(self, data: str) -> PageModel:
+        """Parse the home page, scanning it when stream_home is set."""
+        if self._stream_home:
+            return stream_page_model(
+                data,
+                parser=self._html_parser,
+                forms_only=self._forms_only,
+                cache=self._parse_cache,
+            )
+        return self._parse_page(data)
+
+    async def _parse_page_async(self, data: str, home: bool = False) -> PageModel:
+        """Parse a page, in parse_executor when one is configured."""
+        if self._parse_executor is None:
+            return self._parse_home(data) if home else self._parse_page(data)
+
+        # the cache is checked on the event loop, so process pools only
+        # receive the text; keys match parse_page and stream_page_model
+        if home and self._stream_home:
+            parse = functools.partial(
+                stream_page_model,
+                parser=self._html_parser,
+                forms_only=self._forms_only,
+                cache=None,
+            )
+            options = ("stream", HOME_SELECTS, self._html_parser, self._forms_only)
+        else:
+            parse = functools.partial(
+                parse_page,
+                parser=self._html_parser,
+                forms_only=self._forms_only,
+                cache=None,
+            )
+            options = ("soup", self._html_parser, self._forms_only)
+
+        key = None
+        if self._parse_cache is not None and isinstance(data, str):
+            key = ParseCache.key(data, *options)
+            model = self._parse_cache.lookup(key)
+            if model is not None:
+                return model
+
+        loop = asyncio.get_running_loop()
+        model = await loop.run_in_executor(self._parse_executor, parse, data)
+        if key is not None:
+            self._parse_cache.store(key, model)
+        return model
+
+    async def parsed_home(self) -> PageModel | LazyPage | None:
+        """Return the home page, parsing a pending LazyPage first."""
+        page = self.html["home"]
+        if isinstance(page, LazyPage) and not page.parsed:
+            page.fill(await self._parse_page_async(page.text, home=True))
+        return page
+
     def update_home(self, data: str) -> None:
         """Update home html"""
         if not isinstance(data, str):
             raise TypeError("Function requires string response")
-        self.html["home"] = generate_soup_html(data)
+        # parsed on first access, so superseded pages are never parsed
+        self.html["home"] = LazyPage(data, self._parse_home)
+
+    async def selection(self) -> tuple[int, int] | None:
+        """
+        Return the controller and faucet selected in the server session.
+
+        Read from the home page after logging in, then tracked from every
+        form posted.
+
+        :return: (controller, faucet) indexes, None if unknown
+        """
+        if self._selection_from_home:
+            home = await self.parsed_home()
+            self._selection_from_home = False
+            controller = find_selected_controller_or_faucet_index(home, "controller")
+            faucet = find_selected_controller_or_faucet_index(home, "faucet")
+            if controller is not None and faucet is not None:
+                self._selection = (controller, faucet)
+        return self._selection
 
     async def post(
         self, ddata: dict, url: str = SETUP_ENDPOINT, referer: str = SETUP_ENDPOINT
     ) -> ClientResponse | None:
         """Update some attributes on namespace."""
+        selection = await self.selection()
+        req = await self._post(self.client, ddata, url, referer)
+        # the server session keeps the controller and faucet of the form
+        if req is None:
+            self._selection = None
+        else:
+            self._selection = selection_after_form(ddata, selection)
+        return req
+
+    async def _post(
+        self,
+        client: ClientSession,
+        ddata: dict,
+        url: str = SETUP_ENDPOINT,
+        referer: str = SETUP_ENDPOINT,
+    ) -> ClientResponse | None:
+        """Submit a form with a ClientSession."""
         headers = HEADERS.copy()
         if referer is None:
             headers.pop("Referer")
@@ -202,14 +854,14 @@ class RainCloudy:
 
         # append csrftoken
         if "csrfmiddlewaretoken" not in ddata.keys():
-            ddata["csrfmiddlewaretoken"] = self.csrftoken
+            ddata["csrfmiddlewaretoken"] = self._session_csrftoken(client)
 
-        async with self.client.post(
-            url, headers=headers, data=ddata, **self._args
-        ) as req:
+        async with client.post(url, headers=headers, data=ddata, **self._args) as req:
             if not req.status == 200:
                 return None
 
+            # read the body before the connection is released
+            await req.read()
             return req
 
     async def logout(self) -> None:
@@ -222,6 +874,7 @@ class RainCloudy:
     def _cleanup(self) -> None:
         """Cleanup object when logging out."""
         self._controllers = []
+        self._index_controllers()
         self.is_connected = False
 
 
@@ -2,25 +2,24 @@
 from __future__ import annotations
 
 import asyncio
+import time
 from typing import TYPE_CHECKING, Any
 
 if TYPE_CHECKING:
     from .core import RainCloudy
     from .controller import RainCloudyController
 
-from ..const import (
-    HEADERS,
-    HOME_ENDPOINT,
-    MANUAL_OP_DATA,
-    MANUAL_WATERING_ALLOWED,
-    MAX_RAIN_DELAY_DAYS,
-    MAX_WATERING_MINUTES,
-    STATUS_ENDPOINT,
-)
+from ..const import HEADERS, HOME_ENDPOINT, MANUAL_OP_DATA, STATUS_ENDPOINT
+from ..exceptions import RainCloudyException
 from ..helpers import (
+    batch_form,
+    batch_settings,
     find_controller_or_faucet_name,
-    find_selected_controller_or_faucet_index,
+    manual_watering_value,
+    rain_delay_days,
+    rain_delay_value,
 )
+from ..status import FaucetStatus, ZoneStatus, decode_status
 
 
 class RainCloudyFaucetCore:
@@ -51,10 +50,13 @@ class RainCloudyFaucetCore:
         self._controller = controller
         self._id = faucet_id
         self._zone_names = zone_names if zone_names else []
-        self._attributes: dict[str, Any] = {}
+        self._status: FaucetStatus | None = None
+        self._updated_at: float | None = None
+        self._acted_at: float | None = None
 
         # zones associated with faucet
         self.zones = self._create_zones()
+        self._zones_by_id = {zone.id: zone for zone in self.zones}
 
     def _create_zones(self) -> list[RainCloudyFaucetZone]:
         """Assign all RainCloudyFaucetZone managed by faucet."""
@@ -78,8 +80,15 @@ class RainCloudyFaucetCore:
 
     @property
     def attributes(self) -> dict[str, Any]:
-        """Return faucet id."""
-        return self._attributes
+        """Return the status in the shape of the status endpoint."""
+        if self._status is None:
+            return {}
+        return self._status.to_dict()
+
+    @property
+    def snapshot(self) -> FaucetStatus | None:
+        """Return the last FaucetStatus, None before the first update."""
+        return self._status
 
     @property
     def serial(self) -> int | str:
@@ -97,6 +106,11 @@ class RainCloudyFaucetCore:
         """Return controller current time."""
         return self._controller.current_time
 
+    @property
+    def turn_off_delay(self) -> float:
+        """Return the seconds between the ON and the OFF forms."""
+        return self._parent.turn_off_delay
+
     @property
     def name(self) -> str | None:
         """Return faucet name."""
@@ -116,18 +130,79 @@ class RainCloudyFaucetCore:
     @property
     def status(self) -> str:
         """Return status."""
-        return self._attributes["faucet_status"]
+        return self._status.faucet_status
 
     @property
-    def battery(self) -> str | None:
-        """Return faucet battery."""
-        battery = self._attributes["battery_percent"]
-        if battery == "" or battery is None:
-            return None
-        return battery.strip("%")
+    def battery(self) -> int | None:
+        """Return faucet battery percentage."""
+        return self._status.battery
 
     async def update(self) -> None:
         """Submit GET request to update information."""
+        status = await self._parent.coalesce_status(
+            (self._controller.serial, self.id), self._fetch_status
+        )
+        self._replace_status(status)
+        self._updated_at = time.monotonic()
+
+    def _replace_status(self, status: FaucetStatus) -> None:
+        """Store a FaucetStatus on the faucet and its controller."""
+        previous, self._status = self._status, status
+        self._controller.snapshot = status
+        self._parent.notify_changes(self, previous, status)
+
+    @property
+    def status_max_age(self) -> float | None:
+        """Return the seconds a status is trusted, None to always refresh."""
+        return self._parent.status_max_age
+
+    @property
+    def status_age(self) -> float | None:
+        """Return the seconds since the status was fetched, None if never."""
+        if self._updated_at is None:
+            return None
+        return time.monotonic() - self._updated_at
+
+    @property
+    def action_age(self) -> float | None:
+        """Return the seconds since an action was submitted, None if never."""
+        if self._acted_at is None:
+            return None
+        return time.monotonic() - self._acted_at
+
+    def is_stale(self) -> bool:
+        """Return True if the status is older than status_max_age."""
+        age = self.status_age
+        return age is None or self.status_max_age is None or age > self.status_max_age
+
+    async def update_if_stale(self) -> None:
+        """Fetch the status again if it is stale."""
+        if self.is_stale():
+            await self.update()
+
+    async def _fetch_status(self) -> FaucetStatus:
+        """Return the FaucetStatus of the faucet."""
+        generation = self._parent.session_generation
+        for attempt in range(2):
+            async with self._parent.status_slot(STATUS_ENDPOINT):
+                async with self._status_request() as req:
+                    if req.status == 200:
+                        return decode_status(
+                            await req.read(), self._parent.json_decoder
+                        )
+                    if req.status != 403 or attempt:
+                        if req.status == 404:
+                            # the saved topology may list a faucet that is
+                            # gone, other errors may be transient and keep it
+                            self._parent.invalidate_topology()
+                        req.raise_for_status()
+
+            # token probably expired, log in again once and retry
+            await self._parent.reauthenticate(generation)
+        raise RainCloudyException("Could not fetch the faucet status")
+
+    def _status_request(self) -> Any:
+        """Return the status GET request context with the current session."""
         # adjust headers
         headers = HEADERS.copy()
         headers["Accept"] = "*/*"
@@ -137,31 +212,32 @@ class RainCloudyFaucetCore:
         url = f"{STATUS_ENDPOINT}?controller_serial\
 ={self._controller.serial}&faucet_serial={self.id}"
 
-        async with self._parent.client.get(
-            url, headers=headers, **self._parent._args
-        ) as req:
-            # token probably expired, then try again
-            if req.status == 403:
-                await self._parent.login()
-                await self.update()
-            elif req.status == 200:
-                self._controller.attributes = self._attributes = await req.json()
-            else:
-                req.raise_for_status()
+        return self._parent.client.get(url, headers=headers, **self._parent._args)
 
     def _find_zone_by_id(self, zone_id) -> RainCloudyFaucetZone | None:
         """Return zone by id."""
         if not self.zones:
             return None
 
-        zone = list(filter(lambda zone: zone.id == zone_id, self.zones))
-
-        return zone[0] if zone else None
+        return self._zones_by_id.get(zone_id)
 
 
 class RainCloudyFaucet(RainCloudyFaucetCore):
     """RainCloudyFaucet object."""
 
+    def batch(self) -> RainCloudyFaucetBatch:
+        """
+        Return a batch of zone changes submitted with a single form.
+
+        Used as an async context manager the changes are submitted on
+        exit::
+
+            async with faucet.batch() as batch:
+                batch.set_manual_watering(1, 15)
+                batch.set_auto_watering(2, False)
+        """
+        return RainCloudyFaucetBatch(self)
+
     @property
     def zone1(self) -> RainCloudyFaucetZone | None:
         """Return zone managed by faucet."""
@@ -258,86 +334,77 @@ class RainCloudyFaucetZone:  # (RainCloudyFaucetCore):
 
     async def set_manual_watering_time(self, value: str | int) -> None:
         """Set watering_time per zone."""
-        if value not in MANUAL_WATERING_ALLOWED:
-            raise ValueError(
-                "Valid options are: {}".format(
-                    ", ".join(map(str, MANUAL_WATERING_ALLOWED))
-                )
-            )
+        await self._queue_setting("manual_watering", value)
+
+    async def _set_manual_watering_time(self, value: str | int) -> None:
+        """Send watering_time per zone."""
+        value = manual_watering_value(value)
 
         ddata = await self.preupdate()
         attr = "zone{}_select_manual_mode".format(self.id)
 
-        if (isinstance(value, int) and value == 0) or (
-            isinstance(value, str) and value.lower() == "off"
-        ):
-            value = "OFF"
-
+        if value == "OFF":
             # If zone is turned on at the valve we need to toggle ON first
             ddata[attr] = "ON"
             await self.submit_action(ddata)
-            await asyncio.sleep(1)
-        elif isinstance(value, str):
-            value = value.upper()
-            if value == "ON":
-                value = MAX_WATERING_MINUTES
+            await asyncio.sleep(self._parent.turn_off_delay)
 
         ddata[attr] = value
         await self.submit_action(ddata)
+        self._store_setting(
+            manual_watering_time=0 if value == "OFF" else int(value),
+            manual_mode_on=value != "OFF",
+        )
 
     @property
     def watering_time(self) -> int:
         """Return watering_time from zone."""
-        auto_watering_time = self.lookup_attr("auto_watering_time")
-
-        manual_watering_time = self.lookup_attr("manual_watering_time")
-
-        if auto_watering_time > manual_watering_time:
-            watering_time = auto_watering_time
-        else:
-            watering_time = manual_watering_time
-
-        return watering_time
+        return self.snapshot.watering_time
 
     @property
     def manual_watering(self) -> bool:
         """Return zone manual_mode_on"""
-        return self.lookup_attr("manual_mode_on")
+        return self.snapshot.manual_mode_on
 
     async def set_rain_delay(self, value: int | str | None) -> None:
         """Set rain delay."""
-        if isinstance(value, int):
-            if value > MAX_RAIN_DELAY_DAYS or value < 0:
-                value = None
-            elif value == 0:
-                value = "off"
-            elif value == 1:
-                value = "1day"
-            elif value >= 2:
-                value = str(value) + "days"
-        elif isinstance(value, str):
-            if value.lower() != "off":
-                value = None
+        await self._queue_setting("rain_delay", value)
 
+    async def _set_rain_delay(self, value: int | str | None) -> None:
+        """Send rain delay."""
+        value = rain_delay_value(value)
         if value is None:
             return None
 
         ddata = await self.preupdate()
-        ddata[f"zone{self.id}_rain_delay_select"] = value
+        # current index for rain_delay starts in 0
+        ddata[f"zone{self.id - 1}_rain_delay_select"] = value
         await self.submit_action(ddata)
+        self._store_setting(rain_delay_mode=rain_delay_days(value))
 
     @property
     def rain_delay(self) -> int:
         """Return the rain delay day from zone."""
-        return self.lookup_attr("rain_delay_mode")
+        return self.snapshot.rain_delay_mode
 
     @property
     def next_cycle(self) -> str:
         """Return the time scheduled for next watering from zone."""
-        return self.lookup_attr("next_water_cycle")
+        return self.snapshot.next_water_cycle
 
     async def set_auto_watering(self, value: bool):
-        """Set auto_watering program."""
+        """
+        Set auto_watering program.
+
+        :return: True once sent, None if value is not a boolean or a later
+            setting of the zone replaced it
+        """
+        if await self._queue_setting("auto_watering", value) is None:
+            return None
+        return True
+
+    async def _set_auto_watering(self, value: bool):
+        """Send auto_watering program."""
         if not isinstance(value, bool):
             return None
 
@@ -352,32 +419,66 @@ class RainCloudyFaucetZone:  # (RainCloudyFaucetCore):
             pass
 
         await self.submit_action(ddata)
+        self._store_setting(program_mode_on=value)
         return True
 
     @property
     def auto_watering(self) -> bool:
         """Return if zone is configured to automatic watering."""
-        return self.lookup_attr("program_mode_on")
+        return self.snapshot.program_mode_on
 
     @property
     def is_watering(self) -> bool:
         """Return boolean if zone is watering."""
         return bool(self.watering_time > 0)
 
+    async def _queue_setting(self, field: str, value: Any) -> Any:
+        """Queue a setting and wait until it was sent."""
+        future = self._parent.commands.submit(self, field, value)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                raise
+            # replaced by a later setting of the zone
+            return None
+
+    @property
+    def snapshot(self) -> ZoneStatus:
+        """Return the ZoneStatus of the zone."""
+        # pylint: disable=protected-access
+        return self._faucet._status.zones[int(self.id) - 1]
+
     def lookup_attr(self, attr: str) -> Any:
         """Returns rain_delay_mode attributes by zone index"""
-        return self._faucet.attributes["rain_delay_mode"][int(self.id) - 1][attr]
+        return getattr(self.snapshot, attr)
+
+    def _store_setting(self, **values: Any) -> None:
+        """Keep the status snapshot in line with a submitted setting."""
+        # pylint: disable=protected-access
+        status = self._faucet._status
+        try:
+            status = status.replace_zone(int(self.id) - 1, **values)
+        except (AttributeError, IndexError):
+            return
+        self._faucet._replace_status(status)
+
+    @property
+    def status_age(self) -> float | None:
+        """Return the seconds since the faucet status was fetched."""
+        return self._faucet.status_age
 
     def _to_dict(self) -> dict:
         """Method to build zone dict."""
+        zone = self.snapshot
         return {
-            "auto_watering": self.auto_watering,
-            "manual_watering": self.manual_watering,
-            "is_watering": self.is_watering,
+            "auto_watering": zone.program_mode_on,
+            "manual_watering": zone.manual_mode_on,
+            "is_watering": zone.watering_time > 0,
             "name": self.name,
-            "next_cycle": self.next_cycle,
-            "rain_delay": self.rain_delay,
-            "watering_time": self.watering_time,
+            "next_cycle": zone.next_water_cycle,
+            "rain_delay": zone.rain_delay_mode,
+            "watering_time": zone.watering_time,
         }
 
     def report(self) -> dict:
@@ -392,32 +493,32 @@ class RainCloudyFaucetZone:  # (RainCloudyFaucetCore):
         """Return a dict with all current options prior submitting request."""
         ddata = MANUAL_OP_DATA.copy()
 
-        # force update to make sure status is accurate
+        # make sure status is accurate, trusting a snapshot younger than
+        # status_max_age
         if force_refresh:
-            await self._faucet.update()
+            await self._faucet.update_if_stale()
 
         # select current controller and faucet
-        ddata["select_controller"] = self._parent.controllers.index(self._controller)
-        ddata["select_faucet"] = self._controller.faucets.index(self._faucet)
+        ddata["select_controller"] = self._controller.index
+        ddata["select_faucet"] = self._faucet.index
 
-        # check if zone is scheduled automatically (zone1_program_toggle)
-        # only add zoneX_program_toogle to ddata when needed,
-        # otherwise the field will be always on
         for zone in self._faucet.zones:
-            attr = f"zone{zone.id}_program_toggle"
-            if zone.auto_watering:
-                ddata[attr] = "on"
+            status = zone.snapshot
 
-        # check if zone current watering manually (zone1_select_manual_mode)
-        for zone in self._faucet.zones:
+            # check if zone is scheduled automatically (zone1_program_toggle)
+            # only add zoneX_program_toogle to ddata when needed,
+            # otherwise the field will be always on
+            if status.program_mode_on:
+                ddata[f"zone{zone.id}_program_toggle"] = "on"
+
+            # check if zone current watering manually (zone1_select_manual_mode)
             attr = f"zone{zone.id}_select_manual_mode"
-            if zone.watering_time and attr in ddata.keys():
-                ddata[attr] = zone.watering_time
+            if status.watering_time and attr in ddata.keys():
+                ddata[attr] = status.watering_time
 
-        # check if rain delay is selected (zone0_rain_delay_select)
-        for zone in self._faucet.zones:
+            # check if rain delay is selected (zone0_rain_delay_select)
             attr = "zone{}_rain_delay_select".format(zone.id - 1)
-            value: str | int = zone.rain_delay
+            value: str | int = status.rain_delay_mode
             if value and attr in ddata.keys():
                 if int(value) >= 2 and int(value) <= 7:
                     value = str(value) + "days"
@@ -430,31 +531,138 @@ class RainCloudyFaucetZone:  # (RainCloudyFaucetCore):
     async def submit_action(self, ddata: dict) -> None:
         """Post data."""
 
-        controller_index = self._parent.controllers.index(self._controller)
-        faucet_index = self._controller.faucets.index(self._faucet)
-
-        current_controller_index = find_selected_controller_or_faucet_index(
-            self._parent.html["home"], "controller"
-        )
-
-        current_faucet_index = find_selected_controller_or_faucet_index(
-            self._parent.html["home"], "faucet"
-        )
+        controller_index = self._controller.index
+        faucet_index = self._faucet.index
 
         # This is an artifact of how the web-page we're impersonating works.
         # The form submit will only apply actions to _selected_ controllers
-        # and faucets. So if the active controller and/or faucet on the page
-        # isn't the faucet we're trying to submit an action for we need to
-        # send the response twice. The first time we send it will switch us
-        # to the action
-        if (
-            current_controller_index != controller_index
-            or current_faucet_index != faucet_index
-        ):
+        # and faucets. So if the faucet selected in the server session
+        # isn't the faucet we're trying to submit an action for, or is
+        # unknown, we need to send the response twice. The first time we
+        # send it will switch us to the action
+        if await self._parent.selection() != (controller_index, faucet_index):
             await self._parent.post(ddata, url=HOME_ENDPOINT, referer=HOME_ENDPOINT)
 
         response = await self._parent.post(
             ddata, url=HOME_ENDPOINT, referer=HOME_ENDPOINT
         )
+        # pylint: disable=protected-access
+        self._faucet._acted_at = time.monotonic()
         if response:
             self._parent.update_home(await response.text())
+
+
+class RainCloudyFaucetBatch:
+    """Changes to several zones of a faucet submitted with a single form."""
+
+    def __init__(self, faucet: RainCloudyFaucetCore):
+        """
+        Initialize RainCloudyFaucetBatch object.
+
+        :param faucet: faucet owning the zones
+        :type faucet: RainCloudyFaucet object
+        :return: RainCloudyFaucetBatch object
+        :rtype: RainCloudyFaucetBatch object
+        """
+        self._faucet = faucet
+        self._changes: dict[int, dict[str, Any]] = {}
+        # values given to the setters, queued as they are
+        self._values: dict[tuple[int, str], Any] = {}
+        self.results: dict[int, dict[str, Any]] | None = None
+
+    def __repr__(self) -> str:
+        """Object representation."""
+        return f"<{self.__class__.__name__}: {len(self._changes)} zones>"
+
+    async def __aenter__(self) -> RainCloudyFaucetBatch:
+        """Collect changes."""
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        """Submit the changes unless an exception was raised."""
+        if exc_type is None:
+            await self.submit()
+
+    def _set(self, zone_id: int, field: str, value: Any, given: Any) -> None:
+        """Record a change to a zone."""
+        if zone_id not in range(1, 5):
+            raise ValueError("Valid zones are: 1, 2, 3, 4")
+        self._changes.setdefault(zone_id, {})[field] = value
+        self._values[(zone_id, field)] = given
+
+    def set_manual_watering(self, zone_id: int, value: int | str) -> None:
+        """Water a zone manually for value minutes, "on" or "off"."""
+        self._set(zone_id, "manual_watering", manual_watering_value(value), value)
+
+    def set_rain_delay(self, zone_id: int, value: int | str) -> None:
+        """Set the rain delay days of a zone, ignored if not valid."""
+        self._set(zone_id, "rain_delay", rain_delay_value(value), value)
+
+    def set_auto_watering(self, zone_id: int, value: bool) -> None:
+        """Enable or disable the program of a zone, ignored if not a bool."""
+        self._set(
+            zone_id,
+            "auto_watering",
+            value if isinstance(value, bool) else None,
+            value,
+        )
+
+    async def submit(self) -> dict[int, dict[str, Any]]:
+        """
+        Submit every change with one status refresh and one form.
+
+        The changes go through the command queue of the account, like the
+        zone setters, so they are never interleaved with queued settings;
+        a later setting of the same zone replaces the change. Zones turned
+        off are switched ON by a first form, like
+        RainCloudyFaucetZone.set_manual_watering_time does.
+
+        :return: applied value of every field by zone id, None for the
+            ignored ones
+        """
+        self.results = {
+            zone_id: dict(changes) for zone_id, changes in self._changes.items()
+        }
+        if not self._changes:
+            return self.results
+
+        zones = self._faucet.zones
+        values, self._values, self._changes = self._values, {}, {}
+        # pylint: disable=protected-access
+        commands = self._faucet._parent.commands
+        # queued at once, before any other setting can be
+        futures = [
+            commands.submit(zones[zone_id - 1], field, value)
+            for (zone_id, field), value in values.items()
+        ]
+        for future in futures:
+            try:
+                await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # replaced by a later setting of the zone
+        return self.results
+
+    async def _submit(self) -> None:
+        """Send every change, called by the command queue."""
+        if not self._changes:
+            return
+
+        zones = self._faucet.zones
+        changes, self._changes, self._values = self._changes, {}, {}
+        ddata = await zones[0].preupdate()
+        ddata, toggles = batch_form(ddata, changes)
+
+        if toggles:
+            # If zone is turned on at the valve we need to toggle ON first
+            await zones[0].submit_action({**ddata, **toggles})
+            await asyncio.sleep(self._faucet.turn_off_delay)
+        await zones[0].submit_action(ddata)
+
+        for zone_id, fields in changes.items():
+            # pylint: disable=protected-access
+            zones[zone_id - 1]._store_setting(**batch_settings(fields))
+
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,65 @@
+"""RainCloudy adaptive status polling."""
+from __future__ import annotations
+
+import asyncio
+
+from aiohttp.client import ClientError
+
+from ..exceptions import RainCloudyException
+from ..polling import PollingEngine
+
+
+class Poller(PollingEngine):
+    """
+    Poll the faucets of a RainCloudy object from a task.
+
+    Status requests go through the PollScheduler of the account, if any,
+    and are coalesced with concurrent updates of the same faucet.
+    """
+
+    async def poll_once(self) -> float:
+        """
+        Update the faucets due concurrently.
+
+        Every faucet due is updated even if another one fails; the first
+        error is raised once the next polls were scheduled.
+
+        :return: seconds until the next poll
+        """
+        faucets = self.due()
+        if faucets:
+            try:
+                results = await asyncio.gather(
+                    *[faucet.update() for faucet in faucets], return_exceptions=True
+                )
+            finally:
+                self.polled(faucets)
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+        return self.wait()
+
+    async def run(self) -> None:
+        """
+        Poll until cancelled.
+
+        Request and decoding errors are counted in errors and polling
+        goes on.
+        """
+        while True:
+            try:
+                delay = await self.poll_once()
+            except (
+                ClientError,
+                asyncio.TimeoutError,
+                RainCloudyException,
+                ValueError,
+            ) as err:
+                # the next polls were scheduled before the error was raised
+                self.errors += 1
+                self.last_error = err
+                delay = self.wait()
+            await asyncio.sleep(delay)
+
+
+# vim:sw=4:ts=4:et:
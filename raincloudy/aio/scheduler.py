@@ -0,0 +1,113 @@
+"""RainCloudy shared status polling scheduler."""
+from __future__ import annotations
+
+import asyncio
+import random
+import weakref
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator
+
+from yarl import URL
+
+from ..const import POLL_CONCURRENCY, POLL_HOST_CONCURRENCY, POLL_JITTER
+
+if TYPE_CHECKING:
+    from .core import RainCloudy
+
+
+class PollScheduler:
+    """
+    Limit the status requests of every RainCloudy object registered.
+
+    Accounts sharing a ClientSession register with one scheduler, which
+    bounds the requests in flight overall and per host and spreads every
+    poll cycle with a random delay before each request.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = POLL_CONCURRENCY,
+        per_host: int = POLL_HOST_CONCURRENCY,
+        jitter: float = POLL_JITTER,
+    ):
+        """
+        Initialize PollScheduler object.
+
+        :param max_concurrency: status requests in flight for all hosts
+        :param per_host: status requests in flight for a single host
+        :param jitter: maximum random delay in seconds before a request
+        :type max_concurrency: integer
+        :type per_host: integer
+        :type jitter: float
+        :return: PollScheduler object
+        :rtype: PollScheduler object
+        """
+        if max_concurrency < 1 or per_host < 1:
+            raise ValueError("Concurrency limits must be at least 1")
+
+        self.max_concurrency = max_concurrency
+        self.per_host = per_host
+        self.jitter = jitter
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # created by slot, binding them to the running event loop
+        self._global: asyncio.Semaphore | None = None
+        self._hosts: dict[str | None, asyncio.Semaphore] = {}
+        self._accounts: weakref.WeakSet[RainCloudy] = weakref.WeakSet()
+
+    def __repr__(self) -> str:
+        """Object representation."""
+        return (
+            f"<{self.__class__.__name__}: {len(self._accounts)} accounts, "
+            f"{self.in_flight}/{self.max_concurrency} in flight>"
+        )
+
+    @property
+    def accounts(self) -> list[RainCloudy]:
+        """Return the registered RainCloudy objects."""
+        return list(self._accounts)
+
+    def register(self, account: RainCloudy) -> None:
+        """Poll account with the other registered accounts."""
+        self._accounts.add(account)
+
+    def unregister(self, account: RainCloudy) -> None:
+        """Stop polling account."""
+        self._accounts.discard(account)
+
+    @asynccontextmanager
+    async def slot(self, url: str) -> AsyncIterator[None]:
+        """Wait until a request to url is allowed, after a random delay."""
+        if self.jitter > 0:
+            await asyncio.sleep(random.uniform(0, self.jitter))
+
+        if self._global is None:
+            self._global = asyncio.Semaphore(self.max_concurrency)
+        host = URL(url).host
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host)
+
+        async with self._global, self._hosts[host]:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                yield
+            finally:
+                self.in_flight -= 1
+
+    async def poll(self) -> None:
+        """
+        Update every registered account.
+
+        Every account is updated even if another one fails; the first
+        error is raised afterwards.
+        """
+        results = await asyncio.gather(
+            *[account.update() for account in self.accounts], return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,282 @@
+"""RainCloudy status change subscriptions."""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Hashable, Iterable
+
+from aiohttp.client import ClientError
+
+from ..const import WATCH_OVERFLOW, WATCH_QUEUE_SIZE
+from ..exceptions import RainCloudyException
+from ..polling import PollPolicy, RequestBudget
+from ..status import StatusChange
+from .polling import Poller
+
+if TYPE_CHECKING:
+    from .core import RainCloudy
+    from .faucet import RainCloudyFaucetCore
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class StatusEvent:
+    """
+    Change of a field of a controller, faucet or zone.
+
+    :param controller: controller serial
+    :param faucet: faucet serial
+    :param zone: zone id, None for a field of the faucet or its controller
+    :param field: field of FAUCET_FIELDS or ZONE_FIELDS
+    :param old: previous value
+    :param new: current value
+    """
+
+    __slots__ = ("controller", "faucet", "zone", "field", "old", "new")
+
+    controller: str
+    faucet: str
+    zone: int | None
+    field: str
+    old: Any
+    new: Any
+
+    @property
+    def key(self) -> tuple[str, int | None, str]:
+        """Return the faucet, zone and field changed."""
+        return (self.faucet, self.zone, self.field)
+
+    def __str__(self) -> str:
+        """Return the event like "F00 zone 2 is_watering False -> True"."""
+        change = StatusChange(self.zone, self.field, self.old, self.new)
+        return f"{self.faucet} {change}"
+
+
+class Subscription:
+    """
+    Bounded queue of the events of a subscriber.
+
+    Once maxsize events wait, the oldest one is dropped for a new one.
+    With the coalesce policy, a new change of a field still waiting
+    replaces it in place, keeping its old value, and is dropped if the
+    field changed back.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = WATCH_QUEUE_SIZE,
+        overflow: str = "coalesce",
+        controller: str | None = None,
+        faucet: str | None = None,
+        zone: int | None = None,
+        fields: Iterable[str] | None = None,
+    ):
+        """
+        Initialize Subscription object.
+
+        :param maxsize: events waiting before the oldest is dropped
+        :param overflow: "drop" or "coalesce"
+        :param controller: only events of this controller serial
+        :param faucet: only events of this faucet serial
+        :param zone: only events of this zone id
+        :param fields: only events of these fields
+        :type maxsize: integer
+        :type overflow: string
+        :type controller: string
+        :type faucet: string
+        :type zone: integer
+        :type fields: list of strings
+        :return: Subscription object
+        :rtype: Subscription object
+        """
+        if maxsize < 1:
+            raise ValueError("A subscription holds at least 1 event")
+        if overflow not in WATCH_OVERFLOW:
+            raise ValueError(
+                "Valid overflow policies are: {}".format(", ".join(WATCH_OVERFLOW))
+            )
+
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.controller = controller
+        self.faucet = faucet
+        self.zone = zone
+        self.fields = None if fields is None else frozenset(fields)
+        self.dropped = 0
+        self.coalesced = 0
+        self._events: OrderedDict[Hashable, StatusEvent] = OrderedDict()
+        self._counter = itertools.count()
+        self._ready = asyncio.Event()
+
+    def __repr__(self) -> str:
+        """Object representation."""
+        return (
+            f"<{self.__class__.__name__}: {len(self)}/{self.maxsize} "
+            f"{self.overflow}, {self.dropped} dropped>"
+        )
+
+    def __len__(self) -> int:
+        """Return the events waiting."""
+        return len(self._events)
+
+    def matches(self, event: StatusEvent) -> bool:
+        """Return whether the subscriber wants event."""
+        return (
+            (self.controller is None or event.controller == self.controller)
+            and (self.faucet is None or event.faucet == self.faucet)
+            and (self.zone is None or event.zone == self.zone)
+            and (self.fields is None or event.field in self.fields)
+        )
+
+    def put(self, event: StatusEvent) -> None:
+        """Queue event without waiting, dropping or coalescing on overflow."""
+        if self.overflow == "coalesce":
+            key: Hashable = event.key
+            waiting = self._events.get(key)
+            if waiting is not None:
+                self.coalesced += 1
+                if waiting.old == event.new:
+                    del self._events[key]
+                else:
+                    self._events[key] = StatusEvent(
+                        event.controller,
+                        event.faucet,
+                        event.zone,
+                        event.field,
+                        waiting.old,
+                        event.new,
+                    )
+                return
+        else:
+            key = next(self._counter)
+
+        if len(self._events) >= self.maxsize:
+            self._events.popitem(last=False)
+            self.dropped += 1
+        self._events[key] = event
+        self._ready.set()
+
+    async def get(self) -> StatusEvent:
+        """Return the oldest event, waiting for one."""
+        while not self._events:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._events.popitem(last=False)[1]
+
+
+class WatchHub:
+    """
+    Poll an account once for every subscriber of RainCloudy.watch.
+
+    A Poller task runs while there is at least one subscription. The
+    changes of every new status are queued to the subscriptions matching
+    them; a slow subscriber only fills its own queue.
+    """
+
+    def __init__(
+        self,
+        parent: RainCloudy,
+        policy: PollPolicy | None = None,
+        budget: RequestBudget | None = None,
+    ):
+        """
+        Initialize WatchHub object.
+
+        :param parent: RainCloudy object
+        :param policy: PollPolicy object, default intervals when None
+        :param budget: RequestBudget object of the account, unlimited when
+            None
+        :type parent: RainCloudy object
+        :type policy: PollPolicy object
+        :type budget: RequestBudget object
+        :return: WatchHub object
+        :rtype: WatchHub object
+        """
+        self._parent = parent
+        self.poller = Poller(parent, policy, budget)
+        self.errors = 0
+        self.last_error: Exception | None = None
+        self._subscriptions: list[Subscription] = []
+        self._task: asyncio.Task | None = None
+        self._remove_listener: Any = None
+
+    def __repr__(self) -> str:
+        """Object representation."""
+        return f"<{self.__class__.__name__}: {len(self._subscriptions)} subscribers>"
+
+    @property
+    def subscriptions(self) -> list[Subscription]:
+        """Return the active subscriptions."""
+        return list(self._subscriptions)
+
+    def subscribe(self, subscription: Subscription) -> None:
+        """Queue the changes matching subscription, polling if needed."""
+        self._subscriptions.append(subscription)
+        if self._task is None:
+            self._remove_listener = self._parent.add_listener(self._dispatch)
+            self._task = asyncio.ensure_future(self._run())
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Stop queueing to subscription, polling once nobody is left."""
+        if subscription in self._subscriptions:
+            self._subscriptions.remove(subscription)
+        if not self._subscriptions and self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self._remove_listener()
+
+    def _dispatch(
+        self, faucet: RainCloudyFaucetCore, changes: list[StatusChange]
+    ) -> None:
+        """Queue the changes of a faucet to the matching subscriptions."""
+        # pylint: disable=protected-access
+        controller = faucet._controller.serial
+        events = [
+            StatusEvent(
+                controller,
+                faucet.serial,
+                change.zone,
+                change.field,
+                change.old,
+                change.new,
+            )
+            for change in changes
+        ]
+        for subscription in self._subscriptions:
+            for event in events:
+                if subscription.matches(event):
+                    subscription.put(event)
+
+    async def _run(self) -> None:
+        """
+        Poll until cancelled, going on after any error.
+
+        The task only ends with the last subscription, so subscribers
+        never wait on a poll that stopped.
+        """
+        while True:
+            try:
+                delay = await self.poller.poll_once()
+            except Exception as err:  # pylint: disable=broad-except
+                self.errors += 1
+                self.last_error = err
+                if not isinstance(
+                    err,
+                    (
+                        ClientError,
+                        asyncio.TimeoutError,
+                        RainCloudyException,
+                        ValueError,
+                    ),
+                ):
+                    _LOGGER.exception("Unexpected error polling watched faucets")
+                # the schedule may not have been updated, do not spin
+                delay = max(self.poller.wait(), self.poller.policy.action_interval)
+            await asyncio.sleep(delay)
+
+
+# vim:sw=4:ts=4:et:
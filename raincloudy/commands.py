@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""RainCloudy action command queue."""
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, wait
+from itertools import groupby
+
+from raincloudy.exceptions import RainCloudyException
+from raincloudy.helpers import command_value, order_by_selection
+
+# zone methods sending a single setting
+SETTERS = {
+    "manual_watering": "_set_manual_watering_time",
+    "rain_delay": "_set_rain_delay",
+    "auto_watering": "_set_auto_watering",
+}
+
+
+class Command:
+    """Zone setting waiting to be sent."""
+
+    __slots__ = ("zone", "field", "value", "future", "sent", "queued_at")
+
+    def __init__(self, zone, field, value, future, sent=None):
+        """
+        Initialize Command object.
+
+        :param zone: zone to change
+        :param field: "manual_watering", "rain_delay" or "auto_watering"
+        :param value: value given to the zone setter
+        :param future: future completed once every form of the setting
+            was sent, including a deferred turn-off form
+        :param sent: future completed once the setting was posted, before
+            any deferred form. None when nobody waits for it, as with the
+            aio queue
+        :type zone: RainCloudyFaucetZone object
+        :type field: string
+        :type future: concurrent.futures.Future or asyncio.Future object
+        :type sent: concurrent.futures.Future object
+        :return: Command object
+        :rtype: Command object
+        """
+        self.zone = zone
+        self.field = field
+        self.value = value
+        self.future = future
+        self.sent = sent
+        self.queued_at = time.monotonic()
+
+    def cancel(self):
+        """Cancel the setting, replaced before being sent."""
+        self.future.cancel()
+        self.sent.cancel()
+
+    def fail(self, err):
+        """Complete the futures of a setting which could not be sent."""
+        _settle(self.sent.set_exception, err)
+        _settle(self.future.set_exception, err)
+
+    def __repr__(self):
+        """Object representation."""
+        return "<{0}: {1} {2}={3!r}>".format(
+            self.__class__.__name__, self.zone, self.field, self.value
+        )
+
+    @property
+    def target(self):
+        """Return the (controller, faucet) indexes the command acts on."""
+        # pylint: disable=protected-access
+        return (self.zone._controller.index, self.zone._faucet.index)
+
+
+class CommandQueue:
+    """
+    Send the zone settings of a RainCloudy object one after another.
+
+    Settings are queued and sent by a worker thread, so actions never
+    interleave their forms with the selection of the session. A setting
+    queued again for the same zone before being sent replaces the former
+    one, whose future is cancelled. Settings queued together are sent
+    grouped by faucet, starting with the selected one, and a faucet with
+    several settings receives them in a single batch form.
+    """
+
+    def __init__(self, parent):
+        """
+        Initialize CommandQueue object.
+
+        :param parent: RainCloudy object
+        :type parent: RainCloudy object
+        :return: CommandQueue object
+        :rtype: CommandQueue object
+        """
+        self._parent = parent
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._worker = None
+        self._busy = False
+
+    def __repr__(self):
+        """Object representation."""
+        return "<{0}: {1} queued>".format(self.__class__.__name__, self.depth)
+
+    @property
+    def depth(self):
+        """Return the number of settings waiting to be sent."""
+        return len(self._pending)
+
+    @property
+    def on_worker(self):
+        """Return whether the caller runs on the worker sending settings."""
+        return threading.current_thread() is self._worker
+
+    def submit(self, zone, field, value):
+        """
+        Queue a zone setting.
+
+        :param zone: zone to change
+        :param field: "manual_watering", "rain_delay" or "auto_watering"
+        :param value: value given to the zone setter
+        :type zone: RainCloudyFaucetZone object
+        :type field: string
+        :return: future of the form value sent, None for ignored settings.
+            Completed once every form of the setting was sent
+        :rtype: concurrent.futures.Future
+        :raises ValueError: if the setting is not valid
+        """
+        return self.queue(zone, field, value).future
+
+    def queue(self, zone, field, value):
+        """
+        Queue a zone setting and return its Command.
+
+        :param zone: zone to change
+        :param field: "manual_watering", "rain_delay" or "auto_watering"
+        :param value: value given to the zone setter
+        :type zone: RainCloudyFaucetZone object
+        :type field: string
+        :return: Command object, already completed for ignored settings
+        :rtype: Command object
+        :raises ValueError: if the setting is not valid
+        """
+        return self.queue_all([(zone, field, value)])[0]
+
+    def queue_all(self, settings):
+        """
+        Queue several zone settings at once, so they are sent together.
+
+        :param settings: (zone, field, value) of every setting
+        :type settings: list of tuples
+        :return: Command objects in the order of settings, already
+            completed for ignored settings
+        :rtype: list of Command objects
+        :raises ValueError: if a setting is not valid, none being queued
+        """
+        commands = []
+        queued = []
+        for zone, field, value in settings:
+            command = Command(zone, field, value, Future(), Future())
+            if command_value(field, value) is None:
+                command.sent.set_result(None)
+                command.future.set_result(None)
+            else:
+                queued.append(command)
+            commands.append(command)
+        if not queued:
+            return commands
+
+        metrics = self._parent.metrics
+        with self._condition:
+            for command in queued:
+                key = (command.zone, command.field)
+                superseded = self._pending.pop(key, None)
+                if superseded is not None:
+                    superseded.cancel()
+                    metrics["commands_merged"] += 1
+                self._pending[key] = command
+                metrics["commands_queued"] += 1
+            metrics["command_queue_max_depth"] = max(
+                metrics["command_queue_max_depth"], len(self._pending)
+            )
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="raincloudy-commands", daemon=True
+                )
+                self._worker.start()
+            self._condition.notify_all()
+        return commands
+
+    def join(self, timeout=None):
+        """
+        Wait until every queued setting was sent.
+
+        Turn-off forms sent later by a timer are not waited for.
+
+        :param timeout: seconds to wait, forever when None
+        :type timeout: float
+        :raises RainCloudyException: if the queue is still busy after
+            timeout seconds
+        """
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: not self._pending and not self._busy, timeout
+            ):
+                raise RainCloudyException("Command queue is still busy")
+
+    def _run(self):
+        """Send queued settings until the queue is empty."""
+        while True:
+            with self._condition:
+                if not self._pending:
+                    self._worker = None
+                    self._busy = False
+                    self._condition.notify_all()
+                    return
+                commands = []
+                for command in self._pending.values():
+                    if command.future.cancelled():
+                        command.sent.cancel()
+                    else:
+                        commands.append(command)
+                self._pending = {}
+                self._busy = True
+
+            try:
+                commands = order_by_selection(
+                    commands, lambda command: command.target, self._parent.selection
+                )
+            except Exception as err:  # pylint: disable=broad-except
+                for command in commands:
+                    command.fail(err)
+                continue
+
+            for _, group in groupby(commands, lambda command: command.target):
+                self._send(list(group))
+
+    def _send(self, commands):
+        """Send the settings of one faucet and complete their futures."""
+        try:
+            if len(commands) == 1:
+                command = commands[0]
+                zone = command.zone
+                result = getattr(zone, SETTERS[command.field])(zone.id, command.value)
+                deferred = result if isinstance(result, Future) else None
+            else:
+                # pylint: disable=protected-access
+                batch = commands[0].zone._faucet.batch()
+                for command in commands:
+                    setter = getattr(batch, "set_" + command.field)
+                    setter(command.zone.id, command.value)
+                batch._submit()
+                deferred = batch.future
+        except Exception as err:  # pylint: disable=broad-except
+            for command in commands:
+                command.fail(err)
+            return
+
+        for command in commands:
+            _settle(
+                command.sent.set_result, command_value(command.field, command.value)
+            )
+        if deferred is None:
+            for command in commands:
+                self._complete(command)
+            return
+
+        def done(future):
+            for command in commands:
+                if future.cancelled():
+                    command.future.cancel()
+                elif future.exception() is not None:
+                    _settle(command.future.set_exception, future.exception())
+                else:
+                    self._complete(command)
+
+        deferred.add_done_callback(done)
+        if len(commands) > 1:
+            # the final form of a batch is built before being deferred,
+            # wait for it so later settings are not reverted
+            wait([deferred])
+
+    def _complete(self, command):
+        """Complete the future of a sent setting."""
+        latency = time.monotonic() - command.queued_at
+        metrics = self._parent.metrics
+        metrics["command_latency"] = latency
+        metrics["command_latency_max"] = max(metrics["command_latency_max"], latency)
+        _settle(command.future.set_result, command_value(command.field, command.value))
+
+
+def gather(futures):
+    """
+    Return a future completed once every one of futures is done.
+
+    :param futures: futures to wait for
+    :type futures: list of concurrent.futures.Future
+    :return: future of their results, None for the cancelled ones, or
+        of the first error raised
+    :rtype: concurrent.futures.Future
+    """
+    gathered = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        results = []
+        for future in futures:
+            if future.cancelled():
+                results.append(None)
+            elif future.exception() is not None:
+                gathered.set_exception(future.exception())
+                return
+            else:
+                results.append(future.result())
+        gathered.set_result(results)
+
+    if not futures:
+        gathered.set_result([])
+    for future in futures:
+        future.add_done_callback(done)
+    return gathered
+
+
+def _settle(method, value):
+    """Complete a future, unless its caller cancelled it meanwhile."""
+    try:
+        method(value)
+    except InvalidStateError:
+        pass
+
+
+# vim:sw=4:ts=4:et:
@@ -12,7 +12,53 @@ PROGRAM_ENDPOINT = API_URL + "/program/"
 MANAGE_ENDPOINT = API_URL + "/manage/"
 LOGOUT_ENDPOINT = API_URL + "/logout"
 
+# cookies holding an authenticated Django session
+SESSION_COOKIES = ("sessionid", "csrftoken")
+
+# login attempts after the site rejected the session and the delay in
+# seconds before the first retry, doubled after every failure
+RELOGIN_ATTEMPTS = 3
+RELOGIN_BACKOFF = 1.0
+
+# status requests in flight for all accounts registered with an aio
+# PollScheduler, for a single host, and the maximum random delay in seconds
+# before each of them
+POLL_CONCURRENCY = 8
+POLL_HOST_CONCURRENCY = 4
+POLL_JITTER = 0.0
+
+# seconds between the status polls of a faucet by a polling engine while
+# watering, after an action during POLL_ACTION_WINDOW seconds, when idle and
+# when offline; and the period in seconds of a request budget
+POLL_WATERING_INTERVAL = 30.0
+POLL_ACTION_INTERVAL = 5.0
+POLL_ACTION_WINDOW = 60.0
+POLL_IDLE_INTERVAL = 600.0
+POLL_OFFLINE_INTERVAL = 1800.0
+POLL_BUDGET_PERIOD = 3600.0
+
+# events waiting in a subscription of RainCloudy.watch before the oldest is
+# dropped, and what happens to a new change of a field already waiting
+WATCH_QUEUE_SIZE = 100
+WATCH_OVERFLOW = ("drop", "coalesce")
+
+# HTML parser backends understood by helpers.generate_soup_html
+HTML_PARSER = "html5lib"
+HTML_PARSERS = ("html5lib", "lxml", "html.parser", "selectolax")
+
+# JSON decoders understood by status.decode_status, the fastest installed
+# one is used when none is given
+JSON_DECODERS = ("json", "orjson", "msgspec")
+
+# zones of every faucet in the status endpoint
+STATUS_ZONES = 4
+
+# number of parsed pages kept by helpers.PARSE_CACHE
+PARSE_CACHE_SIZE = 32
+
 MAX_RAIN_DELAY_DAYS = 7
+# seconds between the ON and the OFF forms turning a zone off
+TURN_OFF_DELAY = 1.0
 MAX_WATERING_MINUTES = 60
 MANUAL_WATERING_ALLOWED = ["on", "ON", "off", "OFF", 0, 5, 10, 15, 30, 45, 60]
 
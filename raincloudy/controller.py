@@ -23,7 +23,7 @@ class RainCloudyController:
         :return: RainCloudyController object
         :rtype: RainCloudyController object
         """
-        self.attributes = {}
+        self.snapshot = None
         self._parent = parent
         self.home = parent.html["home"]
         self._controller_id = controller_id
@@ -69,8 +69,7 @@ class RainCloudyController:
         Call 1 method to update zone attributes
         """
         # update zone attributes
-        for faucet in self._faucets:
-            faucet.update()
+        self._parent.update_faucets(self._faucets)
 
     @property
     def serial(self):
@@ -100,15 +99,22 @@ class RainCloudyController:
         }
         self._parent.post(data, url=SETUP_ENDPOINT, referer=SETUP_ENDPOINT)
 
+    @property
+    def attributes(self):
+        """Return the last status in the shape of the status endpoint."""
+        if self.snapshot is None:
+            return {}
+        return self.snapshot.to_dict()
+
     @property
     def status(self):
         """Return controller status."""
-        return self.attributes["controller_status"]
+        return self.snapshot.controller_status
 
     @property
     def current_time(self):
         """Return controller current time."""
-        return self.attributes["current_time"]
+        return self.snapshot.current_time
 
     @property
     def faucets(self):
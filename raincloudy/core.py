@@ -1,26 +1,48 @@
 # -*- coding: utf-8 -*-
 """RainCloudy core object."""
+import logging
 import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from pathlib import Path
 
 import requests
 import urllib3
+from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
 
+from raincloudy.commands import CommandQueue
 from raincloudy.const import (
     HEADERS,
     HOME_ENDPOINT,
+    HTML_PARSER,
     INITIAL_DATA,
     LOGIN_ENDPOINT,
     LOGOUT_ENDPOINT,
+    RELOGIN_ATTEMPTS,
+    RELOGIN_BACKOFF,
+    SESSION_COOKIES,
     SETUP_ENDPOINT,
+    TURN_OFF_DELAY,
 )
 from raincloudy.controller import RainCloudyController
+from raincloudy.exceptions import RainCloudyException
 from raincloudy.helpers import (
+    PARSE_CACHE,
+    LazyPage,
     controller_serial_finder,
     faucet_serial_finder,
+    find_selected_controller_or_faucet_index,
     find_zone_names,
-    generate_soup_html,
+    parse_page,
+    selection_after_form,
+    session_is_valid,
+    stream_page_model,
+    topology_matches_page,
 )
+from raincloudy.status import diff_status
+
+_LOGGER = logging.getLogger(__name__)
 
 
 class RainCloudy:
@@ -34,6 +56,19 @@ class RainCloudy:
         https_proxy=None,
         ssl_warnings=True,
         ssl_verify=True,
+        html_parser=HTML_PARSER,
+        forms_only=False,
+        stream_home=False,
+        parse_cache=PARSE_CACHE,
+        discovery_workers=1,
+        topology_store=None,
+        session_store=None,
+        relogin_attempts=RELOGIN_ATTEMPTS,
+        relogin_backoff=RELOGIN_BACKOFF,
+        update_workers=1,
+        status_max_age=None,
+        turn_off_delay=TURN_OFF_DELAY,
+        json_decoder=None,
     ):
         """
         Initialize RainCloud object.
@@ -44,15 +79,90 @@ class RainCloudy:
         :param https_proxy: HTTPs proxy information (127.0.0.1:8080)
         :param ssl_warnings: Show SSL warnings
         :param ssl_verify: Verify SSL server certificate
+        :param html_parser: HTML parser backend (html5lib, lxml, html.parser
+            or selectolax)
+        :param forms_only: Only parse the select elements of each page
+        :param stream_home: Scan action responses for the selected
+            controller and faucet without building a document
+        :param parse_cache: ParseCache shared by repeated pages, None
+            disables caching
+        :param discovery_workers: Threads used to fetch the setup pages of
+            every controller and faucet during login, each with its own
+            session. Pages are fetched one after another when 1
+        :param topology_store: store keeping the controllers, faucets and
+            zones of the account between runs, see raincloudy.store. When
+            a saved topology matches the home page the setup pages are
+            not crawled
+        :param session_store: store keeping the session cookies between
+            runs, see raincloudy.store. A saved session that is still
+            accepted by the site skips the login requests
+        :param relogin_attempts: login attempts when the site rejects the
+            session
+        :param relogin_backoff: seconds to wait before the second attempt,
+            doubled after every failure
+        :param update_workers: threads fetching the status of the faucets
+            concurrently. The connection pool of the session is sized to
+            match. Faucets are updated one after another when 1
+        :param status_max_age: seconds a faucet status is trusted before
+            actions and reads fetch it again. None fetches it before every
+            action
+        :param turn_off_delay: seconds between the ON and the OFF forms
+            turning a zone off, waited on a timer thread
+        :param json_decoder: decoder of the status responses (json, orjson
+            or msgspec), the fastest installed when None
         :type username: string
         :type password: string
         :type http_proxy: string
         :type https_proxy: string
         :type ssl_warnings: boolean
         :type ssl_verify: boolean
+        :type html_parser: string
+        :type forms_only: boolean
+        :type stream_home: boolean
+        :type parse_cache: ParseCache object
+        :type discovery_workers: integer
+        :type topology_store: JSONFileStore object
+        :type session_store: JSONFileStore object
+        :type relogin_attempts: integer
+        :type relogin_backoff: float
+        :type update_workers: integer
+        :type status_max_age: float
+        :type turn_off_delay: float
+        :type json_decoder: string
         :rtype: RainCloudy object
         """
         self._ssl_verify = ssl_verify
+        self._html_parser = html_parser
+        self._forms_only = forms_only
+        self._stream_home = stream_home
+        self._parse_cache = parse_cache
+        self._discovery_workers = discovery_workers
+        self._topology_store = topology_store
+        self._session_store = session_store
+        self._relogin_attempts = relogin_attempts
+        self._relogin_backoff = relogin_backoff
+        self._update_workers = update_workers
+        self.status_max_age = status_max_age
+        self.turn_off_delay = turn_off_delay
+        self.json_decoder = json_decoder
+        # serializes the selection switch and the form of every action
+        self.action_lock = threading.RLock()
+        self._login_lock = threading.Lock()
+        self.session_generation = 0
+        self.metrics = {
+            "relogins": 0,
+            "relogins_shared": 0,
+            "relogin_failures": 0,
+            "commands_queued": 0,
+            "commands_merged": 0,
+            "command_queue_max_depth": 0,
+            "command_latency": 0.0,
+            "command_latency_max": 0.0,
+        }
+        self.commands = CommandQueue(self)
+        # deferred calls by future, until they are done
+        self._deferred = {}
+        self._deferring = threading.local()
         if not ssl_warnings:
             urllib3.disable_warnings()
 
@@ -62,8 +172,13 @@ class RainCloudy:
 
         # initialize future attributes
         self._controllers = []
+        self._controllers_by_serial = {}
+        self._faucets_by_serial = {}
+        self._listeners = []
         self.client = None
         self.is_connected = False
+        self._selection = None
+        self._selection_from_home = False
         self.html = {
             "home": None,
             "setup": None,
@@ -99,45 +214,312 @@ class RainCloudy:
 
         # cert_file = Path(__location__ + "/wifiaquatimer_com_chain.cer")
 
+        home = self._restore_session()
+        if home is None:
+            self.client = self._new_session()
+            self.session_generation += 1
+            self._save_session()
+            home = self.client.get(url=HOME_ENDPOINT)
+
+        self.html["home"] = LazyPage(home.text, self._parse_home)
+        self._selection = None
+        self._selection_from_home = True
+
+        topology = self._load_topology()
+        if topology is not None:
+            try:
+                self._create_controllers(topology)
+            except requests.HTTPError:
+                # the status of a saved faucet could not be read
+                topology = None
+
+        if topology is None:
+            setup = self.client.get(SETUP_ENDPOINT, headers=HEADERS)
+            # populate device list
+            self.html["setup"] = self._parse_page(setup.text)
+
+            topology = self._discover()
+            self._create_controllers(topology)
+            self._save_topology(topology)
+
+        self.is_connected = True
+        return True
+
+    def export_session(self):
+        """
+        Return the session cookies of the logged in client.
+
+        :return: dict with the sessionid and csrftoken cookies and the
+            expiry timestamp of the session, None when not logged in
+        :rtype: dict
+        """
+        if self.client is None:
+            return None
+
+        state = {"expires": None}
+        for cookie in self.client.cookies:
+            if cookie.name in SESSION_COOKIES:
+                state[cookie.name] = cookie.value
+                if cookie.name == "sessionid":
+                    state["expires"] = cookie.expires
+
+        if state.get("sessionid") is None:
+            return None
+        return state
+
+    def import_session(self, state):
+        """
+        Replace the client by a session using saved cookies.
+
+        :param state: dict returned by export_session
+        :type state: dict
+        """
+        self.client = self._create_client()
+        self.session_generation += 1
+        for name in SESSION_COOKIES:
+            if state.get(name) is not None:
+                self.client.cookies.set(name, state[name])
+
+    @property
+    def _session_key(self):
+        """Return the session_store key of the account."""
+        return "session:{}".format(self._username)
+
+    def _restore_session(self):
+        """Return the home page when a saved session is still valid."""
+        if self._session_store is None:
+            return None
+
+        state = self._session_store.load(self._session_key)
+        if not session_is_valid(state):
+            return None
+
+        self.import_session(state)
+        # an expired session is redirected to the login page
+        home = self.client.get(url=HOME_ENDPOINT, allow_redirects=False)
+        if home.status_code != 200:
+            self._session_store.delete(self._session_key)
+            return None
+        return home
+
+    def _save_session(self):
+        """Save the session cookies to session_store."""
+        state = self.export_session()
+        if self._session_store is not None and state is not None:
+            self._session_store.save(self._session_key, state)
+
+    def _create_controllers(self, topology):
+        """Create a RainCloudyController for every controller of topology."""
+        self._controllers = []
+        for index, (controller_serial, faucets) in enumerate(topology):
+            self._controllers.append(
+                RainCloudyController(self, controller_serial, index, faucets)
+            )
+        self._index_controllers()
+
+    def _index_controllers(self):
+        """Index the controllers and faucets by serial."""
+        self._controllers_by_serial = {
+            controller.serial: controller for controller in self._controllers
+        }
+        self._faucets_by_serial = {
+            faucet.serial: faucet
+            for controller in self._controllers
+            for faucet in controller.faucets
+        }
+
+    def add_listener(self, listener):
+        """
+        Call listener with the changes of every new faucet status.
+
+        Listeners are called with the faucet and a list of
+        raincloudy.status.StatusChange, from the thread storing the
+        status: a refresh, or a setting sent. They are not called when
+        nothing changed, nor for the first status of a faucet. Errors
+        raised by a listener are logged.
+
+        :param listener: function called with (faucet, changes)
+        :return: function removing the listener
+        """
+        self._listeners.append(listener)
+
+        def remove():
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return remove
+
+    def notify_changes(self, faucet, old, new):
+        """Call the listeners with the changes between two snapshots."""
+        if not self._listeners or old is None:
+            return
+        changes = diff_status(old, new)
+        if not changes:
+            return
+        for listener in list(self._listeners):
+            try:
+                listener(faucet, changes)
+            except Exception:  # pylint: disable=broad-except
+                # a failing listener must not abort the update storing
+                # the status, nor the other listeners
+                _LOGGER.exception("Error in status listener %r", listener)
+
+    def get_controller(self, serial):
+        """
+        Return a controller by serial without scanning the controllers.
+
+        :param serial: controller serial
+        :type serial: string
+        :return: RainCloudyController object, None if unknown
+        :rtype: RainCloudyController object
+        """
+        return self._controllers_by_serial.get(serial)
+
+    def get_faucet(self, serial):
+        """
+        Return a faucet of any controller by serial.
+
+        :param serial: faucet serial
+        :type serial: string
+        :return: RainCloudyFaucet object, None if unknown
+        :rtype: RainCloudyFaucet object
+        """
+        return self._faucets_by_serial.get(serial)
+
+    def get_zone(self, faucet_serial, zone_id):
+        """
+        Return a zone by faucet serial and zone id.
+
+        :param faucet_serial: faucet serial
+        :param zone_id: zone id, from 1 to 4
+        :type faucet_serial: string
+        :type zone_id: integer
+        :return: RainCloudyFaucetZone object, None if unknown
+        :rtype: RainCloudyFaucetZone object
+        """
+        faucet = self.get_faucet(faucet_serial)
+        if faucet is None:
+            return None
+        # pylint: disable=protected-access
+        return faucet._find_zone_by_id(zone_id)
+
+    @property
+    def _topology_key(self):
+        """Return the topology_store key of the account."""
+        return "topology:{}".format(self._username)
+
+    def _load_topology(self):
+        """Return the saved topology if it matches the home page."""
+        if self._topology_store is None:
+            return None
+
+        topology = self._topology_store.load(self._topology_key)
+        if topology is None:
+            return None
+        if not topology_matches_page(topology, self.html["home"]):
+            self.invalidate_topology()
+            return None
+        return topology
+
+    def _save_topology(self, topology):
+        """Save the discovered topology to topology_store."""
+        if self._topology_store is not None:
+            self._topology_store.save(self._topology_key, topology)
+
+    def invalidate_topology(self):
+        """Forget the saved topology so the next login crawls the setup pages."""
+        if self._topology_store is not None:
+            self._topology_store.delete(self._topology_key)
+
+    def reauthenticate(self, generation=None):
+        """
+        Log in again after the site rejected the session.
+
+        Concurrent callers share a single login: a caller passing the
+        session_generation it used returns as soon as another caller
+        replaced that session.
+
+        :param generation: session_generation of the rejected session
+        :type generation: integer
+        :raises requests.RequestException: if every attempt failed
+        """
+        with self._login_lock:
+            if generation is not None and generation != self.session_generation:
+                self.metrics["relogins_shared"] += 1
+                return
+
+            for attempt in range(self._relogin_attempts):
+                if attempt:
+                    time.sleep(self._relogin_backoff * 2 ** (attempt - 1))
+                try:
+                    client = self._new_session()
+                except requests.RequestException:
+                    self.metrics["relogin_failures"] += 1
+                    if attempt == self._relogin_attempts - 1:
+                        raise
+                    continue
+
+                self.client = client
+                self.session_generation += 1
+                self._selection = None
+                self._selection_from_home = False
+                self.metrics["relogins"] += 1
+                self._save_session()
+                return
+
+    def _create_client(self):
+        """Return a new requests.Session with the proxy settings."""
+        client = requests.Session()
+        client.proxies = self._proxies
+        if self._update_workers > DEFAULT_POOLSIZE:
+            # keep a connection for every update worker
+            adapter = HTTPAdapter(pool_maxsize=self._update_workers)
+            client.mount("https://", adapter)
+            client.mount("http://", adapter)
+        # client.verify = cert_file.resolve()
+        client.stream = True
+        return client
+
+    def _new_session(self):
+        """Return a new requests.Session logged in to the account."""
         # to obtain csrftoken, remove Referer from headers
         headers = HEADERS.copy()
         headers.pop("Referer")
 
         # initial GET request
-        self.client = requests.Session()
-        self.client.proxies = self._proxies
-        # self.client.verify = cert_file.resolve()
-        self.client.stream = True
-        self.client.get(LOGIN_ENDPOINT, headers=headers)
+        client = self._create_client()
+        client.get(LOGIN_ENDPOINT, headers=headers)
 
         # set headers to submit POST request
         token = INITIAL_DATA.copy()
-        token["csrfmiddlewaretoken"] = self.csrftoken
+        token["csrfmiddlewaretoken"] = client.cookies.get("csrftoken")
         token["email"] = self._username
         token["password"] = self._password
 
-        req = self.client.post(LOGIN_ENDPOINT, data=token, headers=HEADERS)
+        req = client.post(
+            LOGIN_ENDPOINT, data=token, headers=HEADERS, allow_redirects=False
+        )
 
         if req.status_code != 302:
             req.raise_for_status()
 
-        home = self.client.get(url=HOME_ENDPOINT)
-
-        self.html["home"] = generate_soup_html(home.text)
-
-        setup = self.client.get(SETUP_ENDPOINT, headers=HEADERS)
-        # populate device list
-        self.html["setup"] = generate_soup_html(setup.text)
+        return client
 
+    def _discover(self):
+        """Return the serial and faucets of every controller."""
         controller_serials = controller_serial_finder(self.html["setup"])
 
+        if self._discovery_workers > 1:
+            return self._discover_concurrently(controller_serials)
+
+        topology = []
         for index, controller_serial in enumerate(controller_serials):
 
             # We need to do a form submit for other controllers to get
             # faucet serials
             if index > 0:
                 data = {"select_controller": index}
-                self.html["setup"] = generate_soup_html(
+                self.html["setup"] = self._parse_page(
                     self.post(data, url=SETUP_ENDPOINT, referer=SETUP_ENDPOINT).text
                 )
 
@@ -150,18 +532,80 @@ class RainCloudy:
                 # zone names
                 if faucet_index > 0:
                     data = {"select_faucet": faucet_index}
-                    self.html["setup"] = generate_soup_html(
+                    self.html["setup"] = self._parse_page(
                         self.post(data, url=SETUP_ENDPOINT, referer=SETUP_ENDPOINT).text
                     )
 
                 zone_names = find_zone_names(self.html["setup"])
                 faucets.append({"serial": faucet_serial, "zones": zone_names})
 
-            self._controllers.append(
-                RainCloudyController(self, controller_serial, index, faucets)
+            topology.append((controller_serial, faucets))
+        return topology
+
+    def _discover_concurrently(self, controller_serials):
+        """
+        Fetch the setup page of every controller and faucet concurrently.
+
+        The setup form only lists the faucets and zones of the controller and
+        faucet selected in the server side session, so every branch is
+        crawled with its own session to keep concurrent selections apart.
+        """
+        with ThreadPoolExecutor(max_workers=self._discovery_workers) as pool:
+            # setup pages listing the faucets of every controller
+            pages = [self.html["setup"]] + list(
+                pool.map(
+                    lambda index: self._branch_setup_page(index, 0),
+                    range(1, len(controller_serials)),
+                )
             )
-        self.is_connected = True
-        return True
+
+            # setup pages listing the zones of every other faucet
+            branches = [
+                (index, faucet_index)
+                for index, page in enumerate(pages)
+                for faucet_index in range(1, len(faucet_serial_finder(page)))
+            ]
+            faucet_pages = dict(
+                zip(
+                    branches,
+                    pool.map(lambda branch: self._branch_setup_page(*branch), branches),
+                )
+            )
+
+        topology = []
+        for index, (controller_serial, page) in enumerate(
+            zip(controller_serials, pages)
+        ):
+            faucets = []
+            for faucet_index, faucet_serial in enumerate(faucet_serial_finder(page)):
+                zone_page = faucet_pages.get((index, faucet_index), page)
+                faucets.append(
+                    {"serial": faucet_serial, "zones": find_zone_names(zone_page)}
+                )
+            topology.append((controller_serial, faucets))
+        return topology
+
+    def _branch_setup_page(self, controller_index, faucet_index):
+        """Return the setup page with a controller and faucet selected."""
+        client = self._new_session()
+        try:
+            forms = []
+            if controller_index > 0:
+                forms.append({"select_controller": controller_index})
+            if faucet_index > 0:
+                forms.append({"select_faucet": faucet_index})
+
+            for data in forms:
+                req = self._post(client, data, SETUP_ENDPOINT, SETUP_ENDPOINT)
+                if req is None:
+                    raise RainCloudyException(
+                        "Could not select controller {0} faucet {1}".format(
+                            controller_index, faucet_index
+                        )
+                    )
+            return self._parse_page(req.text)
+        finally:
+            client.close()
 
     @property
     def csrftoken(self):
@@ -171,9 +615,93 @@ class RainCloudy:
         return None
 
     def update(self):
-        """Update controller._attributes."""
-        for controller in self._controllers:
-            controller.update()
+        """Update the status snapshot of every faucet."""
+        self.update_faucets(
+            [
+                faucet
+                for controller in self._controllers
+                for faucet in controller.faucets
+            ]
+        )
+
+    def defer(self, func, *args, delay=None):
+        """
+        Call func on a timer thread after delay seconds.
+
+        The timer is not a daemon thread, so the call still happens
+        before the interpreter exits; logout runs it at once.
+
+        :param func: function to call
+        :param delay: seconds to wait, turn_off_delay by default
+        :type delay: float
+        :return: future of the result, cancelling it cancels the call
+        :rtype: concurrent.futures.Future
+        """
+        future = Future()
+        claim = threading.Lock()
+
+        def run():
+            # called by the timer or by flush_deferred, whichever is first
+            with claim:
+                if future.running() or future.done():
+                    return
+                future.set_running_or_notify_cancel()
+            self._deferring.active = True
+            try:
+                future.set_result(func(*args))
+            except BaseException as err:  # pylint: disable=broad-except
+                future.set_exception(err)
+            finally:
+                self._deferring.active = False
+
+        timer = threading.Timer(self.turn_off_delay if delay is None else delay, run)
+        self._deferred[future] = (timer, run)
+
+        def done(finished):
+            self._deferred.pop(finished, None)
+            if finished.cancelled():
+                timer.cancel()
+
+        future.add_done_callback(done)
+        timer.start()
+        return future
+
+    @property
+    def deferring(self):
+        """Return whether the caller runs a call made by defer."""
+        return getattr(self._deferring, "active", False)
+
+    def flush_deferred(self):
+        """Run every deferred call now and wait until they are done."""
+        pending = list(self._deferred.items())
+        for _, (timer, run) in pending:
+            timer.cancel()
+            run()
+        # calls already started by their timer
+        wait([future for future, _ in pending])
+
+    def update_faucets(self, faucets):
+        """
+        Fetch the status of faucets, concurrently when update_workers > 1.
+
+        Attributes are stored in faucet order once fetched, so controllers
+        end up with the same status and the same first error is raised
+        as when updating one faucet after another.
+
+        :param faucets: faucets to update
+        :type faucets: list of RainCloudyFaucet objects
+        """
+        if self._update_workers <= 1 or len(faucets) <= 1:
+            for faucet in faucets:
+                faucet.update()
+            return
+
+        workers = min(self._update_workers, len(faucets))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # pylint: disable=protected-access
+            statuses = pool.map(lambda faucet: faucet._fetch_status(), faucets)
+            for faucet, status in zip(faucets, statuses):
+                faucet._set_status(status)
 
     @property
     def controllers(self):
@@ -182,14 +710,66 @@ class RainCloudy:
             return self._controllers
         raise AttributeError("There is no controller assigned.")
 
+    def _parse_page(self, data):
+        """Parse a page with the configured parser options."""
+        return parse_page(
+            data, self._html_parser, self._forms_only, cache=self._parse_cache
+        )
+
+    def _parse_home(self, data):
+        """Parse the home page, scanning it when stream_home is set."""
+        if self._stream_home:
+            return stream_page_model(
+                data,
+                parser=self._html_parser,
+                forms_only=self._forms_only,
+                cache=self._parse_cache,
+            )
+        return self._parse_page(data)
+
     def update_home(self, data):
         """Update home html"""
         if not isinstance(data, str):
             raise TypeError("Function requires string response")
-        self.html["home"] = generate_soup_html(data)
+        # parsed on first access, so superseded pages are never parsed
+        self.html["home"] = LazyPage(data, self._parse_home)
+
+    @property
+    def selection(self):
+        """
+        Return the controller and faucet selected in the server session.
+
+        Read from the home page after logging in, then tracked from every
+        form posted.
+
+        :return: (controller, faucet) indexes, None if unknown
+        :rtype: tuple
+        """
+        if self._selection_from_home:
+            self._selection_from_home = False
+            controller = find_selected_controller_or_faucet_index(
+                self.html["home"], "controller"
+            )
+            faucet = find_selected_controller_or_faucet_index(
+                self.html["home"], "faucet"
+            )
+            if controller is not None and faucet is not None:
+                self._selection = (controller, faucet)
+        return self._selection
 
     def post(self, ddata, url=SETUP_ENDPOINT, referer=SETUP_ENDPOINT):
         """Method to update some attributes on namespace."""
+        req = self._post(self.client, ddata, url, referer)
+        # the server session keeps the controller and faucet of the form
+        if req is None:
+            self._selection = None
+        else:
+            self._selection = selection_after_form(ddata, self.selection)
+        return req
+
+    @staticmethod
+    def _post(client, ddata, url=SETUP_ENDPOINT, referer=SETUP_ENDPOINT):
+        """Submit a form with a requests.Session."""
         headers = HEADERS.copy()
         if referer is None:
             headers.pop("Referer")
@@ -198,16 +778,18 @@ class RainCloudy:
 
         # append csrftoken
         if "csrfmiddlewaretoken" not in ddata.keys():
-            ddata["csrfmiddlewaretoken"] = self.csrftoken
+            ddata["csrfmiddlewaretoken"] = client.cookies.get("csrftoken")
 
-        req = self.client.post(url, headers=headers, data=ddata)
+        req = client.post(url, headers=headers, data=ddata)
         if not req.status_code == 200:
             return None
 
         return req
 
     def logout(self):
-        """Logout."""
+        """Logout, once the queued settings and deferred forms were sent."""
+        self.commands.join()
+        self.flush_deferred()
         self.client.get(LOGOUT_ENDPOINT)
         self._cleanup()
 
@@ -215,6 +797,7 @@ class RainCloudy:
         """Cleanup object when logging out."""
         self.client = None
         self._controllers = []
+        self._index_controllers()
         self.is_connected = False
 
 
@@ -1,20 +1,20 @@
 # -*- coding: utf-8 -*-
 """RainCloud Faucet."""
 import time
+from concurrent.futures import CancelledError
 
-from raincloudy.const import (
-    HEADERS,
-    HOME_ENDPOINT,
-    MANUAL_OP_DATA,
-    MANUAL_WATERING_ALLOWED,
-    MAX_RAIN_DELAY_DAYS,
-    MAX_WATERING_MINUTES,
-    STATUS_ENDPOINT,
-)
+from raincloudy.commands import gather
+from raincloudy.const import HEADERS, HOME_ENDPOINT, MANUAL_OP_DATA, STATUS_ENDPOINT
 from raincloudy.helpers import (
+    batch_form,
+    batch_settings,
+    command_value,
     find_controller_or_faucet_name,
-    find_selected_controller_or_faucet_index,
+    manual_watering_value,
+    rain_delay_days,
+    rain_delay_value,
 )
+from raincloudy.status import decode_status
 
 
 class RainCloudyFaucetCore:
@@ -40,7 +40,9 @@ class RainCloudyFaucetCore:
         self._parent = parent
         self._controller = controller
         self._id = faucet_id
-        self._attributes = {}
+        self._status = None
+        self._updated_at = None
+        self._acted_at = None
         self._zone_names = zone_names
 
         # zones associated with faucet
@@ -62,6 +64,7 @@ class RainCloudyFaucetCore:
 
             if zone not in self.zones:
                 self.zones.append(zone)
+        self._zones_by_id = {zone.id: zone for zone in self.zones}
 
     def __repr__(self):
         """Object representation."""
@@ -72,8 +75,15 @@ class RainCloudyFaucetCore:
 
     @property
     def attributes(self):
-        """Return faucet id."""
-        return self._attributes
+        """Return the status in the shape of the status endpoint."""
+        if self._status is None:
+            return {}
+        return self._status.to_dict()
+
+    @property
+    def snapshot(self):
+        """Return the last FaucetStatus, None before the first update."""
+        return self._status
 
     @property
     def serial(self):
@@ -111,18 +121,83 @@ class RainCloudyFaucetCore:
     @property
     def status(self):
         """Return status."""
-        return self._attributes["faucet_status"]
+        return self._fresh_snapshot().faucet_status
 
     @property
     def battery(self):
-        """Return faucet battery."""
-        battery = self._attributes["battery_percent"]
-        if battery == "" or battery is None:
-            return None
-        return battery.strip("%")
+        """Return faucet battery percentage."""
+        return self._fresh_snapshot().battery
 
     def update(self):
         """Submit GET request to update information."""
+        self._set_status(self._fetch_status())
+
+    def _set_status(self, status):
+        """Store a fetched FaucetStatus."""
+        self._replace_status(status)
+        self._updated_at = time.monotonic()
+
+    def _replace_status(self, status):
+        """Store a FaucetStatus on the faucet and its controller."""
+        previous, self._status = self._status, status
+        self._controller.snapshot = status
+        self._parent.notify_changes(self, previous, status)
+
+    @property
+    def status_max_age(self):
+        """Return the seconds a status is trusted, None to always refresh."""
+        return self._parent.status_max_age
+
+    @property
+    def status_age(self):
+        """Return the seconds since the status was fetched, None if never."""
+        if self._updated_at is None:
+            return None
+        return time.monotonic() - self._updated_at
+
+    @property
+    def action_age(self):
+        """Return the seconds since an action was submitted, None if never."""
+        if self._acted_at is None:
+            return None
+        return time.monotonic() - self._acted_at
+
+    def is_stale(self):
+        """Return True if the status is older than status_max_age."""
+        age = self.status_age
+        return age is None or self.status_max_age is None or age > self.status_max_age
+
+    def update_if_stale(self):
+        """Fetch the status again if it is stale."""
+        if self.is_stale():
+            self.update()
+
+    def _fresh_snapshot(self):
+        """Return the FaucetStatus, fetched again once too old."""
+        if self.status_max_age is not None:
+            self.update_if_stale()
+        return self._status
+
+    def _fetch_status(self):
+        """Return the FaucetStatus of the faucet."""
+        generation = self._parent.session_generation
+        req = self._status_request()
+
+        # token probably expired, log in again once and retry
+        if req.status_code == 403:
+            self._parent.reauthenticate(generation)
+            req = self._status_request()
+
+        if req.status_code != 200:
+            if req.status_code == 404:
+                # the saved topology may list a faucet that is gone, other
+                # errors may be transient and keep it
+                self._parent.invalidate_topology()
+            req.raise_for_status()
+        return decode_status(req.content, self._parent.json_decoder)
+
+    def _status_request(self):
+        """Submit the status GET request with the current session."""
         # adjust headers
         headers = HEADERS.copy()
         headers["Accept"] = "*/*"
@@ -136,31 +211,33 @@ class RainCloudyFaucetCore:
             + self.id
         )
 
-        req = self._parent.client.get(STATUS_ENDPOINT + args, headers=headers)
-
-        # token probably expired, then try again
-        if req.status_code == 403:
-            self._parent.login()
-            self.update()
-        elif req.status_code == 200:
-            self._attributes = req.json()
-            self._controller.attributes = self._attributes
-        else:
-            req.raise_for_status()
+        return self._parent.client.get(STATUS_ENDPOINT + args, headers=headers)
 
     def _find_zone_by_id(self, zone_id):
         """Return zone by id."""
         if not self.zones:
             return None
 
-        zone = list(filter(lambda zone: zone.id == zone_id, self.zones))
-
-        return zone[0] if zone else None
+        return self._zones_by_id.get(zone_id)
 
 
 class RainCloudyFaucet(RainCloudyFaucetCore):
     """RainCloudyFaucet object."""
 
+    def batch(self):
+        """
+        Return a batch of zone changes submitted with a single form.
+
+        Used as a context manager the changes are submitted on exit::
+
+            with faucet.batch() as batch:
+                batch.set_manual_watering(1, 15)
+                batch.set_auto_watering(2, False)
+
+        :rtype: RainCloudyFaucetBatch object
+        """
+        return RainCloudyFaucetBatch(self)
+
     @property
     def zone1(self):
         """Return zone managed by faucet."""
@@ -207,6 +284,7 @@ class RainCloudyFaucetZone(RainCloudyFaucetCore):
         self._faucet = faucet
         self._id = zone_id
         self._name = zone_name
+        self._pending_off = None
 
     def __repr__(self):
         """Object representation."""
@@ -239,76 +317,114 @@ class RainCloudyFaucetZone(RainCloudyFaucetCore):
         self._set_zone_name(self.id, value)
 
     def _set_manual_watering_time(self, zoneid, value):
-        """Private method to set watering_time per zone."""
-        if value not in MANUAL_WATERING_ALLOWED:
-            raise ValueError(
-                "Valid options are: {}".format(
-                    ", ".join(map(str, MANUAL_WATERING_ALLOWED))
-                )
-            )
+        """
+        Private method to set watering_time per zone.
+
+        Turning the zone off only sends its ON form; the OFF form is sent
+        by a timer, whose future is returned. The command queue completes
+        the setting once it is done.
+
+        :return: future of the OFF form, None for other values
+        """
+        value = manual_watering_value(value)
+        # a newer setting supersedes a pending turn-off
+        self._cancel_turn_off()
 
         ddata = self.preupdate()
         attr = "zone{}_select_manual_mode".format(zoneid)
 
-        if (isinstance(value, int) and value == 0) or (
-            isinstance(value, str) and value.lower() == "off"
-        ):
-            value = "OFF"
-
-            # If zone is turned on at the valve we need to toggle ON first
+        if value == "OFF":
+            # If zone is turned on at the valve we need to toggle ON first,
+            # the OFF form is sent by a timer after turn_off_delay
             ddata[attr] = "ON"
             self.submit_action(ddata)
-            time.sleep(1)
-        elif isinstance(value, str):
-            value = value.upper()
-            if value == "ON":
-                value = MAX_WATERING_MINUTES
+            self._pending_off = self._parent.defer(self._submit_turn_off, zoneid)
+            return self._pending_off
 
         ddata[attr] = value
         self.submit_action(ddata)
+        self._store_setting(manual_watering_time=int(value), manual_mode_on=True)
+        return None
+
+    def _submit_turn_off(self, zoneid):
+        """Send the OFF form of a turn-off sequence."""
+        # build the form from the snapshot, which holds every change
+        # submitted since the ON form
+        ddata = self.preupdate(force_refresh=False)
+        ddata["zone{}_select_manual_mode".format(zoneid)] = "OFF"
+        self.submit_action(ddata)
+        self._store_setting(manual_watering_time=0, manual_mode_on=False)
 
-    @property
-    def watering_time(self):
-        """Return watering_time from zone."""
-        auto_watering_time = self.lookup_attr("auto_watering_time")
+    def _cancel_turn_off(self):
+        """Cancel the OFF form of a pending turn-off sequence."""
+        if self._pending_off is not None:
+            self._pending_off.cancel()
+            self._pending_off = None
 
-        manual_watering_time = self.lookup_attr("manual_watering_time")
+    def turn_off(self):
+        """
+        Stop manual watering without waiting for the OFF form.
 
-        if auto_watering_time > manual_watering_time:
-            watering_time = auto_watering_time
-        else:
-            watering_time = manual_watering_time
+        The zone is toggled ON, as required by the valve, and the OFF form
+        is sent turn_off_delay seconds later by a timer. Setting a new
+        manual watering time for the zone before then cancels it.
 
-        return watering_time
+        :return: future completed once the OFF form was sent
+        :rtype: concurrent.futures.Future
+        :raises requests.HTTPError: if the ON form could not be sent
+        """
+        return self._queue_setting("manual_watering", "off", wait_off=False)
+
+    def _queue_setting(self, field, value, wait_off=True):
+        """
+        Queue a setting and wait until it was sent.
+
+        Setters called by the worker sending settings or by a deferred
+        form, from a change listener for instance, return without waiting
+        for it: the worker may be waiting for that deferred form.
+
+        :param wait_off: wait for the OFF form of a turn-off, else only
+            for its ON form
+
+        :return: future completed once every form was sent
+        :rtype: concurrent.futures.Future
+        """
+        commands = self._parent.commands
+        command = commands.queue(self, field, value)
+        if commands.on_worker or self._parent.deferring:
+            return command.future
+
+        wait = command.future
+        if not wait_off and command_value(field, value) == "OFF":
+            wait = command.sent
+        try:
+            wait.result()
+        except CancelledError:
+            # replaced by a later setting of the zone
+            pass
+        return command.future
+
+    @property
+    def watering_time(self):
+        """Return watering_time from zone."""
+        return self.snapshot.watering_time
 
     @property
     def manual_watering(self):
         """Return zone manual_mode_on"""
-        return self.lookup_attr("manual_mode_on")
+        return self.snapshot.manual_mode_on
 
     @manual_watering.setter
     def manual_watering(self, value):
         """Manually turn on water for X minutes."""
-        return self._set_manual_watering_time(self.id, value)
+        self._queue_setting("manual_watering", value)
 
     def _set_rain_delay(self, zoneid, value):
         """Generic method to set auto_watering program."""
         # current index for rain_delay starts in 0
         zoneid -= 1
 
-        if isinstance(value, int):
-            if value > MAX_RAIN_DELAY_DAYS or value < 0:
-                value = None
-            elif value == 0:
-                value = "off"
-            elif value == 1:
-                value = "1day"
-            elif value >= 2:
-                value = str(value) + "days"
-        elif isinstance(value, str):
-            if value.lower() != "off":
-                value = None
-
+        value = rain_delay_value(value)
         if value is None:
             return None
 
@@ -316,22 +432,23 @@ class RainCloudyFaucetZone(RainCloudyFaucetCore):
         attr = "zone{}_rain_delay_select".format(zoneid)
         ddata[attr] = value
         self.submit_action(ddata)
+        self._store_setting(rain_delay_mode=rain_delay_days(value))
         return True
 
     @property
     def rain_delay(self):
         """Return the rain delay day from zone."""
-        return self.lookup_attr("rain_delay_mode")
+        return self.snapshot.rain_delay_mode
 
     @rain_delay.setter
     def rain_delay(self, value):
         """Set number of rain delay days for zone."""
-        return self._set_rain_delay(self.id, value)
+        self._queue_setting("rain_delay", value)
 
     @property
     def next_cycle(self):
         """Return the time scheduled for next watering from zone."""
-        return self.lookup_attr("next_water_cycle")
+        return self.snapshot.next_water_cycle
 
     def _set_auto_watering(self, zoneid, value):
         """Private method to set auto_watering program."""
@@ -349,37 +466,60 @@ class RainCloudyFaucetZone(RainCloudyFaucetCore):
             pass
 
         self.submit_action(ddata)
+        self._store_setting(program_mode_on=value)
         return True
 
     @property
     def auto_watering(self):
         """Return if zone is configured to automatic watering."""
-        return self.lookup_attr("program_mode_on")
+        return self.snapshot.program_mode_on
 
     @auto_watering.setter
     def auto_watering(self, value):
         """Enable/disable zone auto_watering program."""
-        return self._set_auto_watering(self.id, bool(value))
+        self._queue_setting("auto_watering", bool(value))
 
     @property
     def is_watering(self):
         """Return boolean if zone is watering."""
         return bool(self.watering_time > 0)
 
+    @property
+    def snapshot(self):
+        """Return the ZoneStatus of the zone."""
+        # pylint: disable=protected-access
+        return self._faucet._fresh_snapshot().zones[int(self.id) - 1]
+
     def lookup_attr(self, attr):
         """Returns rain_delay_mode attributes by zone index"""
-        return self._faucet.attributes["rain_delay_mode"][int(self.id) - 1][attr]
+        return getattr(self.snapshot, attr)
+
+    def _store_setting(self, **values):
+        """Keep the status snapshot in line with a submitted setting."""
+        # pylint: disable=protected-access
+        status = self._faucet._status
+        try:
+            status = status.replace_zone(int(self.id) - 1, **values)
+        except (AttributeError, IndexError):
+            return
+        self._faucet._replace_status(status)
+
+    @property
+    def status_age(self):
+        """Return the seconds since the faucet status was fetched."""
+        return self._faucet.status_age
 
     def _to_dict(self):
         """Method to build zone dict."""
+        zone = self.snapshot
         return {
-            "auto_watering": getattr(self, "auto_watering"),
-            "manual_watering": getattr(self, "manual_watering"),
-            "is_watering": getattr(self, "is_watering"),
-            "name": getattr(self, "name"),
-            "next_cycle": getattr(self, "next_cycle"),
-            "rain_delay": getattr(self, "rain_delay"),
-            "watering_time": getattr(self, "watering_time"),
+            "auto_watering": zone.program_mode_on,
+            "manual_watering": zone.manual_mode_on,
+            "is_watering": zone.watering_time > 0,
+            "name": self.name,
+            "next_cycle": zone.next_water_cycle,
+            "rain_delay": zone.rain_delay_mode,
+            "watering_time": zone.watering_time,
         }
 
     def report(self):
@@ -394,32 +534,32 @@ class RainCloudyFaucetZone(RainCloudyFaucetCore):
         """Return a dict with all current options prior submitting request."""
         ddata = MANUAL_OP_DATA.copy()
 
-        # force update to make sure status is accurate
+        # make sure status is accurate, trusting a snapshot younger than
+        # status_max_age
         if force_refresh:
-            self._faucet.update()
+            self._faucet.update_if_stale()
 
         # select current controller and faucet
-        ddata["select_controller"] = self._parent.controllers.index(self._controller)
-        ddata["select_faucet"] = self._controller.faucets.index(self._faucet)
+        ddata["select_controller"] = self._controller.index
+        ddata["select_faucet"] = self._faucet.index
 
-        # check if zone is scheduled automatically (zone1_program_toggle)
-        # only add zoneX_program_toogle to ddata when needed,
-        # otherwise the field will be always on
         for zone in self._faucet.zones:
-            attr = "zone{}_program_toggle".format(zone.id)
-            if zone.auto_watering:
-                ddata[attr] = "on"
+            status = zone.snapshot
 
-        # check if zone current watering manually (zone1_select_manual_mode)
-        for zone in self._faucet.zones:
+            # check if zone is scheduled automatically (zone1_program_toggle)
+            # only add zoneX_program_toogle to ddata when needed,
+            # otherwise the field will be always on
+            if status.program_mode_on:
+                ddata["zone{}_program_toggle".format(zone.id)] = "on"
+
+            # check if zone current watering manually (zone1_select_manual_mode)
             attr = "zone{}_select_manual_mode".format(zone.id)
-            if zone.watering_time and attr in ddata.keys():
-                ddata[attr] = zone.watering_time
+            if status.watering_time and attr in ddata.keys():
+                ddata[attr] = status.watering_time
 
-        # check if rain delay is selected (zone0_rain_delay_select)
-        for zone in self._faucet.zones:
+            # check if rain delay is selected (zone0_rain_delay_select)
             attr = "zone{}_rain_delay_select".format(zone.id - 1)
-            value = zone.rain_delay
+            value = status.rain_delay_mode
             if value and attr in ddata.keys():
                 if int(value) >= 2 and int(value) <= 7:
                     value = str(value) + "days"
@@ -432,29 +572,156 @@ class RainCloudyFaucetZone(RainCloudyFaucetCore):
     def submit_action(self, ddata):
         """Post data."""
 
-        controller_index = self._parent.controllers.index(self._controller)
-        faucet_index = self._controller.faucets.index(self._faucet)
+        controller_index = self._controller.index
+        faucet_index = self._faucet.index
 
-        current_controller_index = find_selected_controller_or_faucet_index(
-            self._parent.html["home"], "controller"
+        # This is an artifact of how the web-page we're impersonating works.
+        # The form submit will only apply actions to _selected_ controllers
+        # and faucets. So if the faucet selected in the server session
+        # isn't the faucet we're trying to submit an action for, or is
+        # unknown, we need to send the response twice. The first time we
+        # send it will switch us to the action
+        with self._parent.action_lock:
+            if self._parent.selection != (controller_index, faucet_index):
+                self._parent.post(ddata, url=HOME_ENDPOINT, referer=HOME_ENDPOINT)
+
+            response = self._parent.post(
+                ddata, url=HOME_ENDPOINT, referer=HOME_ENDPOINT
+            )
+
+        # pylint: disable=protected-access
+        self._faucet._acted_at = time.monotonic()
+        self._parent.update_home(response.text)
+
+
+class RainCloudyFaucetBatch:
+    """Changes to several zones of a faucet submitted with a single form."""
+
+    def __init__(self, faucet):
+        """
+        Initialize RainCloudyFaucetBatch object.
+
+        :param faucet: faucet owning the zones
+        :type faucet: RainCloudyFaucet object
+        :return: RainCloudyFaucetBatch object
+        :rtype: RainCloudyFaucetBatch object
+        """
+        self._faucet = faucet
+        self._changes = {}
+        # values given to the setters, queued as they are
+        self._values = {}
+        self.results = None
+        self.future = None
+
+    def __repr__(self):
+        """Object representation."""
+        return "<{0}: {1} zones>".format(self.__class__.__name__, len(self._changes))
+
+    def __enter__(self):
+        """Collect changes."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Submit the changes unless an exception was raised."""
+        if exc_type is None:
+            self.submit()
+
+    def _set(self, zone_id, field, value, given):
+        """Record a change to a zone."""
+        if zone_id not in range(1, 5):
+            raise ValueError("Valid zones are: 1, 2, 3, 4")
+        self._changes.setdefault(zone_id, {})[field] = value
+        self._values[(zone_id, field)] = given
+
+    def set_manual_watering(self, zone_id, value):
+        """Water a zone manually for value minutes, "on" or "off"."""
+        self._set(zone_id, "manual_watering", manual_watering_value(value), value)
+
+    def set_rain_delay(self, zone_id, value):
+        """Set the rain delay days of a zone, ignored if not valid."""
+        self._set(zone_id, "rain_delay", rain_delay_value(value), value)
+
+    def set_auto_watering(self, zone_id, value):
+        """Enable or disable the program of a zone, ignored if not a bool."""
+        self._set(
+            zone_id,
+            "auto_watering",
+            value if isinstance(value, bool) else None,
+            value,
         )
 
-        current_faucet_index = find_selected_controller_or_faucet_index(
-            self._parent.html["home"], "faucet"
+    def submit(self):
+        """
+        Submit every change with one status refresh and one form.
+
+        The changes go through the command queue of the account, like the
+        zone setters, so they are never interleaved with queued settings;
+        a later setting of the same zone replaces the change. Zones turned
+        off are switched ON by a first form, like
+        RainCloudyFaucetZone.turn_off does, and the final form is sent
+        turn_off_delay seconds later without blocking; wait on .future for
+        it.
+
+        :return: applied value of every field by zone id, None for the
+            ignored ones
+        :rtype: dict
+        :raises requests.HTTPError: if the form could not be sent
+        """
+        self.results = {
+            zone_id: dict(changes) for zone_id, changes in self._changes.items()
+        }
+        if not self._changes:
+            return self.results
+
+        zones = self._faucet.zones
+        values, self._values, self._changes = self._values, {}, {}
+        # pylint: disable=protected-access
+        parent = self._faucet._parent
+        commands = parent.commands.queue_all(
+            [
+                (zones[zone_id - 1], field, value)
+                for (zone_id, field), value in values.items()
+            ]
         )
+        self.future = gather([command.future for command in commands])
+        if parent.commands.on_worker or parent.deferring:
+            return self.results
+
+        for command in commands:
+            try:
+                command.sent.result()
+            except CancelledError:
+                # replaced by a later setting of the zone
+                pass
+        return self.results
+
+    def _submit(self):
+        """Send every change, called by the command queue."""
+        if not self._changes:
+            return
+
+        zones = self._faucet.zones
+        changes, self._changes, self._values = self._changes, {}, {}
+        # pylint: disable=protected-access
+        for zone_id, fields in changes.items():
+            if "manual_watering" in fields:
+                zones[zone_id - 1]._cancel_turn_off()
+
+        ddata = zones[0].preupdate()
+        ddata, toggles = batch_form(ddata, changes)
+
+        def submit():
+            zones[0].submit_action(ddata)
+            for zone_id, fields in changes.items():
+                zones[zone_id - 1]._store_setting(**batch_settings(fields))
+
+        if toggles:
+            # If zone is turned on at the valve we need to toggle ON first,
+            # the final form is sent by a timer after turn_off_delay
+            zones[0].submit_action({**ddata, **toggles})
+            self.future = self._faucet._parent.defer(submit)
+        else:
+            submit()
 
-        # This is an artifact of how the web-page we're impersonating works.
-        # The form submit will only apply actions to _selected_ controllers
-        # and faucets. So if the active controller and/or faucet on the page
-        # isn't the faucet we're trying to submit an action for we need to
-        # send the response twice. The first time we send it will switch us
-        # to the action
-        if (
-            current_controller_index != controller_index
-            or current_faucet_index != faucet_index
-        ):
-            self._parent.post(ddata, url=HOME_ENDPOINT, referer=HOME_ENDPOINT)
-
-        response = self._parent.post(ddata, url=HOME_ENDPOINT, referer=HOME_ENDPOINT)
 
-        self._parent.update_home(response.text)
+# vim:sw=4:ts=4:et:
@@ -1,20 +1,501 @@
 """Raincloudy helpers."""
 from __future__ import annotations
 
-from bs4 import BeautifulSoup
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from html.parser import HTMLParser
+from typing import Any, Callable, Union
 
+from bs4 import BeautifulSoup, FeatureNotFound, SoupStrainer
+
+from raincloudy.const import (
+    HTML_PARSER,
+    HTML_PARSERS,
+    MANUAL_WATERING_ALLOWED,
+    MAX_RAIN_DELAY_DAYS,
+    MAX_WATERING_MINUTES,
+    PARSE_CACHE_SIZE,
+)
 from raincloudy.exceptions import RainCloudyException
 
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # pragma: no cover
+    LexborHTMLParser = None
+
+# documents accepted by the finder functions below
+HTMLDocument = Union[BeautifulSoup, Any]
+
+
+def generate_soup_html(
+    data: str, parser: str = HTML_PARSER, forms_only: bool = False
+) -> HTMLDocument:
+    """
+    Return an HTML parser document.
+
+    :param data: HTML text to be parsed
+    :param parser: backend used to build the document, one of HTML_PARSERS.
+        ``selectolax`` returns a lexbor document instead of BeautifulSoup.
+    :param forms_only: only build the select elements read by the helpers.
+        html5lib can not parse partially, so html.parser is used instead;
+        selectolax always builds the full document.
+    :raises TypeError: if data can not be parsed
+    :raises ValueError: if parser is unknown
+    :raises RainCloudyException: if the parser backend is not installed
+    """
+    if parser not in HTML_PARSERS:
+        raise ValueError(
+            "Valid parsers are: {}".format(", ".join(map(str, HTML_PARSERS)))
+        )
+
+    if parser == "selectolax":
+        if LexborHTMLParser is None:
+            raise RainCloudyException("Parser selectolax is not installed")
+        if not isinstance(data, (str, bytes)):
+            raise TypeError("Invalid data passed to selectolax")
+        return LexborHTMLParser(data)
+
+    parse_only = None
+    if forms_only:
+        parse_only = SoupStrainer("select")
+        if parser == "html5lib":
+            parser = "html.parser"
 
-def generate_soup_html(data: str) -> BeautifulSoup:
-    """Return an BeautifulSoup HTML parser document."""
     try:
-        return BeautifulSoup(data, "html5lib")
+        return BeautifulSoup(data, parser, parse_only=parse_only)
+    except FeatureNotFound as err:
+        raise RainCloudyException(f"Parser {parser} is not installed") from err
     except:
         raise TypeError("Invalid data passed to BeautifulSoup")
 
 
-def faucet_serial_finder(data: BeautifulSoup) -> list[str]:
+def is_html_document(data: Any) -> bool:
+    """Return True if data was built by generate_soup_html."""
+    if isinstance(data, BeautifulSoup):
+        return True
+    return LexborHTMLParser is not None and isinstance(data, LexborHTMLParser)
+
+
+@dataclass(frozen=True)
+class PageModel:
+    """
+    Values read from a RainCloud home or setup page.
+
+    Fields are None when the matching select element is not on the page.
+
+    :param controller_names: options of id_select_controller (home page)
+    :param faucet_names: options of id_select_faucet (home page)
+    :param selected_controller: selected index of id_select_controller
+    :param selected_faucet: selected index of id_select_faucet
+    :param controller_serials: serials listed by id_select_controller2
+    :param faucet_serials: serials listed by id_select_faucet2
+    :param zone_names: zone names listed by the select_zone element
+    """
+
+    controller_names: tuple[str, ...] | None = None
+    faucet_names: tuple[str, ...] | None = None
+    selected_controller: int | None = None
+    selected_faucet: int | None = None
+    controller_serials: tuple[str, ...] | None = None
+    faucet_serials: tuple[str, ...] | None = None
+    zone_names: tuple[str, ...] | None = None
+
+
+# select elements read by extract_page_model, by id and by name
+_SELECT_IDS = (
+    "id_select_controller",
+    "id_select_faucet",
+    "id_select_controller2",
+    "id_select_faucet2",
+)
+_SELECT_NAMES = ("select_zone",)
+
+
+def _find_selects(data: HTMLDocument) -> dict[str, list[tuple[str, bool]]]:
+    """
+    Return (text, selected) options of every select read by the helpers.
+
+    The document is walked once; options are keyed by the select id, or by
+    its name for the ones listed in _SELECT_NAMES.
+    """
+    selects: dict[str, list[tuple[str, bool]]] = {}
+
+    if isinstance(data, BeautifulSoup):
+        for select in data.find_all("select"):
+            for key in (select.get("id"), select.get("name")):
+                if key in _SELECT_IDS + _SELECT_NAMES and key not in selects:
+                    selects[key] = [
+                        (option.text, option.has_attr("selected"))
+                        for option in select.find_all("option")
+                    ]
+        return selects
+
+    for select in data.css("select"):
+        attributes = select.attributes
+        for key in (attributes.get("id"), attributes.get("name")):
+            if key in _SELECT_IDS + _SELECT_NAMES and key not in selects:
+                selects[key] = [
+                    (option.text(), "selected" in option.attributes)
+                    for option in select.css("option")
+                ]
+    return selects
+
+
+def _option_names(options: list[tuple[str, bool]] | None) -> tuple[str, ...] | None:
+    """Return the stripped option labels."""
+    if options is None:
+        return None
+    return tuple(text.strip() for text, _ in options)
+
+
+def _option_selected(options: list[tuple[str, bool]] | None) -> int | None:
+    """Return the index of the first selected option."""
+    for index, (_, selected) in enumerate(options or []):
+        if selected:
+            return index
+    return None
+
+
+def _option_serials(options: list[tuple[str, bool]] | None) -> tuple[str, ...] | None:
+    """Return serials from "1 - SERIAL" option labels."""
+    if options is None:
+        return None
+    try:
+        return tuple(text.split("-")[1].strip() for text, _ in options)
+    except IndexError:
+        return None
+
+
+def _option_zone_names(
+    options: list[tuple[str, bool]] | None
+) -> tuple[str, ...] | None:
+    """Return zone names from "1 - NAME" option labels."""
+    if options is None:
+        return None
+    return tuple(
+        text.split("-")[1].strip() if len(text.split("-")) > 1 else ""
+        for text, _ in options
+    )
+
+
+def extract_page_model(data: HTMLDocument) -> PageModel:
+    """
+    Read every value used by RainCloudy from a document in one traversal.
+
+    :param data: document returned by generate_soup_html
+    :return: PageModel object
+    :raises TypeError: if data is not a parsed HTML document
+    """
+    if not is_html_document(data):
+        raise TypeError("Function requires BeautifulSoup HTML element.")
+
+    return _build_page_model(_find_selects(data))
+
+
+def _build_page_model(selects: dict[str, list[tuple[str, bool]]]) -> PageModel:
+    """Return a PageModel from the options found by _find_selects."""
+    return PageModel(
+        controller_names=_option_names(selects.get("id_select_controller")),
+        faucet_names=_option_names(selects.get("id_select_faucet")),
+        selected_controller=_option_selected(selects.get("id_select_controller")),
+        selected_faucet=_option_selected(selects.get("id_select_faucet")),
+        controller_serials=_option_serials(selects.get("id_select_controller2")),
+        faucet_serials=_option_serials(selects.get("id_select_faucet2")),
+        zone_names=_option_zone_names(selects.get("select_zone")),
+    )
+
+
+class ParseCache:
+    """
+    LRU cache of PageModel objects keyed by a hash of the page text.
+
+    PageModel objects are immutable, so a cached model can be shared by
+    every RainCloudy object receiving byte-identical markup.
+    """
+
+    def __init__(self, maxsize: int = PARSE_CACHE_SIZE) -> None:
+        """
+        Initialize ParseCache object.
+
+        :param maxsize: maximum number of pages kept in the cache
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._models: OrderedDict[tuple, PageModel] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        """Object representation."""
+        return (
+            f"<{self.__class__.__name__}: hits={self.hits} "
+            f"misses={self.misses} size={len(self)}/{self.maxsize}>"
+        )
+
+    def __len__(self) -> int:
+        """Return the number of cached pages."""
+        return len(self._models)
+
+    @staticmethod
+    def key(data: str | bytes, *options: Any) -> tuple:
+        """Return the cache key of a page parsed with options."""
+        if isinstance(data, str):
+            data = data.encode("utf-8", "surrogatepass")
+        return (hashlib.blake2b(data, digest_size=16).digest(),) + options
+
+    def get_or_parse(
+        self, data: str, parse: Callable[[str], PageModel], *options: Any
+    ) -> PageModel:
+        """Return the cached PageModel of data or parse and store it."""
+        if not isinstance(data, (str, bytes)) or self.maxsize <= 0:
+            return parse(data)
+
+        key = self.key(data, *options)
+        model = self.lookup(key)
+        if model is None:
+            model = parse(data)
+            self.store(key, model)
+        return model
+
+    def lookup(self, key: tuple) -> PageModel | None:
+        """Return the PageModel cached under key, counting hits and misses."""
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                self.misses += 1
+                return None
+            self._models.move_to_end(key)
+            self.hits += 1
+            return model
+
+    def store(self, key: tuple, model: PageModel) -> None:
+        """Cache model under key, evicting the least recently used pages."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._models[key] = model
+            self._models.move_to_end(key)
+            while len(self._models) > self.maxsize:
+                self._models.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop every cached page and reset the counters."""
+        with self._lock:
+            self._models.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# parse cache shared by every RainCloudy object
+PARSE_CACHE = ParseCache()
+
+
+def parse_page(
+    data: str,
+    parser: str = HTML_PARSER,
+    forms_only: bool = False,
+    cache: ParseCache | None = PARSE_CACHE,
+) -> PageModel:
+    """
+    Return the PageModel of an HTML page.
+
+    :param data: HTML text to be parsed
+    :param parser: backend used to build the document
+    :param forms_only: only build the select elements read by the helpers
+    :param cache: ParseCache used for repeated pages, None disables it
+    """
+
+    def parse(text):
+        return extract_page_model(generate_soup_html(text, parser, forms_only))
+
+    if cache is None:
+        return parse(data)
+    return cache.get_or_parse(data, parse, "soup", parser, forms_only)
+
+
+class _ScanComplete(Exception):
+    """Raised by _SelectScanner once every needed select was read."""
+
+
+class _SelectScanner(HTMLParser):
+    """Tokenize a page and collect the options of the needed selects."""
+
+    def __init__(self, needed: tuple[str, ...]):
+        """Initialize the scanner for the given select ids and names."""
+        super().__init__()
+        self.needed = needed
+        self.selects: dict[str, list[tuple[str, bool]]] = {}
+        self.unexpected = False
+        self._keys: tuple[str, ...] = ()
+        self._options: list[tuple[str, bool]] | None = None
+
+    def handle_starttag(self, tag, attrs):
+        """Open select and option elements."""
+        if tag == "select":
+            if self._options is not None:
+                # nested select elements are not valid markup
+                self.unexpected = True
+                raise _ScanComplete
+            attributes = dict(attrs)
+            self._keys = tuple(
+                key
+                for key in (attributes.get("id"), attributes.get("name"))
+                if key in self.needed and key not in self.selects
+            )
+            if self._keys:
+                self._options = []
+        elif tag == "option" and self._options is not None:
+            self._options.append(("", any(key == "selected" for key, _ in attrs)))
+
+    def handle_endtag(self, tag):
+        """Close select elements and stop once every select was read."""
+        if tag != "select" or self._options is None:
+            return
+        options = list(self._options)
+        for key in self._keys:
+            self.selects[key] = options
+        self._options = None
+        if all(key in self.selects for key in self.needed):
+            raise _ScanComplete
+
+    def handle_data(self, data):
+        """Append text to the open option."""
+        if self._options:
+            text, selected = self._options[-1]
+            self._options[-1] = (text + data, selected)
+
+
+# selects read from the home page by submit_action
+HOME_SELECTS = ("id_select_controller", "id_select_faucet")
+
+
+def stream_page_model(
+    data: str,
+    needed: tuple[str, ...] = HOME_SELECTS,
+    parser: str = HTML_PARSER,
+    forms_only: bool = False,
+    chunk_size: int = 8192,
+    cache: ParseCache | None = PARSE_CACHE,
+) -> PageModel:
+    """
+    Return the PageModel of a page without building a document.
+
+    The text is tokenized in chunks and scanning stops as soon as every
+    needed select was read. If the markup is unexpected (a needed select
+    is missing, empty or malformed) the page is parsed with parse_page.
+
+    :param data: HTML text to be scanned
+    :param needed: ids or names of the select elements to read
+    :param parser: backend used when falling back to parse_page
+    :param forms_only: forms_only option used when falling back to parse_page
+    :param chunk_size: number of characters fed to the tokenizer at once
+    :param cache: ParseCache used for repeated pages, None disables it
+    :return: PageModel object
+    """
+    if not isinstance(data, str):
+        raise TypeError("Function requires string response")
+
+    if cache is not None:
+        return cache.get_or_parse(
+            data,
+            lambda text: stream_page_model(
+                text, needed, parser, forms_only, chunk_size, cache=None
+            ),
+            "stream",
+            needed,
+            parser,
+            forms_only,
+        )
+
+    scanner = _SelectScanner(needed)
+    try:
+        for start in range(0, len(data), chunk_size):
+            scanner.feed(data[start : start + chunk_size])
+        scanner.close()
+    except _ScanComplete:
+        pass
+    except Exception:  # pylint: disable=broad-except
+        scanner.unexpected = True
+
+    if scanner.unexpected or not all(scanner.selects.get(key) for key in needed):
+        return parse_page(data, parser, forms_only, cache=None)
+    return _build_page_model(scanner.selects)
+
+
+class LazyPage:
+    """
+    Page text parsed into a PageModel on first access.
+
+    Attributes of the PageModel can be read from the LazyPage directly.
+    A page that is replaced before being read is never parsed.
+    """
+
+    __slots__ = ("_data", "_parse", "_model")
+
+    def __init__(
+        self, data: str, parse: Callable[[str], PageModel] = parse_page
+    ) -> None:
+        """
+        Initialize LazyPage object.
+
+        :param data: HTML text of the page
+        :param parse: callable returning the PageModel of the text
+        """
+        self._data: str | None = data
+        self._parse = parse
+        self._model: PageModel | None = None
+
+    def __repr__(self) -> str:
+        """Object representation."""
+        state = "parsed" if self.parsed else "unparsed"
+        return f"<{self.__class__.__name__}: {state}>"
+
+    def __getattr__(self, name: str) -> Any:
+        """Read PageModel attributes."""
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    @property
+    def parsed(self) -> bool:
+        """Return True if the page was parsed."""
+        return self._model is not None
+
+    @property
+    def text(self) -> str | None:
+        """Return the page text, or None once the page was parsed."""
+        return self._data
+
+    def fill(self, model: PageModel) -> None:
+        """Set the PageModel of a page parsed elsewhere."""
+        self._model = model
+        self._data = None
+
+    @property
+    def model(self) -> PageModel:
+        """Return the PageModel, parsing the page if needed."""
+        if self._model is None:
+            self._model = self._parse(self._data)
+            # the text is not needed anymore
+            self._data = None
+        return self._model
+
+
+def _page_model(data: PageModel | LazyPage | HTMLDocument) -> PageModel:
+    """Return data as a PageModel, extracting it from documents."""
+    if isinstance(data, PageModel):
+        return data
+    if isinstance(data, LazyPage):
+        return data.model
+    return extract_page_model(data)
+
+
+def faucet_serial_finder(data: PageModel | LazyPage | HTMLDocument) -> list[str]:
     """
     Find faucet_serial from the setup page.
 
@@ -23,24 +504,19 @@ def faucet_serial_finder(data: BeautifulSoup) -> list[str]:
         <option value='1>2 - Controller002</option>
     </select>
 
-    :param data: text to be parsed :type data: BeautilSoup object :return: a
-    dict with array of controller_serials and array of faucet_serials
+    :param data: text to be parsed
+    :type data: PageModel, LazyPage or BeautilSoup object
+    :return: a dict with array of controller_serials and array of
+    faucet_serials
     :raises IndexError: if controller_serial was not found on the data
     """
-    if not isinstance(data, BeautifulSoup):
-        raise TypeError("Function requires BeautifulSoup HTML element.")
-
-    try:
-        faucets_element = data.find(id="id_select_faucet2").find_all("option")
-        return [
-            faucet_element.text.split("-")[1].strip()
-            for faucet_element in faucets_element
-        ]
-    except (AttributeError, IndexError, ValueError):
+    serials = _page_model(data).faucet_serials
+    if serials is None:
         raise RainCloudyException("Could not find any valid controller or faucet")
+    return list(serials)
 
 
-def controller_serial_finder(data: BeautifulSoup) -> list[str]:
+def controller_serial_finder(data: PageModel | LazyPage | HTMLDocument) -> list[str]:
     """
     Find all controller serials from the setup page.
 
@@ -49,22 +525,21 @@ def controller_serial_finder(data: BeautifulSoup) -> list[str]:
     </select>
 
     :param data: text to be parsed
-    :type data: BeautilSoup object
+    :type data: PageModel, LazyPage or BeautilSoup object
     :return: an array of controller serials
     :raises IndexError: if controller_serial was not found on the data
     """
     try:
-        controllers_element = data.find(id="id_select_controller2").find_all("option")
-        return [
-            controller_element.text.split("-")[1].strip()
-            for controller_element in controllers_element
-        ]
-    except (AttributeError, IndexError, ValueError):
+        serials = _page_model(data).controller_serials
+    except TypeError:
+        serials = None
+    if serials is None:
         raise RainCloudyException("Could not find any valid controller serials")
+    return list(serials)
 
 
 def find_controller_or_faucet_name(
-    data: BeautifulSoup, p_type: str, index: int = 0
+    data: PageModel | LazyPage | HTMLDocument, p_type: str, index: int = 0
 ) -> str | None:
     """
     Find on the HTML document the controller name.
@@ -78,28 +553,26 @@ def find_controller_or_faucet_name(
           <option value="0" selected="selected">HERE_IS_CONTROLLER_NAME
 
     :param index: The index of the element we're parsing
-    :param data: BeautifulSoup object
+    :param data: PageModel, LazyPage or BeautifulSoup object
     :param p_type: parameter type. (controller or faucet)
     :return: controller or valve name
     :rtype: string.
-    :raises TypeError: if data is not a BeautifulSoup object
+    :raises TypeError: if data is not a PageModel, LazyPage or BeautifulSoup
+        object
     :raises IndexError: return None because controller name was not found
     """
-    if not isinstance(data, BeautifulSoup):
-        raise TypeError("Function requires BeautilSoup HTML element.")
+    model = _page_model(data)
 
     if p_type not in ("controller", "faucet"):
         raise TypeError("Function p_type must be controller or faucet")
 
-    try:
-        search_field = f"id_select_{p_type}"
-        child = data.find(id=search_field).findAll("option")
-        return child[index].text.strip()
-    except AttributeError:
+    names = model.controller_names if p_type == "controller" else model.faucet_names
+    if names is None:
         return None
+    return names[index]
 
 
-def find_zone_names(data: BeautifulSoup) -> list[str]:
+def find_zone_names(data: PageModel | LazyPage | HTMLDocument) -> list[str]:
     """
     Find on the HTML document the zone name.
 
@@ -107,50 +580,288 @@ def find_zone_names(data: BeautifulSoup) -> list[str]:
     <span class="more_info" \
         title="Zone can be renamed on Setup tab">1 - zone1</span>,
 
-    :param data: BeautifulSoup object
+    :param data: PageModel, LazyPage or BeautifulSoup object
     :return: zone name
     :rtype: string
-    :raises TypeError: if data is not a BeautifulSoup object
+    :raises TypeError: if data is not a PageModel, LazyPage or BeautifulSoup
+        object
     :raises IndexError: return None because controller name was not found
     """
-    if not isinstance(data, BeautifulSoup):
-        raise TypeError("Function requires BeautilSoup HTML element.")
-
-    try:
-        zones = data.find("select", {"name": "select_zone"}).find_all("option")
-        return [
-            zone.text.split("-")[1].strip() if len(zone.text.split("-")) > 1 else ""
-            for zone in zones
-        ]
-    except AttributeError:
+    zone_names = _page_model(data).zone_names
+    if zone_names is None:
         return ["1", "2", "3", "4"]
+    return list(zone_names)
 
 
 def find_selected_controller_or_faucet_index(
-    data: BeautifulSoup, p_type: str
+    data: PageModel | LazyPage | HTMLDocument, p_type: str
 ) -> int | None:
     """
     Find the currently selected controller index from the home html
     :param p_type: parameter type. (controller or faucet)
-    :param data: BeautifulSoup object
+    :param data: PageModel, LazyPage or BeautifulSoup object
     :return: controller index
     """
-    if not isinstance(data, BeautifulSoup):
-        raise TypeError("Function requires BeautifulSoup HTML element.")
+    model = _page_model(data)
 
     if p_type not in ("controller", "faucet"):
         raise TypeError("Function p_type must be controller or faucet")
 
+    if p_type == "controller":
+        return model.selected_controller
+    return model.selected_faucet
+
+
+def topology_matches_page(
+    topology: Any, data: PageModel | LazyPage | HTMLDocument
+) -> bool:
+    """
+    Check a cached topology against the selects of the home page.
+
+    The home page only lists names, so the number of controllers and the
+    number of faucets of the selected controller are compared.
+
+    :param topology: list of (controller_serial, faucets) pairs, faucets
+        being dicts with a serial and four zone names
+    :param data: PageModel, LazyPage or BeautifulSoup object
+    :return: False if the topology is malformed or does not match the page
+    :rtype: boolean
+    """
     try:
-        search_field = "id_select_{0}".format(p_type)
-        child = data.find(id=search_field).findAll("option")
-        for index, option in enumerate(child):
-            if "selected" in str(option):
-                return index
-    except AttributeError:
-        pass
+        for controller_serial, faucets in topology:
+            if not isinstance(controller_serial, str) or not faucets:
+                return False
+            for faucet in faucets:
+                if not isinstance(faucet["serial"], str) or len(faucet["zones"]) != 4:
+                    return False
+    except (TypeError, ValueError, KeyError):
+        return False
 
-    return None
+    model = _page_model(data)
+    if model.controller_names is None or model.faucet_names is None:
+        return False
+    if len(model.controller_names) != len(topology):
+        return False
+    selected = model.selected_controller or 0
+    return len(model.faucet_names) == len(topology[selected][1])
+
+
+def session_is_valid(state: Any) -> bool:
+    """
+    Check a saved session before sending it to the site.
+
+    :param state: dict returned by RainCloudy.export_session
+    :return: False if the state is malformed, has no sessionid or expired
+    :rtype: boolean
+    """
+    if not isinstance(state, dict) or not isinstance(state.get("sessionid"), str):
+        return False
+    expires = state.get("expires")
+    return expires is None or expires > time.time()
+
+
+def selection_after_form(
+    ddata: dict[str, Any], selection: tuple[int, int] | None
+) -> tuple[int, int] | None:
+    """
+    Return the controller and faucet selected by the server after a form.
+
+    :param ddata: form posted to the site
+    :param selection: (controller, faucet) indexes selected before the
+        form, None if unknown
+    :return: (controller, faucet) indexes, None if unknown. Selecting a
+        controller alone leaves the faucet unknown
+    """
+    controller = ddata.get("select_controller")
+    faucet = ddata.get("select_faucet")
+    if controller is not None and faucet is not None:
+        return int(controller), int(faucet)
+    if controller is not None:
+        return None
+    if faucet is not None:
+        return None if selection is None else (selection[0], int(faucet))
+    return selection
+
+
+def order_by_selection(
+    items: list[Any],
+    target: Callable[[Any], tuple[int, int]],
+    selection: tuple[int, int] | None = None,
+) -> list[Any]:
+    """
+    Group items by the controller and faucet they act on.
+
+    Items acting on the current selection come first; the other groups
+    follow in order of first appearance, keeping the order of items
+    within a group, so every selection is switched to at most once.
+
+    :param items: queued actions
+    :param target: function returning the (controller, faucet) indexes
+        of an item
+    :param selection: (controller, faucet) indexes currently selected
+    :return: reordered list of items
+    """
+    groups: dict[tuple[int, int], list[Any]] = {}
+    if selection is not None:
+        groups[selection] = []
+    for item in items:
+        groups.setdefault(target(item), []).append(item)
+    return [item for group in groups.values() for item in group]
+
+
+def manual_watering_value(value: int | str) -> int | str:
+    """
+    Return the home form value of a manual watering time.
+
+    :param value: minutes, "on" or "off", one of MANUAL_WATERING_ALLOWED
+    :return: "OFF" or minutes, "on" being MAX_WATERING_MINUTES
+    :raises ValueError: if value is not allowed
+    """
+    if value not in MANUAL_WATERING_ALLOWED:
+        raise ValueError(
+            "Valid options are: {}".format(", ".join(map(str, MANUAL_WATERING_ALLOWED)))
+        )
+
+    if (isinstance(value, int) and value == 0) or (
+        isinstance(value, str) and value.lower() == "off"
+    ):
+        return "OFF"
+    if isinstance(value, str):
+        value = value.upper()
+        if value == "ON":
+            return MAX_WATERING_MINUTES
+    return value
+
+
+def rain_delay_value(value: int | str | None) -> str | None:
+    """
+    Return the home form value of a rain delay.
+
+    :param value: days, up to MAX_RAIN_DELAY_DAYS, or "off"
+    :return: "off", "1day" or "<days>days", None if value is not valid
+    """
+    if isinstance(value, int):
+        if value > MAX_RAIN_DELAY_DAYS or value < 0:
+            return None
+        if value == 0:
+            return "off"
+        if value == 1:
+            return "1day"
+        return str(value) + "days"
+    if isinstance(value, str) and value.lower() != "off":
+        return None
+    return value
+
+
+def rain_delay_days(value: str) -> int:
+    """Return the days of a rain delay form value."""
+    return int("".join(filter(str.isdigit, value)) or 0)
+
+
+def command_value(field: str, value: Any) -> Any:
+    """
+    Return the home form value of a zone setting.
+
+    :param field: "manual_watering", "rain_delay" or "auto_watering"
+    :param value: value given to the zone setter
+    :return: form value, None if the setting is ignored
+    :raises ValueError: if field is unknown or the manual watering time
+        not allowed
+    """
+    if field == "manual_watering":
+        return manual_watering_value(value)
+    if field == "rain_delay":
+        return rain_delay_value(value)
+    if field == "auto_watering":
+        return value if isinstance(value, bool) else None
+    raise ValueError("Unknown zone setting: {}".format(field))
+
+
+# weekday prefixes of next_water_cycle, Monday first like datetime.weekday
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+
+def seconds_until_cycle(
+    current_time: str, next_cycle: str, weekday: int | None = None
+) -> float | None:
+    """
+    Return the seconds until the next watering cycle of a zone.
+
+    :param current_time: controller time of the status, like "02:00 AM"
+    :param next_cycle: next_water_cycle of the zone, like "06:30 AM" or
+        "Tue 01:00 AM"
+    :param weekday: weekday of current_time, Monday being 0. Read from
+        current_time if it names one, else today
+    :return: seconds, None if next_cycle holds no time of day
+    """
+    times = []
+    days = []
+    for value in (current_time, next_cycle):
+        match = re.search(r"(\d{1,2}:\d{2})\s*([AP]M)", str(value), re.IGNORECASE)
+        if match is None:
+            return None
+        clock = datetime.strptime(" ".join(match.groups()).upper(), "%I:%M %p")
+        times.append(clock.hour * 3600 + clock.minute * 60)
+        day = re.search(r"\b(mon|tue|wed|thu|fri|sat|sun)", str(value), re.IGNORECASE)
+        days.append(None if day is None else WEEKDAYS.index(day.group(1).lower()))
+
+    seconds = times[1] - times[0]
+    if days[1] is None:
+        return float(seconds % 86400)
+    if days[0] is None:
+        days[0] = datetime.now().weekday() if weekday is None else weekday
+    seconds += (days[1] - days[0]) % 7 * 86400
+    # a cycle earlier on the same day is the one of next week
+    return float(seconds % (7 * 86400))
+
+
+def batch_form(
+    ddata: dict[str, Any], changes: dict[int, dict[str, Any]]
+) -> tuple[dict[str, Any], dict[str, str]]:
+    """
+    Apply batched zone changes to a home form.
+
+    :param ddata: form returned by preupdate
+    :param changes: field values by zone id, as returned by
+        manual_watering_value and rain_delay_value; None values are ignored
+    :return: the form and the manual mode fields to switch ON first
+    """
+    toggles = {}
+    for zone_id, fields in changes.items():
+        value = fields.get("manual_watering")
+        if value is not None:
+            attr = f"zone{zone_id}_select_manual_mode"
+            if value == "OFF":
+                toggles[attr] = "ON"
+            ddata[attr] = value
+
+        value = fields.get("rain_delay")
+        if value is not None:
+            # rain delay fields start with zone0
+            ddata[f"zone{zone_id - 1}_rain_delay_select"] = value
+
+        value = fields.get("auto_watering")
+        if value is not None:
+            attr = f"zone{zone_id}_program_toggle"
+            if value:
+                ddata[attr] = "on"
+            else:
+                ddata.pop(attr, None)
+    return ddata, toggles
+
+
+def batch_settings(fields: dict[str, Any]) -> dict[str, Any]:
+    """Return the status attributes changed by batched zone fields."""
+    settings: dict[str, Any] = {}
+    value = fields.get("manual_watering")
+    if value is not None:
+        settings["manual_watering_time"] = 0 if value == "OFF" else int(value)
+        settings["manual_mode_on"] = value != "OFF"
+    if fields.get("rain_delay") is not None:
+        settings["rain_delay_mode"] = rain_delay_days(fields["rain_delay"])
+    if fields.get("auto_watering") is not None:
+        settings["program_mode_on"] = fields["auto_watering"]
+    return settings
 
 
 # vim:sw=4:ts=4:et:
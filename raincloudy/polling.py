@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""RainCloudy adaptive status polling."""
+import threading
+import time
+from collections import deque
+
+import requests
+
+from raincloudy.const import (
+    POLL_ACTION_INTERVAL,
+    POLL_ACTION_WINDOW,
+    POLL_BUDGET_PERIOD,
+    POLL_IDLE_INTERVAL,
+    POLL_OFFLINE_INTERVAL,
+    POLL_WATERING_INTERVAL,
+)
+from raincloudy.exceptions import RainCloudyException
+from raincloudy.helpers import seconds_until_cycle
+
+
+class PollPolicy:
+    """Pick the next status poll of a faucet from its last status."""
+
+    def __init__(
+        self,
+        watering_interval=POLL_WATERING_INTERVAL,
+        action_interval=POLL_ACTION_INTERVAL,
+        action_window=POLL_ACTION_WINDOW,
+        idle_interval=POLL_IDLE_INTERVAL,
+        offline_interval=POLL_OFFLINE_INTERVAL,
+    ):
+        """
+        Initialize PollPolicy object.
+
+        :param watering_interval: seconds between polls while a zone waters
+        :param action_interval: seconds between polls after an action
+        :param action_window: seconds after an action polled every
+            action_interval
+        :param idle_interval: seconds between polls when no zone waters.
+            Shortened to reach the next watering cycle of a zone
+        :param offline_interval: seconds between polls when the faucet
+            has no radio link with its controller
+        :type watering_interval: float
+        :type action_interval: float
+        :type action_window: float
+        :type idle_interval: float
+        :type offline_interval: float
+        :return: PollPolicy object
+        :rtype: PollPolicy object
+        """
+        intervals = (watering_interval, action_interval, idle_interval)
+        if min(intervals + (offline_interval,)) <= 0:
+            raise ValueError("Poll intervals must be positive")
+
+        self.watering_interval = watering_interval
+        self.action_interval = action_interval
+        self.action_window = action_window
+        self.idle_interval = idle_interval
+        self.offline_interval = offline_interval
+
+    def __repr__(self):
+        """Object representation."""
+        return "<{0}: {1}s watering, {2}s idle>".format(
+            self.__class__.__name__, self.watering_interval, self.idle_interval
+        )
+
+    def state(self, faucet):
+        """
+        Return the polling state of a faucet.
+
+        :param faucet: faucet with a status
+        :type faucet: RainCloudyFaucet object
+        :return: "unknown" without a status, "action", "offline",
+            "watering" or "idle"
+        :rtype: string
+        """
+        status = faucet.snapshot
+        if status is None:
+            return "unknown"
+
+        age = faucet.action_age
+        if age is not None and age < self.action_window:
+            return "action"
+        if status.rf_link is False or status.faucet_status not in ("Online", None):
+            return "offline"
+        for zone in status.zones:
+            if zone.is_watering or zone.manual_watering_time:
+                return "watering"
+        return "idle"
+
+    def delay(self, faucet):
+        """
+        Return the seconds until the next status poll of a faucet.
+
+        :param faucet: faucet with a status
+        :type faucet: RainCloudyFaucet object
+        :rtype: float
+        """
+        state = self.state(faucet)
+        if state in ("unknown", "action"):
+            return self.action_interval
+        if state == "offline":
+            return self.offline_interval
+        if state == "watering":
+            return self.watering_interval
+
+        delay = self.idle_interval
+        status = faucet.snapshot
+        for zone in status.zones:
+            until = seconds_until_cycle(status.current_time, zone.next_water_cycle)
+            if until is not None:
+                # poll once the cycle started
+                delay = min(delay, until + self.action_interval)
+        return delay
+
+
+class RequestBudget:
+    """Sliding window limiting the status requests of an account."""
+
+    def __init__(self, max_requests, period=POLL_BUDGET_PERIOD):
+        """
+        Initialize RequestBudget object.
+
+        :param max_requests: status requests allowed during period
+        :param period: window in seconds
+        :type max_requests: integer
+        :type period: float
+        :return: RequestBudget object
+        :rtype: RequestBudget object
+        """
+        if max_requests < 1 or period <= 0:
+            raise ValueError("A budget allows at least 1 request per period")
+
+        self.max_requests = max_requests
+        self.period = period
+        self._spent = deque()
+
+    def __repr__(self):
+        """Object representation."""
+        return "<{0}: {1}/{2} per {3}s>".format(
+            self.__class__.__name__,
+            len(self._spent),
+            self.max_requests,
+            self.period,
+        )
+
+    def _expire(self, now):
+        """Forget the requests older than period."""
+        while self._spent and self._spent[0] <= now - self.period:
+            self._spent.popleft()
+
+    def available(self, now=None):
+        """Return the requests allowed right now."""
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        return self.max_requests - len(self._spent)
+
+    def wait(self, now=None):
+        """Return the seconds until a request is allowed."""
+        now = time.monotonic() if now is None else now
+        if self.available(now) > 0:
+            return 0.0
+        return self._spent[0] + self.period - now
+
+    def spend(self, count=1, now=None):
+        """Record count requests."""
+        now = time.monotonic() if now is None else now
+        self._spent.extend([now] * count)
+
+
+class PollingEngine:
+    """
+    Schedule of the status polls of every faucet of an account.
+
+    Each faucet is polled again after the delay picked by the policy from
+    its last status. An action submitted since the last poll brings the
+    next one forward to action_interval. When a budget is given, faucets
+    due once it is spent wait, the longest overdue polled first.
+    """
+
+    def __init__(self, parent, policy=None, budget=None):
+        """
+        Initialize PollingEngine object.
+
+        :param parent: RainCloudy object
+        :param policy: PollPolicy object, default intervals when None
+        :param budget: RequestBudget object of the account, unlimited when
+            None
+        :type parent: RainCloudy object
+        :type policy: PollPolicy object
+        :type budget: RequestBudget object
+        :return: PollingEngine object
+        :rtype: PollingEngine object
+        """
+        self._parent = parent
+        self.policy = policy or PollPolicy()
+        self.budget = budget
+        self.metrics = {"polls": 0, "polls_deferred": 0}
+        self.errors = 0
+        self.last_error = None
+        self._due = {}
+        self._polled_at = {}
+
+    def __repr__(self):
+        """Object representation."""
+        return "<{0}: {1} faucets>".format(self.__class__.__name__, len(self._due))
+
+    @staticmethod
+    def _key(faucet):
+        """Return the key of a faucet, kept when logging in again."""
+        # pylint: disable=protected-access
+        return (faucet._controller.serial, faucet.serial)
+
+    def _schedule(self, now):
+        """Return the faucets of the account with their next poll time."""
+        schedule = []
+        for controller in self._parent.controllers:
+            for faucet in controller.faucets:
+                key = self._key(faucet)
+                due = self._due.get(key, now)
+                age = faucet.action_age
+                polled_at = self._polled_at.get(key)
+                if age is not None and polled_at is not None:
+                    acted_at = now - age
+                    if acted_at > polled_at:
+                        due = min(due, acted_at + self.policy.action_interval)
+                schedule.append((due, faucet))
+        schedule.sort(key=lambda item: item[0])
+        return schedule
+
+    def due(self, now=None):
+        """
+        Return the faucets to poll now, within the budget.
+
+        :rtype: list of RainCloudyFaucet objects
+        """
+        now = time.monotonic() if now is None else now
+        faucets = [faucet for due, faucet in self._schedule(now) if due <= now]
+        if self.budget is not None:
+            allowed = self.budget.available(now)
+            self.metrics["polls_deferred"] += max(0, len(faucets) - allowed)
+            faucets = faucets[:allowed]
+        return faucets
+
+    def wait(self, now=None):
+        """Return the seconds until the next poll."""
+        now = time.monotonic() if now is None else now
+        schedule = self._schedule(now)
+        if not schedule:
+            return self.policy.idle_interval
+
+        wait = max(0.0, schedule[0][0] - now)
+        if self.budget is not None:
+            wait = max(wait, self.budget.wait(now))
+        return wait
+
+    def polled(self, faucets, now=None):
+        """
+        Schedule the next poll of faucets once their status was requested.
+
+        :param faucets: faucets polled, successfully or not
+        :type faucets: list of RainCloudyFaucet objects
+        """
+        now = time.monotonic() if now is None else now
+        if self.budget is not None:
+            self.budget.spend(len(faucets), now)
+        self.metrics["polls"] += len(faucets)
+        for faucet in faucets:
+            key = self._key(faucet)
+            self._polled_at[key] = now
+            self._due[key] = now + self.policy.delay(faucet)
+
+
+class Poller(PollingEngine):
+    """Poll the faucets of a RainCloudy object from a thread."""
+
+    def poll_once(self):
+        """
+        Update the faucets due, concurrently with update_workers > 1.
+
+        Errors are raised once the next polls were scheduled, so polling
+        can go on.
+
+        :return: seconds until the next poll
+        :rtype: float
+        """
+        faucets = self.due()
+        if faucets:
+            try:
+                self._parent.update_faucets(faucets)
+            finally:
+                self.polled(faucets)
+        return self.wait()
+
+    def run(self, stop=None):
+        """
+        Poll until stop is set.
+
+        Request and decoding errors are counted in errors and polling
+        goes on.
+
+        :param stop: event ending the loop, forever when None
+        :type stop: threading.Event
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                delay = self.poll_once()
+            except (requests.RequestException, RainCloudyException, ValueError) as err:
+                # the next polls were scheduled before the error was raised
+                self.errors += 1
+                self.last_error = err
+                delay = self.wait()
+            stop.wait(delay)
+
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+"""RainCloudy faucet status snapshots."""
+from __future__ import annotations
+
+import json
+from dataclasses import asdict, dataclass, replace
+from functools import partial
+from typing import Any, Callable, List, Optional, Union
+
+from raincloudy.const import JSON_DECODERS, STATUS_ZONES
+from raincloudy.exceptions import RainCloudyException
+
+try:
+    import orjson
+    from orjson import loads as _orjson_loads
+except ImportError:  # pragma: no cover
+    orjson = None
+    _orjson_loads = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover
+    msgspec = None
+
+# fields of the status endpoint with their types and the value used when
+# they are missing; any of them may also be null
+ZONE_FIELDS = (
+    ("next_water_cycle", (str,), None),
+    ("manual_mode_on", (bool,), False),
+    ("manual_watering_time", (int,), 0),
+    ("auto_watering_time", (int,), 0),
+    ("program_mode_on", (bool,), False),
+    ("rain_delay_mode", (int,), 0),
+    ("is_watering", (bool,), False),
+    ("zonename", (int, str), None),
+)
+FAUCET_FIELDS = (
+    ("current_time", (str,), None),
+    ("controller_status", (str,), None),
+    ("faucet_status", (str,), None),
+    ("battery_percent", (str, int), None),
+    ("rf_link", (bool,), None),
+    ("moisture_sensor_operable", (bool,), None),
+    ("channel_occupied", (bool,), None),
+    ("moisture_sensor_icon_display", (bool,), None),
+    ("moisture_sensor_graphic", (str,), None),
+)
+
+
+def _battery(value: Any) -> int | None:
+    """Return the battery percentage of a status, None if unknown."""
+    if value is None or value == "":
+        return None
+    try:
+        return int(str(value).strip().rstrip("%"))
+    except ValueError:
+        return None
+
+
+@dataclass(frozen=True)
+class ZoneStatus:
+    """
+    Status of a zone, as returned by the status endpoint.
+
+    :param next_water_cycle: time of the next scheduled watering
+    :param manual_mode_on: manual watering enabled
+    :param manual_watering_time: minutes of manual watering
+    :param auto_watering_time: minutes of the watering program
+    :param program_mode_on: watering program enabled
+    :param rain_delay_mode: days of rain delay
+    :param is_watering: watering reported by the site
+    :param zonename: zone index reported by the site
+    :param watering_time: the longest of the manual and program times,
+        derived from them
+    """
+
+    __slots__ = (
+        "next_water_cycle",
+        "manual_mode_on",
+        "manual_watering_time",
+        "auto_watering_time",
+        "program_mode_on",
+        "rain_delay_mode",
+        "is_watering",
+        "zonename",
+        "watering_time",
+    )
+
+    next_water_cycle: str | None
+    manual_mode_on: bool
+    manual_watering_time: int
+    auto_watering_time: int
+    program_mode_on: bool
+    rain_delay_mode: int
+    is_watering: bool
+    zonename: Any
+    watering_time: int
+
+    @classmethod
+    def decode(cls, data: dict[str, Any]) -> ZoneStatus:
+        """Return the ZoneStatus of an item of rain_delay_mode."""
+        return cls.from_fields(data.get)
+
+    @classmethod
+    def from_fields(cls, get: Callable[[str, Any], Any]) -> ZoneStatus:
+        """
+        Return the ZoneStatus read by a getter.
+
+        :param get: function returning a field, or the default given
+            when it is missing, like dict.get
+        """
+        manual_watering_time = get("manual_watering_time", None) or 0
+        auto_watering_time = get("auto_watering_time", None) or 0
+        return cls(
+            next_water_cycle=get("next_water_cycle", None),
+            manual_mode_on=get("manual_mode_on", False),
+            manual_watering_time=manual_watering_time,
+            auto_watering_time=auto_watering_time,
+            program_mode_on=get("program_mode_on", False),
+            rain_delay_mode=get("rain_delay_mode", 0),
+            is_watering=get("is_watering", False),
+            zonename=get("zonename", None),
+            watering_time=max(auto_watering_time, manual_watering_time),
+        )
+
+    def replace(self, **values: Any) -> ZoneStatus:
+        """Return a copy with values changed and derived fields updated."""
+        return self.decode({**self.to_dict(), **values})
+
+    def to_dict(self) -> dict[str, Any]:
+        """Return the status in the shape of the status endpoint."""
+        data = asdict(self)
+        del data["watering_time"]
+        return data
+
+
+@dataclass(frozen=True)
+class FaucetStatus:
+    """
+    Status of a faucet and its controller, decoded once per request.
+
+    :param current_time: time of the controller
+    :param controller_status: "Online" or "Offline"
+    :param faucet_status: "Online" or "Offline"
+    :param battery_percent: battery as returned by the site, like "66%"
+    :param rf_link: radio link between the faucet and its controller
+    :param moisture_sensor_operable: moisture sensor paired and working
+    :param channel_occupied: radio channel of the faucet in use
+    :param moisture_sensor_icon_display: moisture sensor icon shown
+    :param moisture_sensor_graphic: path of the moisture sensor icon
+    :param zones: status of every zone, by zone index
+    :param battery: battery percentage, derived from battery_percent
+    """
+
+    __slots__ = (
+        "current_time",
+        "controller_status",
+        "faucet_status",
+        "battery_percent",
+        "rf_link",
+        "moisture_sensor_operable",
+        "channel_occupied",
+        "moisture_sensor_icon_display",
+        "moisture_sensor_graphic",
+        "zones",
+        "battery",
+    )
+
+    current_time: str | None
+    controller_status: str | None
+    faucet_status: str | None
+    battery_percent: str | None
+    rf_link: bool | None
+    moisture_sensor_operable: bool | None
+    channel_occupied: bool | None
+    moisture_sensor_icon_display: bool | None
+    moisture_sensor_graphic: str | None
+    zones: tuple[ZoneStatus, ...]
+    battery: int | None
+
+    @classmethod
+    def decode(cls, data: dict[str, Any]) -> FaucetStatus:
+        """Return the FaucetStatus of a status endpoint response."""
+        return cls.from_fields(
+            data.get,
+            tuple(
+                ZoneStatus.decode(zone) for zone in data.get("rain_delay_mode") or ()
+            ),
+        )
+
+    @classmethod
+    def from_fields(
+        cls, get: Callable[[str, Any], Any], zones: tuple[ZoneStatus, ...]
+    ) -> FaucetStatus:
+        """
+        Return the FaucetStatus read by a getter.
+
+        :param get: function returning a field, or the default given
+            when it is missing, like dict.get
+        :param zones: status of every zone
+        """
+        battery_percent = get("battery_percent", None)
+        return cls(
+            current_time=get("current_time", None),
+            controller_status=get("controller_status", None),
+            faucet_status=get("faucet_status", None),
+            battery_percent=battery_percent,
+            rf_link=get("rf_link", None),
+            moisture_sensor_operable=get("moisture_sensor_operable", None),
+            channel_occupied=get("channel_occupied", None),
+            moisture_sensor_icon_display=get("moisture_sensor_icon_display", None),
+            moisture_sensor_graphic=get("moisture_sensor_graphic", None),
+            zones=zones,
+            battery=_battery(battery_percent),
+        )
+
+    def replace_zone(self, index: int, **values: Any) -> FaucetStatus:
+        """
+        Return a copy with values of a zone changed.
+
+        :param index: zone index, zone id - 1
+        :param values: ZoneStatus fields
+        """
+        zones = list(self.zones)
+        zones[index] = zones[index].replace(**values)
+        return replace(self, zones=tuple(zones))
+
+    def to_dict(self) -> dict[str, Any]:
+        """Return the status in the shape of the status endpoint."""
+        data = {
+            field: getattr(self, field) for field, _types, _default in FAUCET_FIELDS
+        }
+        data["rain_delay_mode"] = [zone.to_dict() for zone in self.zones]
+        return data
+
+
+@dataclass(frozen=True)
+class StatusChange:
+    """
+    Change of a field between two snapshots of a faucet.
+
+    :param zone: zone id, None for a field of the faucet
+    :param field: field of FAUCET_FIELDS or ZONE_FIELDS
+    :param old: previous value
+    :param new: current value
+    """
+
+    __slots__ = ("zone", "field", "old", "new")
+
+    zone: int | None
+    field: str
+    old: Any
+    new: Any
+
+    def __str__(self) -> str:
+        """Return the change like "zone 2 is_watering False -> True"."""
+        prefix = "" if self.zone is None else f"zone {self.zone} "
+        return f"{prefix}{self.field} {self.old!r} -> {self.new!r}"
+
+
+def diff_status(old: FaucetStatus, new: FaucetStatus) -> list[StatusChange]:
+    """
+    Return the fields changed between two snapshots of a faucet.
+
+    Derived fields are left out, their source fields are reported. Zones
+    equal in both snapshots are skipped without comparing their fields.
+
+    :param old: previous snapshot
+    :param new: current snapshot
+    """
+    if old is new:
+        return []
+
+    changes = [
+        StatusChange(None, field, getattr(old, field), getattr(new, field))
+        for field, _types, _default in FAUCET_FIELDS
+        if getattr(old, field) != getattr(new, field)
+    ]
+    for zone_id, (old_zone, new_zone) in enumerate(zip(old.zones, new.zones), 1):
+        if old_zone == new_zone:
+            continue
+        changes.extend(
+            StatusChange(
+                zone_id, field, getattr(old_zone, field), getattr(new_zone, field)
+            )
+            for field, _types, _default in ZONE_FIELDS
+            if getattr(old_zone, field) != getattr(new_zone, field)
+        )
+    return changes
+
+
+def _check_fields(data: Any, fields: tuple, name: str) -> None:
+    """Raise ValueError if data is not an object with fields of their types."""
+    if not isinstance(data, dict):
+        raise ValueError(f"Invalid {name} in status: {data!r}")
+    for field, types, _default in fields:
+        value = data.get(field)
+        if value is None:
+            continue
+        # bool is an int for isinstance, but not for JSON
+        if not isinstance(value, types) or (
+            isinstance(value, bool) and bool not in types
+        ):
+            raise ValueError(f"Invalid {field} in status: {value!r}")
+
+
+def validate_status(data: Any) -> dict[str, Any]:
+    """
+    Return a decoded status endpoint response once its shape was checked.
+
+    :param data: decoded JSON
+    :raises ValueError: if a field has an unexpected type or the status
+        does not list every zone
+    """
+    _check_fields(data, FAUCET_FIELDS, "faucet")
+    zones = data.get("rain_delay_mode")
+    if not isinstance(zones, list) or len(zones) != STATUS_ZONES:
+        raise ValueError(f"Status must list {STATUS_ZONES} zones: {zones!r}")
+    for zone in zones:
+        _check_fields(zone, ZONE_FIELDS, "zone")
+    return data
+
+
+def _struct(name: str, fields: tuple, *extra: tuple) -> Any:
+    """Return a msgspec Struct type of fields."""
+    return msgspec.defstruct(
+        name,
+        [(field, Optional[Union[types]], default) for field, types, default in fields]
+        + list(extra),
+        kw_only=True,
+    )
+
+
+if msgspec is not None:
+    _ZoneStruct = _struct("ZoneStruct", ZONE_FIELDS)
+    _MSGSPEC_DECODER = msgspec.json.Decoder(
+        _struct("FaucetStruct", FAUCET_FIELDS, ("rain_delay_mode", List[_ZoneStruct]))
+    )
+else:  # pragma: no cover
+    _MSGSPEC_DECODER = None
+
+
+def _decode_msgspec(content: bytes | str) -> FaucetStatus:
+    """Return the FaucetStatus of a response decoded by msgspec."""
+    try:
+        data = _MSGSPEC_DECODER.decode(content)
+    except msgspec.DecodeError as err:
+        raise ValueError(f"Invalid status: {err}") from err
+    if len(data.rain_delay_mode) != STATUS_ZONES:
+        raise ValueError(
+            f"Status must list {STATUS_ZONES} zones: {data.rain_delay_mode!r}"
+        )
+    return FaucetStatus.from_fields(
+        partial(getattr, data),
+        tuple(
+            ZoneStatus.from_fields(partial(getattr, zone))
+            for zone in data.rain_delay_mode
+        ),
+    )
+
+
+def default_decoder() -> str:
+    """Return the fastest JSON decoder installed."""
+    if msgspec is not None:
+        return "msgspec"
+    if orjson is not None:
+        return "orjson"
+    return "json"
+
+
+def decode_status(content: bytes | str, decoder: str | None = None) -> FaucetStatus:
+    """
+    Return the FaucetStatus of a status endpoint response body.
+
+    Every decoder checks the shape of the response and returns the same
+    snapshot. msgspec decodes straight into typed structs, orjson and
+    json into dicts checked by validate_status.
+
+    :param content: response body
+    :param decoder: one of JSON_DECODERS, the fastest installed when None
+    :raises ValueError: if the decoder is unknown or the body is not a
+        valid status
+    :raises RainCloudyException: if the decoder is not installed
+    """
+    decoder = decoder or default_decoder()
+    if decoder not in JSON_DECODERS:
+        raise ValueError(
+            "Valid decoders are: {}".format(", ".join(map(str, JSON_DECODERS)))
+        )
+
+    if decoder == "msgspec":
+        if msgspec is None:
+            raise RainCloudyException("Decoder msgspec is not installed")
+        return _decode_msgspec(content)
+    if decoder == "orjson":
+        if orjson is None:
+            raise RainCloudyException("Decoder orjson is not installed")
+        data = _orjson_loads(content)
+    else:
+        data = json.loads(content)
+    return FaucetStatus.decode(validate_status(data))
+
+
+# vim:sw=4:ts=4:et:
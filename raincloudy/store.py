@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""RainCloudy persistent stores.
+
+A store is any object with ``load(key)``, ``save(key, value)`` and
+``delete(key)`` methods holding JSON serializable values; ``load`` returns
+None for unknown keys.
+"""
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import threading
+from typing import Any
+
+
+class JSONFileStore:
+    """Store keeping every value in a single JSON file."""
+
+    def __init__(self, path: str | os.PathLike):
+        """
+        Initialize JSONFileStore object.
+
+        :param path: JSON file, created on the first save
+        :type path: string
+        :return: JSONFileStore object
+        :rtype: JSONFileStore object
+        """
+        self.path = os.fspath(path)
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        """Object representation."""
+        return f"<{self.__class__.__name__}: {self.path}>"
+
+    def _read(self) -> dict[str, Any]:
+        """Return the content of the file, empty when missing or corrupt."""
+        try:
+            with open(self.path, encoding="utf-8") as fdp:
+                data = json.load(fdp)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _write(self, data: dict[str, Any]) -> None:
+        """Replace the file atomically."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fdp:
+                json.dump(data, fdp)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def load(self, key: str) -> Any:
+        """Return the value saved under key, None when missing."""
+        with self._lock:
+            return self._read().get(key)
+
+    def save(self, key: str, value: Any) -> None:
+        """Save a value under key."""
+        with self._lock:
+            data = self._read()
+            data[key] = value
+            self._write(data)
+
+    def delete(self, key: str) -> None:
+        """Remove key from the store."""
+        with self._lock:
+            data = self._read()
+            if data.pop(key, None) is not None:
+                self._write(data)
+
+
+# vim:sw=4:ts=4:et:
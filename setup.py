@@ -21,7 +21,18 @@ setup(
     url="https://github.com/tchellomello/raincloudy",
     license="Apache License 2.0",
     include_package_data=True,
-    install_requires=["requests>=2.0", "beautifulsoup4", "urllib3>=1.22", "html5lib==1.1"],
+    install_requires=[
+        "requests>=2.0",
+        "beautifulsoup4",
+        "urllib3>=1.22",
+        "html5lib==1.1",
+    ],
+    extras_require={
+        "lxml": ["lxml"],
+        "selectolax": ["selectolax>=0.3.5"],
+        "orjson": ["orjson"],
+        "msgspec": ["msgspec"],
+    },
     test_suite="tests",
     keywords=[
         "garden",
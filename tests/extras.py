@@ -1,5 +1,7 @@
 """Helper methods for tests."""
+import logging
 import os
+import unittest
 
 USERNAME = "foo"
 PASSWORD = "secret"
@@ -9,6 +11,14 @@ CONTROLLER_TIMESTAMP = "02:00 AM"
 CSRFTOKEN = "AbCdEFJeCDnkC2pdmrywqBAbN9999999"
 FAUCET_NAME = "Faucet001"
 FAUCET_SERIAL = "1234"
+STATUS_PATH = "/get_cu_and_fu_status"
+
+BENCHMARK_LOGGER = logging.getLogger("tests.benchmark")
+
+# set RAINCLOUDY_SKIP_BENCHMARKS=1 to skip the timing tests
+benchmark_test = unittest.skipIf(
+    os.environ.get("RAINCLOUDY_SKIP_BENCHMARKS"), "benchmarks skipped"
+)
 
 
 def load_fixture(filename):
@@ -16,3 +26,301 @@ def load_fixture(filename):
     path = os.path.join(os.path.dirname(__file__), "fixtures", filename)
     with open(path) as fdp:
         return fdp.read()
+
+
+def benchmark(func, *args, number=20):
+    """Return the best wall time in seconds of func(*args) over number runs."""
+    import timeit
+
+    return min(timeit.repeat(lambda: func(*args), number=1, repeat=number))
+
+
+def report(name, **timings):
+    """Log the timings in seconds of a benchmark."""
+    BENCHMARK_LOGGER.info(
+        "%s: %s",
+        name,
+        " ".join(f"{key} {value:.5f}s" for key, value in timings.items()),
+    )
+
+
+class MockServer:
+    """Local RainCloud web server with many controllers and faucets.
+
+    Every login gets its own session cookie and the selected controller
+    and faucet are stored per session, like on the real site.
+    """
+
+    MODULES = (
+        "raincloudy.core",
+        "raincloudy.controller",
+        "raincloudy.faucet",
+        "raincloudy.aio.core",
+        "raincloudy.aio.controller",
+        "raincloudy.aio.faucet",
+    )
+
+    def __init__(self, controllers=1, faucets=1, latency=0.0):
+        """Start the server in a background thread."""
+        import threading
+        from http.server import ThreadingHTTPServer
+
+        self.controllers = controllers
+        self.faucets = faucets
+        self.latency = latency
+        self.requests = []
+        self.forms = []
+        self.sessions = {}
+        # status of login form submissions and of every other request
+        self.login_status = 302
+        self.forbidden = False
+        # status of every status request when set, like 503 during an outage
+        self.status_error = None
+        self._lock = threading.Lock()
+
+        class Server(ThreadingHTTPServer):
+            """Server accepting bursts of concurrent connections."""
+
+            daemon_threads = True
+            request_queue_size = 128
+
+        self.httpd = Server(("127.0.0.1", 0), self._handler())
+        self.url = "http://localhost:{}".format(self.httpd.server_address[1])
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Stop the server."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def patch(self):
+        """Return a patcher pointing every raincloudy endpoint to the server."""
+        import importlib
+        from contextlib import ExitStack
+        from unittest import mock
+
+        from raincloudy import const
+
+        endpoints = {
+            name: getattr(const, name).replace(const.API_URL, self.url)
+            for name in dir(const)
+            if name.endswith("_ENDPOINT")
+        }
+        stack = ExitStack()
+        for module_name in self.MODULES:
+            module = importlib.import_module(module_name)
+            for name, value in endpoints.items():
+                if hasattr(module, name):
+                    stack.enter_context(mock.patch.object(module, name, value))
+        return stack
+
+    @staticmethod
+    def zone_name(controller, faucet, zone):
+        """Return the zone name listed by the setup page."""
+        return "Z{0}{1}{2}".format(controller, faucet, zone)
+
+    @staticmethod
+    def select(element_id, name, labels, selected):
+        """Return a select element."""
+        options = "".join(
+            "<option value='{0}'{1}>{2}</option>".format(
+                index, " selected='selected'" if index == selected else "", label
+            )
+            for index, label in enumerate(labels)
+        )
+        return "<select id='{0}' name='{1}'>{2}</select>".format(
+            element_id, name, options
+        )
+
+    def serials(self):
+        """Return the faucet serials of every controller serial."""
+        return {
+            "CTRL{}".format(controller): [
+                "F{0}{1}".format(controller, faucet) for faucet in range(self.faucets)
+            ]
+            for controller in range(self.controllers)
+        }
+
+    def home_page(self, controller, faucet):
+        """Return the home page with a controller and faucet selected."""
+        return "<html><body><form>{0}{1}</form></body></html>".format(
+            self.select(
+                "id_select_controller",
+                "select_controller",
+                ["Controller{}".format(index) for index in range(self.controllers)],
+                controller,
+            ),
+            self.select(
+                "id_select_faucet",
+                "select_faucet",
+                ["Faucet{}".format(index) for index in range(self.faucets)],
+                faucet,
+            ),
+        )
+
+    def setup_page(self, controller, faucet):
+        """Return the setup page with a controller and faucet selected."""
+        controllers = [
+            "{0} - CTRL{0}".format(index) for index in range(self.controllers)
+        ]
+        faucets = [
+            "{0} - F{1}{0}".format(index, controller) for index in range(self.faucets)
+        ]
+        zones = [
+            "{0} - {1}".format(zone, self.zone_name(controller, faucet, zone))
+            for zone in range(1, 5)
+        ]
+        return "<html><body><form>{0}{1}{2}</form></body></html>".format(
+            self.select(
+                "id_select_controller2", "select_controller", controllers, controller
+            ),
+            self.select("id_select_faucet2", "select_faucet", faucets, faucet),
+            self.select("id_select_zone", "select_zone", zones, 0),
+        )
+
+    def _handler(self):
+        """Return the request handler class bound to this server."""
+        import time
+        import uuid
+        from http.server import BaseHTTPRequestHandler
+        from urllib.parse import parse_qs, urlsplit
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Serve the RainCloud endpoints."""
+
+            def log_message(self, *args):
+                """Silence request logging."""
+
+            def _session(self):
+                for cookie in self.headers.get("Cookie", "").split(";"):
+                    key, _, value = cookie.strip().partition("=")
+                    if key == "sessionid":
+                        return value
+                return None
+
+            def _reply(self, status=200, body="", headers=None, content_type=None):
+                data = body.encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type or "text/html")
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _handle(self, method):
+                time.sleep(server.latency)
+                url = urlsplit(self.path)
+                path = url.path
+                length = int(self.headers.get("Content-Length") or 0)
+                form = parse_qs(self.rfile.read(length).decode())
+                session = self._session()
+                with server._lock:
+                    server.requests.append((method, path, session))
+                    if method == "POST":
+                        server.forms.append((path, form))
+
+                if path == "/login/" and method == "GET":
+                    return self._reply(
+                        headers={"Set-Cookie": "csrftoken=TOKEN; Path=/"}
+                    )
+                if path == "/login/" and server.login_status != 302:
+                    return self._reply(server.login_status)
+                if path == "/login/":
+                    session = uuid.uuid4().hex
+                    with server._lock:
+                        server.sessions[session] = [0, 0]
+                    return self._reply(
+                        302,
+                        headers={
+                            "Set-Cookie": "sessionid={}; Max-Age=3600; Path=/".format(
+                                session
+                            ),
+                            "Location": "/home",
+                        },
+                    )
+                if session not in server.sessions and path == "/home":
+                    return self._reply(302, headers={"Location": "/login/"})
+                if session not in server.sessions or server.forbidden:
+                    return self._reply(403)
+                if path in ("/home", "/setup/"):
+                    with server._lock:
+                        state = server.sessions[session]
+                        if "select_controller" in form:
+                            state[:] = [int(form["select_controller"][0]), 0]
+                        if "select_faucet" in form:
+                            state[1] = int(form["select_faucet"][0])
+                        controller, faucet = state
+                    if path == "/home":
+                        return self._reply(body=server.home_page(controller, faucet))
+                    return self._reply(body=server.setup_page(controller, faucet))
+                if path == STATUS_PATH:
+                    if server.status_error is not None:
+                        return self._reply(server.status_error)
+                    query = parse_qs(url.query)
+                    faucets = server.serials().get(query["controller_serial"][0])
+                    if query["faucet_serial"][0] not in (faucets or []):
+                        return self._reply(404)
+                    return self._reply(
+                        body=load_fixture("get_cu_and_fu_status.json"),
+                        content_type="application/json",
+                    )
+                return self._reply()
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                """Handle GET requests."""
+                self._handle("GET")
+
+            def do_POST(self):  # pylint: disable=invalid-name
+                """Handle POST requests."""
+                self._handle("POST")
+
+        return Handler
+
+
+def home_forms(server):
+    """Return the forms posted to the home page of server."""
+    return [form for path, form in server.forms if path == "/home"]
+
+
+def targets(server):
+    """Return the controller and faucet of every home form, once per run."""
+    runs = []
+    for form in home_forms(server):
+        target = (form["select_controller"][0], form["select_faucet"][0])
+        if not runs or runs[-1] != target:
+            runs.append(target)
+    return runs
+
+
+def status_requests(server):
+    """Return the status requests sent to server."""
+    return [request for request in server.requests if request[1] == STATUS_PATH]
+
+
+class MockServerMixin:
+    """Start a MockServer and point the raincloudy endpoints to it."""
+
+    controllers = 1
+    faucets = 1
+    latency = 0.0
+
+    def setUp(self):
+        """Start the mock server."""
+        self.server = MockServer(self.controllers, self.faucets, self.latency)
+        patcher = self.server.patch()
+        patcher.__enter__()
+        # cleanups run after tearDown, once the clients are closed
+        self.addCleanup(self.server.close)
+        self.addCleanup(patcher.__exit__, None, None, None)
+
+
+class MockServerTestCase(MockServerMixin, unittest.TestCase):
+    """Test case of the sync client against a MockServer."""
+
+
+class AsyncMockServerTestCase(MockServerMixin, unittest.IsolatedAsyncioTestCase):
+    """Test case of the aio client against a MockServer."""
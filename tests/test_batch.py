@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""Test batched zone changes."""
+from unittest import mock
+
+from tests.extras import PASSWORD, USERNAME, AsyncMockServerTestCase, MockServerTestCase
+
+
+def count(server, method, path):
+    """Return the number of requests sent to path."""
+    return len([1 for request in server.requests if request[:2] == (method, path)])
+
+
+class TestFaucetBatch(MockServerTestCase):
+    """Unit tests for RainCloudyFaucet.batch with the sync client."""
+
+    def setUp(self):
+        """Start the mock server and log in."""
+        from raincloudy.core import RainCloudy
+
+        super().setUp()
+        self.faucet = RainCloudy(USERNAME, PASSWORD).controllers[0].faucets[0]
+        del self.server.requests[:]
+        del self.server.forms[:]
+
+    def test_batch(self):
+        """Test changes to several zones are submitted with one form."""
+        with self.faucet.batch() as batch:
+            batch.set_manual_watering(1, 15)
+            batch.set_rain_delay(2, 3)
+            batch.set_auto_watering(3, True)
+            batch.set_auto_watering(2, False)
+            batch.set_rain_delay(4, 9)
+
+        self.assertEqual(count(self.server, "GET", "/get_cu_and_fu_status"), 1)
+        self.assertEqual(count(self.server, "POST", "/home"), 1)
+        _, form = self.server.forms[-1]
+        self.assertEqual(form["zone1_select_manual_mode"], ["15"])
+        self.assertEqual(form["zone1_rain_delay_select"], ["3days"])
+        self.assertEqual(form["zone3_program_toggle"], ["on"])
+        self.assertNotIn("zone2_program_toggle", form)
+        self.assertEqual(form["zone3_rain_delay_select"], ["4days"])
+
+        self.assertEqual(
+            batch.results,
+            {
+                1: {"manual_watering": 15},
+                2: {"rain_delay": "3days", "auto_watering": False},
+                3: {"auto_watering": True},
+                4: {"rain_delay": None},
+            },
+        )
+        self.assertEqual(self.faucet.zone1.watering_time, 15)
+        self.assertEqual(self.faucet.zone2.rain_delay, 3)
+        self.assertFalse(self.faucet.zone2.auto_watering)
+        self.assertTrue(self.faucet.zone3.auto_watering)
+
+    def test_turn_off(self):
+        """Test zones turned off are switched on first."""
+        self.faucet._parent.turn_off_delay = 0.05
+        batch = self.faucet.batch()
+        batch.set_manual_watering(2, "off")
+        batch.set_manual_watering(3, "on")
+        self.assertEqual(batch.submit(), batch.results)
+
+        # the final form is sent by a timer
+        self.assertEqual(count(self.server, "POST", "/home"), 1)
+        batch.future.result(timeout=5)
+        forms = [form for path, form in self.server.forms if path == "/home"]
+        self.assertEqual(len(forms), 2)
+        self.assertEqual(forms[0]["zone2_select_manual_mode"], ["ON"])
+        self.assertEqual(forms[1]["zone2_select_manual_mode"], ["OFF"])
+        self.assertEqual(forms[1]["zone3_select_manual_mode"], ["60"])
+        self.assertFalse(self.faucet.zone2.manual_watering)
+
+    def test_queued(self):
+        """Test batches go through the command queue like the setters."""
+        self.faucet._parent.turn_off_delay = 0.1
+        batch = self.faucet.batch()
+        batch.set_manual_watering(1, "off")
+        batch.set_auto_watering(2, True)
+        batch.submit()
+        # sent after the final form of the batch, which does not revert it
+        self.faucet.zone2.auto_watering = False
+        self.assertTrue(batch.future.done())
+
+        forms = [form for path, form in self.server.forms if path == "/home"]
+        self.assertEqual(forms[-2]["zone2_program_toggle"], ["on"])
+        self.assertNotIn("zone2_program_toggle", forms[-1])
+        self.assertFalse(self.faucet.zone2.auto_watering)
+        self.assertEqual(self.faucet._parent.metrics["commands_queued"], 3)
+
+    def test_invalid_changes(self):
+        """Test invalid changes raise and errors cancel the batch."""
+        batch = self.faucet.batch()
+        self.assertRaises(ValueError, batch.set_manual_watering, 1, 7)
+        self.assertRaises(ValueError, batch.set_auto_watering, 5, True)
+        self.assertEqual(batch.submit(), {})
+
+        with self.assertRaises(RuntimeError):
+            with self.faucet.batch() as batch:
+                batch.set_auto_watering(1, True)
+                raise RuntimeError
+        self.assertEqual(self.server.requests, [])
+
+
+class TestFaucetBatchAsync(AsyncMockServerTestCase):
+    """Unit tests for RainCloudyFaucet.batch with the aio client."""
+
+    @mock.patch("raincloudy.aio.faucet.asyncio.sleep")
+    async def test_batch(self, sleep):
+        """Test changes to several zones are submitted with one form."""
+        from raincloudy.aio.core import RainCloudy
+
+        rdy = RainCloudy(USERNAME, PASSWORD)
+        await rdy.login()
+        faucet = rdy.controllers[0].faucets[0]
+        del self.server.requests[:]
+
+        async with faucet.batch() as batch:
+            batch.set_manual_watering(1, "off")
+            batch.set_rain_delay(4, 1)
+            batch.set_auto_watering(2, True)
+        await rdy.client.close()
+
+        sleep.assert_awaited_once_with(1)
+        self.assertEqual(count(self.server, "GET", "/get_cu_and_fu_status"), 1)
+        self.assertEqual(count(self.server, "POST", "/home"), 2)
+        _, form = self.server.forms[-1]
+        self.assertEqual(form["zone1_select_manual_mode"], ["OFF"])
+        self.assertEqual(form["zone3_rain_delay_select"], ["1day"])
+        self.assertEqual(form["zone2_program_toggle"], ["on"])
+        self.assertEqual(faucet.zone4.rain_delay, 1)
+        self.assertEqual(len(batch.results), 3)
+
+    @mock.patch("raincloudy.aio.faucet.asyncio.sleep")
+    async def test_queued(self, sleep):
+        """Test batches go through the command queue like the setters."""
+        import asyncio
+
+        from raincloudy.aio.core import RainCloudy
+
+        rdy = RainCloudy(USERNAME, PASSWORD)
+        await rdy.login()
+        faucet = rdy.controllers[0].faucets[0]
+        del self.server.forms[:]
+
+        batch = faucet.batch()
+        batch.set_manual_watering(1, "off")
+        batch.set_auto_watering(2, True)
+        # queued after the batch, so it replaces its change of zone2
+        await asyncio.gather(batch.submit(), faucet.zone2.set_auto_watering(False))
+        await rdy.client.close()
+
+        sleep.assert_awaited_once_with(1)
+        forms = [form for path, form in self.server.forms if path == "/home"]
+        self.assertEqual(len(forms), 2)
+        self.assertNotIn("zone2_program_toggle", forms[-1])
+        self.assertFalse(faucet.zone2.auto_watering)
+        self.assertEqual(rdy.metrics["commands_merged"], 1)
+
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""Test the status change listeners."""
+
+from tests.extras import PASSWORD, USERNAME, AsyncMockServerTestCase, MockServerTestCase
+
+
+class TestListeners(MockServerTestCase):
+    """Unit tests for add_listener with the sync client."""
+
+    faucets = 2
+
+    def setUp(self):
+        """Start the mock server and log in."""
+        from raincloudy.core import RainCloudy
+
+        super().setUp()
+        self.rdy = RainCloudy(USERNAME, PASSWORD, status_max_age=60)
+        self.events = []
+        self.remove = self.rdy.add_listener(
+            lambda faucet, changes: self.events.append((faucet, changes))
+        )
+
+    def test_changes(self):
+        """Test listeners get the changes of settings and refreshes."""
+        faucet = self.rdy.controllers[0].faucets[1]
+        self.rdy.update()
+        self.assertEqual(self.events, [])
+
+        faucet.zone1.auto_watering = True
+        self.assertEqual(len(self.events), 1)
+        source, changes = self.events[0]
+        self.assertIs(source, faucet)
+        self.assertEqual(
+            [str(change) for change in changes],
+            ["zone 1 program_mode_on False -> True"],
+        )
+
+        # the site still reports the program off
+        faucet.update()
+        self.assertEqual(
+            [str(change) for change in self.events[1][1]],
+            ["zone 1 program_mode_on True -> False"],
+        )
+
+        self.remove()
+        self.remove()
+        faucet.zone1.auto_watering = True
+        self.assertEqual(len(self.events), 2)
+
+    def test_listener_errors(self):
+        """Test a failing listener is logged without aborting updates."""
+        from raincloudy.core import RainCloudy
+
+        rdy = RainCloudy(USERNAME, PASSWORD, update_workers=2)
+        faucets = rdy.controllers[0].faucets
+
+        def fail(faucet, changes):
+            raise RuntimeError("listener failed")
+
+        rdy.add_listener(fail)
+        rdy.add_listener(lambda faucet, changes: self.events.append(faucet))
+        for faucet in faucets:
+            faucet.zone1.auto_watering = True
+        del self.events[:]
+        with self.assertLogs("raincloudy.core", level="ERROR") as logs:
+            rdy.update()
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(self.events, faucets)
+        for faucet in faucets:
+            self.assertFalse(faucet.zone1.auto_watering)
+
+
+class TestListenersAsync(AsyncMockServerTestCase):
+    """Unit tests for add_listener with the aio client."""
+
+    async def test_changes(self):
+        """Test listeners get the changes of settings."""
+        from raincloudy.aio.core import RainCloudy
+
+        rdy = RainCloudy(USERNAME, PASSWORD, status_max_age=60)
+        events = []
+        rdy.add_listener(lambda faucet, changes: events.append(changes))
+        await rdy.login()
+        await rdy.update()
+        self.assertEqual(events, [])
+
+        zone = rdy.controllers[0].faucets[0].zone4
+        await zone.set_rain_delay(2)
+        self.assertEqual(
+            [str(change) for change in events[0]], ["zone 4 rain_delay_mode 4 -> 2"]
+        )
+        await rdy.client.close()
+
+
+# vim:sw=4:ts=4:et:
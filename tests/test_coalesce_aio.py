@@ -0,0 +1,75 @@
+"""Test coalescing of concurrent aio status requests."""
+import asyncio
+
+import aiohttp
+
+from tests.extras import PASSWORD, USERNAME, AsyncMockServerTestCase, status_requests
+
+
+class TestStatusCoalescing(AsyncMockServerTestCase):
+    """Unit tests for RainCloudy.coalesce_status."""
+
+    faucets = 2
+    latency = 0.05
+
+    async def asyncSetUp(self):
+        """Start the mock server and log in."""
+        from raincloudy.aio.core import RainCloudy
+
+        self.rdy = RainCloudy(USERNAME, PASSWORD)
+        await self.rdy.login()
+        self.faucet = self.rdy.controllers[0].faucets[0]
+        del self.server.requests[:]
+
+    async def asyncTearDown(self):
+        """Close the client."""
+        await self.rdy.client.close()
+
+    async def test_coalesced(self):
+        """Test concurrent refreshes of a faucet share one request."""
+        metrics = dict(self.rdy.metrics)
+        other = self.rdy.controllers[0].faucets[1]
+        await asyncio.gather(
+            self.faucet.update(),
+            self.faucet.update(),
+            self.faucet.zone1.update(),
+            self.faucet.zone2.preupdate(),
+            other.update(),
+        )
+
+        self.assertEqual(len(status_requests(self.server)), 2)
+        self.assertEqual(
+            self.rdy.metrics["status_requests"] - metrics["status_requests"], 2
+        )
+        self.assertEqual(
+            self.rdy.metrics["status_coalesced"] - metrics["status_coalesced"], 3
+        )
+        self.assertEqual(self.rdy._status_fetches, {})
+
+        # a later refresh sends a new request
+        await self.faucet.update()
+        self.assertEqual(len(status_requests(self.server)), 3)
+
+    async def test_shared_error(self):
+        """Test every caller receives the error of the shared request."""
+        self.faucet._id = "GONE"
+        results = await asyncio.gather(
+            self.faucet.update(), self.faucet.update(), return_exceptions=True
+        )
+        self.assertEqual(len(status_requests(self.server)), 1)
+        for result in results:
+            self.assertIsInstance(result, aiohttp.ClientResponseError)
+
+    async def test_cancelled_caller(self):
+        """Test cancelling a caller does not cancel the shared request."""
+        first = asyncio.ensure_future(self.faucet.update())
+        second = asyncio.ensure_future(self.faucet.update())
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await second
+        self.assertTrue(first.cancelled())
+        self.assertEqual(len(status_requests(self.server)), 1)
+        self.assertEqual(self.faucet.zone2.watering_time, 15)
+
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""Test the action command queue."""
+import asyncio
+import time
+from concurrent.futures import CancelledError
+
+import requests
+
+from tests.extras import (
+    PASSWORD,
+    USERNAME,
+    AsyncMockServerTestCase,
+    MockServerTestCase,
+    home_forms,
+    targets,
+)
+
+
+class TestCommandQueue(MockServerTestCase):
+    """Unit tests for RainCloudy.commands with the sync client."""
+
+    controllers = 2
+    faucets = 2
+
+    def setUp(self):
+        """Start the mock server and log in."""
+        from raincloudy.core import RainCloudy
+
+        super().setUp()
+        self.rdy = RainCloudy(USERNAME, PASSWORD, status_max_age=60)
+        del self.server.forms[:]
+
+    def block(self, zone):
+        """Queue a setting and hold the worker while it is being sent."""
+        self.rdy.action_lock.acquire()
+        future = self.rdy.commands.submit(zone, "auto_watering", True)
+        deadline = time.monotonic() + 5
+        while self.rdy.commands.depth and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return future
+
+    def test_merge(self):
+        """Test superseded settings are cancelled before being sent."""
+        faucet = self.rdy.controllers[0].faucets[0]
+        commands = self.rdy.commands
+        first = self.block(faucet.zone1)
+
+        replaced = commands.submit(faucet.zone2, "manual_watering", 30)
+        watering = commands.submit(faucet.zone2, "manual_watering", 45)
+        delay = commands.submit(faucet.zone3, "rain_delay", 2)
+        self.assertTrue(replaced.cancelled())
+        self.assertEqual(commands.depth, 2)
+        self.rdy.action_lock.release()
+
+        self.assertTrue(first.result(timeout=5))
+        self.assertEqual(watering.result(timeout=5), 45)
+        self.assertEqual(delay.result(timeout=5), "2days")
+        commands.join(timeout=5)
+        self.assertRaises(CancelledError, replaced.result)
+
+        # the remaining settings of the faucet share a form
+        form = home_forms(self.server)[-1]
+        self.assertEqual(form["zone2_select_manual_mode"], ["45"])
+        self.assertEqual(form["zone2_rain_delay_select"], ["2days"])
+        for form in home_forms(self.server):
+            self.assertNotEqual(form["zone2_select_manual_mode"], ["30"])
+        self.assertEqual(faucet.zone2.lookup_attr("manual_watering_time"), 45)
+        self.assertEqual(faucet.zone3.rain_delay, 2)
+
+        metrics = self.rdy.metrics
+        self.assertEqual(metrics["commands_queued"], 4)
+        self.assertEqual(metrics["commands_merged"], 1)
+        self.assertEqual(metrics["command_queue_max_depth"], 2)
+        self.assertGreater(metrics["command_latency_max"], 0)
+        self.assertEqual(commands.depth, 0)
+
+    def test_group_by_faucet(self):
+        """Test settings queued together are sent faucet after faucet."""
+        faucets = [
+            faucet
+            for controller in self.rdy.controllers
+            for faucet in controller.faucets
+        ]
+        self.block(faucets[3].zone1)
+        futures = [
+            self.rdy.commands.submit(faucet.zones[zone], "auto_watering", True)
+            for zone in range(2, 4)
+            for faucet in faucets[:3]
+        ]
+        self.rdy.action_lock.release()
+        self.rdy.commands.join(timeout=5)
+
+        for future in futures:
+            self.assertTrue(future.result())
+        # the selected faucet first, then the others once each
+        self.assertEqual(
+            targets(self.server), [("1", "1"), ("0", "0"), ("0", "1"), ("1", "0")]
+        )
+        for faucet in faucets[:3]:
+            self.assertTrue(faucet.zone3.auto_watering)
+            self.assertTrue(faucet.zone4.auto_watering)
+
+    def test_invalid_settings(self):
+        """Test invalid settings raise or are ignored without a request."""
+        zone = self.rdy.controllers[0].faucets[0].zone1
+        self.assertRaises(ValueError, self.rdy.commands.submit, zone, "foo", 1)
+        self.assertRaises(
+            ValueError, self.rdy.commands.submit, zone, "manual_watering", 7
+        )
+        self.assertIsNone(self.rdy.commands.submit(zone, "rain_delay", 9).result())
+        zone.rain_delay = "foobar"
+        self.assertEqual(self.server.forms, [])
+        self.assertEqual(self.rdy.metrics["commands_queued"], 0)
+
+    def test_setters(self):
+        """Test setters wait until their setting was sent."""
+        zones = self.rdy.controllers[1].faucets[0].zones
+        zones[0].manual_watering = 15
+        zones[1].rain_delay = 3
+        zones[2].auto_watering = True
+        self.assertEqual(len(home_forms(self.server)), 4)
+        self.assertEqual(zones[0].lookup_attr("manual_watering_time"), 15)
+        self.assertEqual(zones[1].rain_delay, 3)
+        self.assertTrue(zones[2].auto_watering)
+        self.assertEqual(self.rdy.metrics["commands_queued"], 3)
+
+    def test_errors(self):
+        """Test errors are raised by the futures of their settings."""
+        faucet = self.rdy.controllers[0].faucets[0]
+        serial, faucet._id = faucet._id, "F99"
+        self.rdy.status_max_age = None
+        future = self.rdy.commands.submit(faucet.zone1, "auto_watering", True)
+        self.assertIsInstance(future.exception(timeout=5), requests.HTTPError)
+        self.assertEqual(self.server.forms, [])
+
+        faucet._id = serial
+        faucet.zone1.auto_watering = True
+        self.assertTrue(faucet.zone1.auto_watering)
+
+    def test_setter_from_listener(self):
+        """Test a listener changing a setting does not wait for itself."""
+        faucet = self.rdy.controllers[0].faucets[0]
+        futures = []
+
+        def listener(source, changes):
+            for change in changes:
+                if change.zone == 1 and change.field == "program_mode_on":
+                    futures.append(source.zone2.turn_off())
+                    source.zone2.auto_watering = True
+
+        self.rdy.add_listener(listener)
+        faucet.zone1.auto_watering = True
+        self.rdy.commands.join(timeout=5)
+        self.assertEqual(futures[0].result(timeout=5), "OFF")
+        self.assertTrue(faucet.zone2.auto_watering)
+        self.assertEqual(self.rdy.commands.depth, 0)
+
+    def test_setter_from_deferred_form(self):
+        """Test a listener of a deferred form does not wait for the queue."""
+        self.rdy.turn_off_delay = 0.1
+        faucet = self.rdy.controllers[0].faucets[0]
+        commands = self.rdy.commands
+
+        def listener(source, changes):
+            for change in changes:
+                if change.field == "rain_delay_mode":
+                    source.zone3.auto_watering = True
+
+        self.rdy.add_listener(listener)
+        futures = [
+            commands.submit(faucet.zone1, "manual_watering", "off"),
+            commands.submit(faucet.zone2, "rain_delay", 2),
+        ]
+        self.assertEqual(
+            [future.result(timeout=5) for future in futures], ["OFF", "2days"]
+        )
+        commands.join(timeout=5)
+        self.assertTrue(faucet.zone3.auto_watering)
+
+    def test_turn_off_errors(self):
+        """Test a turn-off raises if its ON form could not be sent."""
+        faucet = self.rdy.controllers[0].faucets[0]
+        faucet._id = "F99"
+        self.rdy.status_max_age = None
+        with self.assertRaises(requests.HTTPError):
+            faucet.zone1.manual_watering = "off"
+        with self.assertRaises(requests.HTTPError):
+            faucet.zone1.turn_off()
+
+
+class TestCommandQueueAsync(AsyncMockServerTestCase):
+    """Unit tests for RainCloudy.commands with the aio client."""
+
+    controllers = 2
+    faucets = 2
+
+    async def test_merge(self):
+        """Test settings queued together are merged by faucet."""
+        from raincloudy.aio.core import RainCloudy
+
+        rdy = RainCloudy(USERNAME, PASSWORD, status_max_age=60)
+        await rdy.login()
+        del self.server.forms[:]
+        first = rdy.controllers[0].faucets[0]
+        second = rdy.controllers[1].faucets[1]
+
+        commands = rdy.commands
+        replaced = commands.submit(first.zone1, "manual_watering", 15)
+        watering = commands.submit(first.zone1, "manual_watering", 30)
+        program = commands.submit(second.zone2, "auto_watering", True)
+        delay = commands.submit(first.zone4, "rain_delay", 1)
+        self.assertEqual(commands.depth, 3)
+        await commands.join()
+
+        self.assertTrue(replaced.cancelled())
+        self.assertEqual(await watering, 30)
+        self.assertTrue(await program)
+        self.assertEqual(await delay, "1day")
+        self.assertEqual(targets(self.server), [("0", "0"), ("1", "1")])
+        # one switching and one action form per faucet
+        self.assertEqual(len(home_forms(self.server)), 4)
+        self.assertEqual(first.zone4.rain_delay, 1)
+        self.assertEqual(rdy.metrics["commands_merged"], 1)
+        self.assertEqual(rdy.metrics["command_queue_max_depth"], 3)
+        await rdy.client.close()
+
+    async def test_setters(self):
+        """Test concurrent setters share a form."""
+        from raincloudy.aio.core import RainCloudy
+
+        rdy = RainCloudy(USERNAME, PASSWORD, status_max_age=60)
+        await rdy.login()
+        del self.server.forms[:]
+        faucet = rdy.controllers[0].faucets[1]
+
+        results = await asyncio.gather(
+            *[zone.set_auto_watering(True) for zone in faucet.zones],
+            faucet.zone1.set_auto_watering(False),
+        )
+        # disabling returns True once sent, a replaced setting None
+        self.assertEqual(results, [None, True, True, True, True])
+        self.assertEqual(len(home_forms(self.server)), 2)
+        self.assertFalse(faucet.zone1.auto_watering)
+        self.assertTrue(faucet.zone4.auto_watering)
+        with self.assertRaises(ValueError):
+            await faucet.zone1.set_manual_watering_time(7)
+        await rdy.client.close()
+
+    async def test_rain_delay_field(self):
+        """Test a rain delay is posted to the same field alone or batched."""
+        from raincloudy.aio.core import RainCloudy
+
+        rdy = RainCloudy(USERNAME, PASSWORD, status_max_age=60)
+        await rdy.login()
+        del self.server.forms[:]
+        faucet = rdy.controllers[0].faucets[0]
+
+        await faucet.zone2.set_rain_delay(3)
+        self.assertEqual(
+            home_forms(self.server)[-1]["zone1_rain_delay_select"], ["3days"]
+        )
+        await asyncio.gather(
+            faucet.zone2.set_rain_delay(5), faucet.zone3.set_auto_watering(True)
+        )
+        form = home_forms(self.server)[-1]
+        self.assertEqual(form["zone1_rain_delay_select"], ["5days"])
+        self.assertEqual(faucet.zone2.rain_delay, 5)
+        await rdy.client.close()
+
+
+# vim:sw=4:ts=4:et:
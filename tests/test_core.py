@@ -1,6 +1,21 @@
 # -*- coding: utf-8 -*-
 """Test raincloudy.core."""
-from tests.extras import CONTROLLER_SERIAL
+import requests_mock
+
+from raincloudy.const import (
+    HOME_ENDPOINT,
+    LOGIN_ENDPOINT,
+    SETUP_ENDPOINT,
+    STATUS_ENDPOINT,
+)
+from tests.extras import (
+    CONTROLLER_NAME,
+    CONTROLLER_SERIAL,
+    FAUCET_NAME,
+    PASSWORD,
+    USERNAME,
+    load_fixture,
+)
 from tests.test_base import UnitTestBase
 
 
@@ -22,9 +37,8 @@ class TestRainCloudyCore(UnitTestBase):
 
     def test_attributes(self):
         """Test core attributes."""
-        from bs4 import BeautifulSoup
-
         from raincloudy.controller import RainCloudyController
+        from raincloudy.helpers import LazyPage, PageModel
 
         self.assertTrue(hasattr(self.rdy, "client"))
         self.assertTrue(hasattr(self.rdy, "controllers"))
@@ -41,12 +55,45 @@ class TestRainCloudyCore(UnitTestBase):
         self.assertEqual(1, len(self.rdy.controllers))
         self.assertIsInstance(self.rdy.controllers[0], RainCloudyController)
 
-        self.assertIsInstance(self.rdy.html["home"], BeautifulSoup)
-        self.assertIsInstance(self.rdy.html["setup"], BeautifulSoup)
+        self.assertIsInstance(self.rdy.html["home"], LazyPage)
+        self.assertIsInstance(self.rdy.html["setup"], PageModel)
         self.assertIsNone(self.rdy.html["program"])
         self.assertIsNone(self.rdy.html["manage"])
 
         self.assertIsNone(self.rdy.logout())
 
+    def test_update_home(self):
+        """Test update_home with and without the streaming extractor."""
+        from raincloudy.helpers import parse_page
+
+        home = load_fixture("home.html")
+        self.assertRaises(TypeError, self.rdy.update_home, None)
+
+        self.rdy.update_home(home)
+        self.assertFalse(self.rdy.html["home"].parsed)
+        self.assertEqual(self.rdy.html["home"].model, parse_page(home))
+        self.assertTrue(self.rdy.html["home"].parsed)
+
+        self.rdy._stream_home = True
+        self.rdy.update_home(home)
+        self.assertEqual(self.rdy.html["home"].model, parse_page(home))
+
+    @requests_mock.Mocker()
+    def test_html_parser(self, mock):
+        """Test login with an alternative parser backend."""
+        from raincloudy.core import RainCloudy
+
+        mock.get(LOGIN_ENDPOINT, text=load_fixture("home.html"))
+        mock.get(SETUP_ENDPOINT, text=load_fixture("setup.html"))
+        mock.get(STATUS_ENDPOINT, text=load_fixture("get_cu_and_fu_status.json"))
+        mock.post(LOGIN_ENDPOINT, text=load_fixture("home.html"))
+        mock.get(HOME_ENDPOINT, text=load_fixture("home.html"))
+
+        rdy = RainCloudy(USERNAME, PASSWORD, ssl_warnings=False, html_parser="lxml")
+        controller = rdy.controllers[0]
+        self.assertEqual(controller.serial, CONTROLLER_SERIAL)
+        self.assertEqual(controller.name, CONTROLLER_NAME)
+        self.assertEqual(controller.faucets[0].name, FAUCET_NAME)
+
 
 # vim:sw=4:ts=4:et:
@@ -3,7 +3,7 @@
 from aiohttp import ClientSession
 from aioresponses import aioresponses
 
-from tests.extras import CONTROLLER_SERIAL
+from tests.extras import CONTROLLER_SERIAL, PASSWORD, USERNAME, load_fixture
 from tests.test_base_aio import UnitTestBaseAsync
 
 
@@ -23,9 +23,8 @@ class TestRainCloudyCoreAsync(UnitTestBaseAsync):
     @aioresponses()
     async def test_login(self, mocked):
         """Test login."""
-        from bs4 import BeautifulSoup
-
         from raincloudy.aio.controller import RainCloudyController
+        from raincloudy.helpers import LazyPage, PageModel
 
         self.add_methods(mocked)
         await self.rdy.login()
@@ -44,9 +43,64 @@ class TestRainCloudyCoreAsync(UnitTestBaseAsync):
         self.assertEqual(1, len(self.rdy.controllers))
         self.assertIsInstance(self.rdy.controllers[0], RainCloudyController)
 
-        self.assertIsInstance(self.rdy.html["home"], BeautifulSoup)
-        self.assertIsInstance(self.rdy.html["setup"], BeautifulSoup)
+        self.assertIsInstance(self.rdy.html["home"], LazyPage)
+        self.assertIsInstance(self.rdy.html["setup"], PageModel)
         self.assertIsNone(self.rdy.html["program"])
         self.assertIsNone(self.rdy.html["manage"])
 
         self.assertIsNone(await self.rdy.logout())
+
+    @aioresponses()
+    async def test_parse_executor(self, mocked):
+        """Test pages are parsed in a shared executor."""
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+        from raincloudy.aio.core import RainCloudy
+        from raincloudy.helpers import ParseCache, parse_page
+
+        self.add_methods(mocked)
+        home = load_fixture("home.html")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            cache = ParseCache()
+            rdy = RainCloudy(
+                USERNAME,
+                PASSWORD,
+                self.session,
+                parse_cache=cache,
+                parse_executor=executor,
+            )
+            await rdy.login()
+            self.assertEqual(rdy.html["setup"].faucet_serials, ("1234",))
+            self.assertFalse(rdy.html["home"].parsed)
+
+            page = await rdy.parsed_home()
+            self.assertTrue(page.parsed)
+            self.assertEqual(page.model, parse_page(home, cache=None))
+            self.assertEqual(cache.misses, 2)
+
+            # another account sharing the executor and cache
+            other = RainCloudy(
+                USERNAME,
+                PASSWORD,
+                self.session,
+                parse_cache=cache,
+                parse_executor=executor,
+                stream_home=True,
+            )
+            other.update_home(home)
+            self.assertEqual((await other.parsed_home()).model, page.model)
+            self.assertEqual(await rdy._parse_page_async(home), page.model)
+            self.assertEqual(cache.hits, 1)
+
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            rdy = RainCloudy(
+                USERNAME,
+                PASSWORD,
+                self.session,
+                parse_cache=None,
+                parse_executor=executor,
+            )
+            self.assertEqual(
+                await rdy._parse_page_async(home), parse_page(home, cache=None)
+            )
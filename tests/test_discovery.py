@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""Test concurrent topology discovery."""
+import time
+
+from tests.extras import (
+    PASSWORD,
+    USERNAME,
+    AsyncMockServerTestCase,
+    MockServer,
+    MockServerTestCase,
+    benchmark_test,
+    report,
+)
+
+CONTROLLERS = 6
+FAUCETS = 4
+
+
+def topology(rdy):
+    """Return the controller, faucet and zone names discovered by rdy."""
+    return [
+        (
+            controller.serial,
+            [
+                (faucet.serial, [zone.name for zone in faucet.zones])
+                for faucet in controller.faucets
+            ],
+        )
+        for controller in rdy.controllers
+    ]
+
+
+def expected_topology():
+    """Return the topology served by MockServer."""
+    return [
+        (
+            "CTRL{}".format(controller),
+            [
+                (
+                    "F{0}{1}".format(controller, faucet),
+                    [
+                        MockServer.zone_name(controller, faucet, zone)
+                        for zone in range(1, 5)
+                    ],
+                )
+                for faucet in range(FAUCETS)
+            ],
+        )
+        for controller in range(CONTROLLERS)
+    ]
+
+
+class TestRainCloudyDiscovery(MockServerTestCase):
+    """Unit tests for concurrent discovery with the sync client."""
+
+    controllers = CONTROLLERS
+    faucets = FAUCETS
+    latency = 0.03
+
+    def login(self, workers):
+        """Return the discovery time and the RainCloudy object."""
+        from raincloudy.core import RainCloudy
+
+        class TimedRainCloudy(RainCloudy):
+            """RainCloudy recording the time spent discovering devices."""
+
+            def _discover(self):
+                start = time.perf_counter()
+                topology = super()._discover()
+                self.discovery_time = time.perf_counter() - start
+                return topology
+
+        rdy = TimedRainCloudy(USERNAME, PASSWORD, discovery_workers=workers)
+        return rdy.discovery_time, rdy
+
+    def test_discovery(self):
+        """Test concurrent discovery finds the same devices."""
+        _, rdy = self.login(1)
+        self.assertEqual(topology(rdy), expected_topology())
+        sessions = len(self.server.sessions)
+
+        _, rdy = self.login(16)
+        self.assertEqual(topology(rdy), expected_topology())
+        # every branch used its own session
+        branches = CONTROLLERS - 1 + CONTROLLERS * (FAUCETS - 1)
+        self.assertEqual(len(self.server.sessions) - sessions, 1 + branches)
+
+    @benchmark_test
+    def test_benchmark_discovery(self):
+        """Benchmark concurrent discovery against sequential discovery."""
+        sequential, _ = self.login(1)
+        concurrent, _ = self.login(16)
+        report("discovery", sequential=sequential, concurrent=concurrent)
+        self.assertLess(concurrent, sequential)
+
+
+class TestRainCloudyDiscoveryAsync(AsyncMockServerTestCase):
+    """Unit tests for concurrent discovery with the aio client."""
+
+    controllers = CONTROLLERS
+    faucets = FAUCETS
+    latency = 0.03
+
+    async def login(self, concurrency):
+        """Return the discovery time and the RainCloudy object."""
+        from raincloudy.aio.core import RainCloudy
+
+        class TimedRainCloudy(RainCloudy):
+            """RainCloudy recording the time spent discovering devices."""
+
+            async def _discover(self):
+                start = time.perf_counter()
+                topology = await super()._discover()
+                self.discovery_time = time.perf_counter() - start
+                return topology
+
+        rdy = TimedRainCloudy(USERNAME, PASSWORD, discovery_concurrency=concurrency)
+        await rdy.login()
+        await rdy.client.close()
+        return rdy.discovery_time, rdy
+
+    async def test_discovery(self):
+        """Test concurrent discovery finds the same devices."""
+        for concurrency in (1, 16):
+            with self.subTest(concurrency=concurrency):
+                _, rdy = await self.login(concurrency)
+                self.assertEqual(topology(rdy), expected_topology())
+
+    @benchmark_test
+    async def test_benchmark_discovery(self):
+        """Benchmark concurrent discovery against sequential discovery."""
+        sequential, _ = await self.login(1)
+        concurrent, _ = await self.login(16)
+        report("aio discovery", sequential=sequential, concurrent=concurrent)
+        self.assertLess(concurrent, sequential)
+
+
+# vim:sw=4:ts=4:et:
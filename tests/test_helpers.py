@@ -13,9 +13,66 @@ class TestRainCloudyHelpers(UnitTestBase):
         """Test generate_soup_html method."""
         from bs4 import BeautifulSoup
 
-        self.assertIsInstance(self.rdy.html["home"], BeautifulSoup)
+        self.assertIsInstance(
+            generate_soup_html(load_fixture("home.html")), BeautifulSoup
+        )
         self.assertRaises(TypeError, generate_soup_html, None)
 
+    def test_extract_page_model(self):
+        """Test extract_page_model method."""
+        from raincloudy.helpers import PageModel, extract_page_model, parse_page
+
+        self.assertRaises(TypeError, extract_page_model, None)
+
+        home = parse_page(load_fixture("home.html"))
+        self.assertIsInstance(home, PageModel)
+        self.assertEqual(self.rdy.html["home"].model, home)
+        self.assertEqual(home.controller_names, ("Controller001",))
+        self.assertEqual(home.faucet_names, ("Faucet001",))
+        self.assertEqual(home.selected_controller, 0)
+        self.assertEqual(home.selected_faucet, 0)
+        self.assertIsNone(home.controller_serials)
+
+        setup = extract_page_model(generate_soup_html(load_fixture("setup.html")))
+        self.assertEqual(setup.controller_serials, ("ABCDEFGH",))
+        self.assertEqual(setup.faucet_serials, ("1234",))
+        self.assertEqual(setup.zone_names, ("", "", "", ""))
+        self.assertIsNone(setup.controller_names)
+
+        broken = parse_page(load_fixture("home_broken.html"))
+        self.assertIsNone(broken.controller_names)
+        self.assertIsNone(broken.selected_controller)
+        self.assertEqual(broken.faucet_names, ("Faucet001",))
+
+    def test_lazy_page(self):
+        """Test LazyPage parses on first access only."""
+        from raincloudy.helpers import (
+            LazyPage,
+            find_selected_controller_or_faucet_index,
+            parse_page,
+        )
+
+        calls = []
+
+        def parse(data):
+            calls.append(data)
+            return parse_page(data)
+
+        home = load_fixture("home.html")
+        page = LazyPage(home, parse)
+        self.assertFalse(page.parsed)
+        self.assertEqual(repr(page), "<LazyPage: unparsed>")
+
+        # superseded pages are never parsed
+        page = LazyPage(home, parse)
+        self.assertEqual(calls, [])
+
+        self.assertEqual(find_selected_controller_or_faucet_index(page, "faucet"), 0)
+        self.assertEqual(page.controller_names, ("Controller001",))
+        self.assertTrue(page.parsed)
+        self.assertEqual(len(calls), 1)
+        self.assertRaises(AttributeError, getattr, page, "foobar")
+
     def test_serial_finder(self):
         """Test serial finder method."""
         from raincloudy.helpers import faucet_serial_finder
@@ -31,6 +88,7 @@ class TestRainCloudyHelpers(UnitTestBase):
 
         self.assertRaises(TypeError, fcfn, None, None)
         self.assertRaises(TypeError, fcfn, self.rdy.html["home"], None)
+        self.assertEqual(fcfn(self.rdy.html["home"], "faucet"), "Faucet001")
 
         # test when controller is not found
         broken_html = generate_soup_html(load_fixture("home_broken.html"))
@@ -45,3 +103,59 @@ class TestRainCloudyHelpers(UnitTestBase):
         # test when zone name is not found
         broken_html = generate_soup_html(load_fixture("home_broken.html"))
         self.assertEquals(find_zone_names(broken_html), ["1", "2", "3", "4"])
+
+    def test_selection_after_form(self):
+        """Test selection_after_form method."""
+        from raincloudy.helpers import selection_after_form
+
+        data = {"select_controller": "1", "select_faucet": 2}
+        self.assertEqual(selection_after_form(data, None), (1, 2))
+        self.assertEqual(selection_after_form({"select_faucet": 3}, (1, 2)), (1, 3))
+        self.assertIsNone(selection_after_form({"select_faucet": 3}, None))
+        self.assertIsNone(selection_after_form({"select_controller": 0}, (1, 2)))
+        self.assertEqual(selection_after_form({"zone_name": "a"}, (1, 2)), (1, 2))
+
+    def test_order_by_selection(self):
+        """Test order_by_selection method."""
+        from raincloudy.helpers import order_by_selection
+
+        items = [((0, 1), "a"), ((1, 0), "b"), ((0, 1), "c"), ((0, 0), "d")]
+        target = lambda item: item[0]  # noqa: E731
+        self.assertEqual(
+            [name for _, name in order_by_selection(items, target)], list("acbd")
+        )
+        self.assertEqual(
+            [name for _, name in order_by_selection(items, target, (0, 0))],
+            list("dacb"),
+        )
+        self.assertEqual(order_by_selection([], target, (0, 0)), [])
+
+    def test_seconds_until_cycle(self):
+        """Test seconds_until_cycle method."""
+        from raincloudy.helpers import seconds_until_cycle
+
+        self.assertEqual(seconds_until_cycle("02:00 AM", "06:30 AM"), 16200)
+        self.assertEqual(seconds_until_cycle("11:00 PM", "Tue 01:00 am", 0), 7200)
+        # cycles on another day than the next one
+        self.assertEqual(
+            seconds_until_cycle("11:00 PM", "Thu 01:00 AM", 0), 2 * 86400 + 7200
+        )
+        self.assertEqual(
+            seconds_until_cycle("02:00 AM", "Mon 01:00 AM", 0), 7 * 86400 - 3600
+        )
+        self.assertEqual(seconds_until_cycle("Wed 02:00 AM", "Fri 02:00 AM"), 172800)
+        self.assertIsNone(seconds_until_cycle("02:00 AM", "Off"))
+        self.assertIsNone(seconds_until_cycle(None, "06:30 AM"))
+
+    def test_command_value(self):
+        """Test command_value method."""
+        from raincloudy.helpers import command_value
+
+        self.assertEqual(command_value("manual_watering", "off"), "OFF")
+        self.assertEqual(command_value("manual_watering", 15), 15)
+        self.assertEqual(command_value("rain_delay", 3), "3days")
+        self.assertIsNone(command_value("rain_delay", "foobar"))
+        self.assertTrue(command_value("auto_watering", True))
+        self.assertIsNone(command_value("auto_watering", "foobar"))
+        self.assertRaises(ValueError, command_value, "manual_watering", 7)
+        self.assertRaises(ValueError, command_value, "name", "foo")
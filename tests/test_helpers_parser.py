@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""Test raincloudy.helpers parser backends."""
+import unittest
+
+from raincloudy.const import HTML_PARSER, HTML_PARSERS
+from raincloudy.exceptions import RainCloudyException
+from raincloudy.helpers import (
+    controller_serial_finder,
+    faucet_serial_finder,
+    find_controller_or_faucet_name,
+    find_selected_controller_or_faucet_index,
+    find_zone_names,
+    generate_soup_html,
+)
+from tests.extras import benchmark, benchmark_test, load_fixture, report
+
+
+def available_parsers():
+    """Return the parser backends installed on this system."""
+    parsers = []
+    for parser in HTML_PARSERS:
+        try:
+            generate_soup_html("<html></html>", parser)
+        except RainCloudyException:
+            continue
+        parsers.append(parser)
+    return parsers
+
+
+def home_results(document):
+    """Return every value read from the home page."""
+    return (
+        find_controller_or_faucet_name(document, "controller"),
+        find_controller_or_faucet_name(document, "faucet"),
+        find_selected_controller_or_faucet_index(document, "controller"),
+        find_selected_controller_or_faucet_index(document, "faucet"),
+    )
+
+
+def setup_results(document):
+    """Return every value read from the setup page."""
+    return (
+        controller_serial_finder(document),
+        faucet_serial_finder(document),
+        find_zone_names(document),
+    )
+
+
+class TestRainCloudyParsers(unittest.TestCase):
+    """Unit tests for the HTML parser backends."""
+
+    def test_invalid_parser(self):
+        """Test unknown parser backend."""
+        self.assertRaises(ValueError, generate_soup_html, "", "foobar")
+
+    def test_backends_agree(self):
+        """Test finder results are identical on every backend."""
+        home = load_fixture("home.html")
+        setup = load_fixture("setup.html")
+        broken = load_fixture("home_broken.html")
+
+        expected_home = home_results(generate_soup_html(home, HTML_PARSER))
+        expected_setup = setup_results(generate_soup_html(setup, HTML_PARSER))
+        expected_broken = home_results(generate_soup_html(broken, HTML_PARSER))
+        self.assertEqual(expected_home, ("Controller001", "Faucet001", 0, 0))
+        self.assertEqual(expected_setup, (["ABCDEFGH"], ["1234"], ["", "", "", ""]))
+
+        for parser in available_parsers():
+            with self.subTest(parser=parser):
+                self.assertEqual(
+                    home_results(generate_soup_html(home, parser)), expected_home
+                )
+                self.assertEqual(
+                    setup_results(generate_soup_html(setup, parser)), expected_setup
+                )
+                self.assertEqual(
+                    home_results(generate_soup_html(broken, parser)),
+                    expected_broken,
+                )
+                self.assertRaises(
+                    RainCloudyException,
+                    faucet_serial_finder,
+                    generate_soup_html(broken, parser),
+                )
+
+    def test_forms_only(self):
+        """Test forms-only parsing matches a full parse."""
+        from raincloudy.helpers import extract_page_model
+
+        for fixture in ("home.html", "setup.html", "home_broken.html"):
+            data = load_fixture(fixture)
+            full = generate_soup_html(data, HTML_PARSER)
+            expected = extract_page_model(full)
+
+            for parser in available_parsers():
+                with self.subTest(fixture=fixture, parser=parser):
+                    document = generate_soup_html(data, parser, forms_only=True)
+                    self.assertEqual(extract_page_model(document), expected)
+                    if parser != "selectolax":
+                        self.assertIsNone(document.find("script"))
+                        self.assertLess(len(str(document)), len(str(full)))
+
+    @benchmark_test
+    def test_benchmark_forms_only(self):
+        """Benchmark forms-only parsing against a full parse."""
+        home = load_fixture("home.html")
+
+        for parser in ("html.parser", "lxml"):
+            if parser not in available_parsers():
+                continue
+            full = benchmark(generate_soup_html, home, parser, False, number=5)
+            forms = benchmark(generate_soup_html, home, parser, True, number=5)
+            report(parser, full=full, forms_only=forms)
+            if parser == "lxml":
+                self.assertLess(forms, full)
+
+    def test_stream_page_model(self):
+        """Test the streaming extractor matches a full parse."""
+        from raincloudy.helpers import parse_page, stream_page_model
+
+        self.assertRaises(TypeError, stream_page_model, None)
+
+        for fixture in ("home.html", "home_broken.html", "setup.html"):
+            data = load_fixture(fixture)
+            with self.subTest(fixture=fixture):
+                self.assertEqual(stream_page_model(data), parse_page(data))
+
+        setup = load_fixture("setup.html")
+        needed = ("id_select_controller2", "id_select_faucet2", "select_zone")
+        self.assertEqual(stream_page_model(setup, needed), parse_page(setup))
+
+        # scanning stops once the needed selects were read
+        home = load_fixture("home.html")
+        end = home.index("</select>", home.index('id="id_select_faucet"'))
+        truncated = home[: end + len("</select>")] + "<select id='id_select_faucet'"
+        self.assertEqual(stream_page_model(truncated, chunk_size=64), parse_page(home))
+
+    def test_stream_page_model_fallback(self):
+        """Test unexpected markup falls back to a full parse."""
+        from raincloudy.helpers import parse_page, stream_page_model
+
+        nested = (
+            "<select id='id_select_controller'><option selected>A"
+            "<select id='id_select_faucet'><option>B</select></select>"
+        )
+        empty = (
+            "<select id='id_select_controller'></select>"
+            "<select id='id_select_faucet'><option selected>B</select>"
+        )
+        for data in (nested, empty):
+            with self.subTest(data=data):
+                self.assertEqual(stream_page_model(data), parse_page(data))
+
+    @benchmark_test
+    def test_benchmark_stream_page_model(self):
+        """Benchmark the streaming extractor against generate_soup_html."""
+        from raincloudy.helpers import stream_page_model
+
+        for fixture in ("home.html", "home_broken.html"):
+            data = load_fixture(fixture)
+            full = benchmark(generate_soup_html, data, number=5)
+            stream = benchmark(lambda: stream_page_model(data, cache=None), number=5)
+            report(fixture, soup=full, stream=stream)
+            if fixture == "home.html":
+                self.assertLess(stream, full)
+
+    def test_parse_cache(self):
+        """Test repeated pages are parsed once."""
+        from raincloudy.helpers import ParseCache, parse_page, stream_page_model
+
+        cache = ParseCache(maxsize=2)
+        home = load_fixture("home.html")
+        setup = load_fixture("setup.html")
+
+        model = parse_page(home, cache=cache)
+        self.assertIs(parse_page(home, cache=cache), model)
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (1, 1, 1))
+
+        # parser options are part of the key
+        self.assertEqual(parse_page(home, "html.parser", cache=cache), model)
+        self.assertEqual(stream_page_model(home, cache=cache), model)
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (1, 3, 2))
+
+        # least recently used pages are evicted
+        parse_page(setup, cache=cache)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNot(parse_page(home, cache=cache), model)
+        self.assertEqual(cache.misses, 5)
+
+        self.assertRaises(TypeError, parse_page, None, cache=cache)
+        cache.clear()
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 0, 0))
+
+    @benchmark_test
+    def test_benchmark_parse_cache(self):
+        """Benchmark cached parses against uncached ones."""
+        from raincloudy.helpers import ParseCache, parse_page
+
+        cache = ParseCache()
+        home = load_fixture("home.html")
+        uncached = benchmark(lambda: parse_page(home, cache=None), number=5)
+        cached = benchmark(lambda: parse_page(home, cache=cache), number=5)
+        report("home.html", uncached=uncached, cached=cached)
+        self.assertLess(cached, uncached)
+        self.assertEqual(cache.misses, 1)
+
+    @benchmark_test
+    def test_benchmark_backends(self):
+        """Benchmark parsing plus finders on the bundled pages."""
+        home = load_fixture("home.html")
+        setup = load_fixture("setup.html")
+
+        def parse_home(parser):
+            return home_results(generate_soup_html(home, parser))
+
+        def parse_setup(parser):
+            return setup_results(generate_soup_html(setup, parser))
+
+        timings = {
+            parser: (
+                benchmark(parse_home, parser, number=5),
+                benchmark(parse_setup, parser, number=5),
+            )
+            for parser in available_parsers()
+        }
+        for parser, (home_time, setup_time) in timings.items():
+            report(parser, home=home_time, setup=setup_time)
+
+        if "lxml" in timings:
+            self.assertLess(timings["lxml"][0], timings[HTML_PARSER][0])
+        if "selectolax" in timings:
+            self.assertLess(timings["selectolax"][0], timings[HTML_PARSER][0])
+
+
+# vim:sw=4:ts=4:et:
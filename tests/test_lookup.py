@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Test the controller, faucet and zone lookups."""
+
+from tests.extras import PASSWORD, USERNAME, AsyncMockServerTestCase, MockServerTestCase
+
+
+class TestLookup(MockServerTestCase):
+    """Unit tests for get_controller, get_faucet and get_zone."""
+
+    controllers = 2
+    faucets = 3
+
+    def setUp(self):
+        """Start the mock server and log in."""
+        from raincloudy.core import RainCloudy
+
+        super().setUp()
+        self.rdy = RainCloudy(USERNAME, PASSWORD)
+
+    def test_lookup(self):
+        """Test every object is found by serial."""
+        rdy = self.rdy
+        for controller in rdy.controllers:
+            self.assertIs(rdy.get_controller(controller.serial), controller)
+            for faucet in controller.faucets:
+                self.assertIs(rdy.get_faucet(faucet.serial), faucet)
+                for zone in faucet.zones:
+                    self.assertIs(rdy.get_zone(faucet.serial, zone.id), zone)
+
+        self.assertEqual(rdy.get_faucet("F12").index, 2)
+        self.assertEqual(rdy.get_zone("F12", 3), rdy.controllers[1].faucets[2].zone3)
+        self.assertIsNone(rdy.get_controller("CTRL9"))
+        self.assertIsNone(rdy.get_faucet("F99"))
+        self.assertIsNone(rdy.get_zone("F99", 1))
+        self.assertIsNone(rdy.get_zone("F12", 5))
+
+    def test_logout(self):
+        """Test the lookups are cleared on logout."""
+        self.rdy.logout()
+        self.assertIsNone(self.rdy.get_controller("CTRL0"))
+        self.assertIsNone(self.rdy.get_faucet("F00"))
+
+    def test_select_indexes(self):
+        """Test actions select the controller and faucet by index."""
+        zone = self.rdy.get_zone("F11", 2)
+        zone.auto_watering = True
+        form = [form for path, form in self.server.forms if path == "/home"][-1]
+        self.assertEqual(form["select_controller"], ["1"])
+        self.assertEqual(form["select_faucet"], ["1"])
+
+
+class TestLookupAsync(AsyncMockServerTestCase):
+    """Unit tests for the lookups of the aio client."""
+
+    controllers = 2
+    faucets = 3
+
+    async def test_lookup(self):
+        """Test every object is found by serial."""
+        from raincloudy.aio.core import RainCloudy
+
+        rdy = RainCloudy(USERNAME, PASSWORD)
+        self.assertIsNone(rdy.get_faucet("F00"))
+        await rdy.login()
+        for controller in rdy.controllers:
+            self.assertIs(rdy.get_controller(controller.serial), controller)
+            for faucet in controller.faucets:
+                self.assertIs(rdy.get_faucet(faucet.serial), faucet)
+                for zone in faucet.zones:
+                    self.assertIs(rdy.get_zone(faucet.serial, zone.id), zone)
+        self.assertIsNone(rdy.get_zone("F02", 0))
+        await rdy.client.close()
+
+
+# vim:sw=4:ts=4:et:
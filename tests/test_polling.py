@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""Test the adaptive polling engine."""
+import asyncio
+import copy
+import json
+import time
+import unittest
+
+from tests.extras import (
+    PASSWORD,
+    USERNAME,
+    AsyncMockServerTestCase,
+    MockServerTestCase,
+    load_fixture,
+    status_requests,
+)
+
+
+class Faucet:
+    """Faucet stand-in holding a status."""
+
+    def __init__(self, attributes, action_age=None):
+        """Initialize Faucet object."""
+        from raincloudy.status import FaucetStatus
+
+        self.snapshot = FaucetStatus.decode(attributes) if attributes else None
+        self.action_age = action_age
+
+
+class TestPollPolicy(unittest.TestCase):
+    """Unit tests for PollPolicy and RequestBudget."""
+
+    def setUp(self):
+        """Load the status fixture."""
+        from raincloudy.polling import PollPolicy
+
+        self.policy = PollPolicy()
+        self.status = json.loads(load_fixture("get_cu_and_fu_status.json"))
+
+    def idle_status(self):
+        """Return the fixture without any zone watering."""
+        status = copy.deepcopy(self.status)
+        for zone in status["rain_delay_mode"]:
+            zone.update(is_watering=False, manual_watering_time=0)
+        return status
+
+    def test_states(self):
+        """Test the delay picked from every state."""
+        policy = self.policy
+        watering = Faucet(self.status)
+        self.assertEqual(policy.state(watering), "watering")
+        self.assertEqual(policy.delay(watering), policy.watering_interval)
+
+        idle = Faucet(self.idle_status())
+        self.assertEqual(policy.state(idle), "idle")
+        self.assertEqual(policy.delay(idle), policy.idle_interval)
+
+        acted = Faucet(self.idle_status(), action_age=1)
+        self.assertEqual(policy.state(acted), "action")
+        self.assertEqual(policy.delay(acted), policy.action_interval)
+        acted.action_age = policy.action_window + 1
+        self.assertEqual(policy.state(acted), "idle")
+
+        offline = Faucet(dict(self.status, rf_link=False))
+        self.assertEqual(policy.state(offline), "offline")
+        self.assertEqual(policy.delay(offline), policy.offline_interval)
+        offline = Faucet(dict(self.status, faucet_status="Offline"))
+        self.assertEqual(policy.state(offline), "offline")
+
+        self.assertEqual(policy.state(Faucet({})), "unknown")
+        self.assertEqual(policy.delay(Faucet({})), policy.action_interval)
+
+    def test_next_cycle(self):
+        """Test idle faucets are polled once the next cycle started."""
+        status = self.idle_status()
+        status["rain_delay_mode"][2]["next_water_cycle"] = "02:03 AM"
+        self.assertEqual(
+            self.policy.delay(Faucet(status)), 180 + self.policy.action_interval
+        )
+        status["rain_delay_mode"][2]["next_water_cycle"] = "06:00 PM"
+        self.assertEqual(self.policy.delay(Faucet(status)), self.policy.idle_interval)
+
+    def test_invalid(self):
+        """Test invalid intervals and budgets."""
+        from raincloudy.polling import PollPolicy, RequestBudget
+
+        self.assertRaises(ValueError, PollPolicy, idle_interval=0)
+        self.assertRaises(ValueError, RequestBudget, 0)
+        self.assertRaises(ValueError, RequestBudget, 10, period=0)
+
+    def test_budget(self):
+        """Test the sliding window of a budget."""
+        from raincloudy.polling import RequestBudget
+
+        budget = RequestBudget(3, period=60)
+        self.assertEqual(budget.available(now=0), 3)
+        budget.spend(2, now=0)
+        budget.spend(now=10)
+        self.assertEqual(budget.available(now=30), 0)
+        self.assertEqual(budget.wait(now=30), 30)
+        self.assertEqual(budget.available(now=60), 2)
+        self.assertEqual(budget.wait(now=60), 0)
+        self.assertEqual(budget.available(now=70), 3)
+
+
+class TestPoller(MockServerTestCase):
+    """Unit tests for Poller with the sync client."""
+
+    controllers = 2
+    faucets = 2
+
+    def setUp(self):
+        """Start the mock server and log in."""
+        from raincloudy.core import RainCloudy
+
+        super().setUp()
+        self.rdy = RainCloudy(USERNAME, PASSWORD, status_max_age=60)
+        self.faucets = [
+            faucet
+            for controller in self.rdy.controllers
+            for faucet in controller.faucets
+        ]
+        del self.server.requests[:]
+
+    def poller(self, **kwargs):
+        """Return a Poller with short intervals."""
+        from raincloudy.polling import Poller, PollPolicy
+
+        policy = PollPolicy(watering_interval=5, action_interval=0.05, action_window=1)
+        return Poller(self.rdy, policy, **kwargs)
+
+    def test_poll(self):
+        """Test watering faucets are polled again after watering_interval."""
+        poller = self.poller()
+        wait = poller.poll_once()
+        self.assertEqual(len(status_requests(self.server)), 4)
+        self.assertGreater(wait, 4)
+        self.assertLessEqual(wait, 5)
+        self.assertEqual(poller.due(), [])
+        self.assertEqual(len(poller.due(now=time.monotonic() + 5)), 4)
+        self.assertEqual(poller.metrics["polls"], 4)
+
+    def test_action(self):
+        """Test an action brings the next poll of its faucet forward."""
+        poller = self.poller()
+        poller.poll_once()
+        self.faucets[2].zone1.auto_watering = True
+        self.assertLessEqual(poller.wait(), 0.05)
+
+        time.sleep(0.06)
+        del self.server.requests[:]
+        wait = poller.poll_once()
+        self.assertEqual(len(status_requests(self.server)), 1)
+        # polled every action_interval during action_window
+        self.assertLessEqual(wait, 0.05)
+        self.assertEqual(poller.policy.state(self.faucets[2]), "action")
+
+    def test_budget(self):
+        """Test faucets due wait once the budget is spent."""
+        from raincloudy.polling import RequestBudget
+
+        poller = self.poller(budget=RequestBudget(3, period=60))
+        wait = poller.poll_once()
+        self.assertEqual(len(status_requests(self.server)), 3)
+        self.assertEqual(poller.metrics["polls_deferred"], 1)
+        self.assertGreater(wait, 59)
+        self.assertAlmostEqual(poller.poll_once(), wait, delta=1)
+        self.assertEqual(len(status_requests(self.server)), 3)
+
+    def test_run(self):
+        """Test run polls until stopped."""
+        import threading
+
+        poller = self.poller()
+        stop = threading.Event()
+        thread = threading.Thread(target=poller.run, args=(stop,))
+        thread.start()
+        time.sleep(0.2)
+        stop.set()
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(status_requests(self.server)), 4)
+
+    def test_run_errors(self):
+        """Test run goes on polling after an error."""
+        import threading
+
+        import requests
+
+        poller = self.poller()
+        self.faucets[1]._id = "GONE"
+        stop = threading.Event()
+        thread = threading.Thread(target=poller.run, args=(stop,))
+        thread.start()
+        time.sleep(0.2)
+        self.assertTrue(thread.is_alive())
+        stop.set()
+        thread.join(timeout=5)
+        self.assertGreaterEqual(poller.errors, 1)
+        self.assertIsInstance(poller.last_error, requests.HTTPError)
+        self.assertEqual(poller.metrics["polls"], 4)
+
+
+class TestPollerAsync(AsyncMockServerTestCase):
+    """Unit tests for Poller with the aio client."""
+
+    controllers = 2
+    faucets = 2
+
+    async def test_poll(self):
+        """Test polling with the aio client."""
+        from raincloudy.aio.core import RainCloudy
+        from raincloudy.aio.polling import Poller
+        from raincloudy.polling import PollPolicy, RequestBudget
+
+        rdy = RainCloudy(USERNAME, PASSWORD, status_max_age=60)
+        await rdy.login()
+        del self.server.requests[:]
+        policy = PollPolicy(watering_interval=0.1, idle_interval=10)
+        poller = Poller(rdy, policy, RequestBudget(6, period=60))
+
+        task = asyncio.create_task(poller.run())
+        await asyncio.sleep(0.3)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+        # the second poll of two faucets is deferred
+        self.assertEqual(len(status_requests(self.server)), 6)
+        self.assertEqual(poller.metrics["polls"], 6)
+        self.assertEqual(poller.metrics["polls_deferred"], 2)
+        await rdy.client.close()
+
+    async def test_run_errors(self):
+        """Test run goes on polling after an error."""
+        from aiohttp import ClientResponseError
+
+        from raincloudy.aio.core import RainCloudy
+        from raincloudy.aio.polling import Poller
+        from raincloudy.polling import PollPolicy
+
+        rdy = RainCloudy(USERNAME, PASSWORD, status_max_age=60)
+        await rdy.login()
+        rdy.controllers[0].faucets[0]._id = "GONE"
+        poller = Poller(rdy, PollPolicy(action_interval=0.05, watering_interval=0.05))
+
+        task = asyncio.create_task(poller.run())
+        await asyncio.sleep(0.3)
+        self.assertFalse(task.done())
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertGreater(poller.errors, 1)
+        self.assertIsInstance(poller.last_error, ClientResponseError)
+        await rdy.client.close()
+
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""Test the single-flight re-authentication."""
+import threading
+
+import aiohttp
+import requests
+
+from tests.extras import PASSWORD, USERNAME, AsyncMockServerTestCase, MockServerTestCase
+
+
+def login_posts(server):
+    """Return the number of login forms submitted to server."""
+    return len(
+        [
+            1
+            for method, path, _ in server.requests
+            if (method, path) == ("POST", "/login/")
+        ]
+    )
+
+
+class TestRainCloudyRelogin(MockServerTestCase):
+    """Unit tests for re-authentication with the sync client."""
+
+    controllers = 2
+    faucets = 4
+
+    def setUp(self):
+        """Start the mock server and log in."""
+        from raincloudy.core import RainCloudy
+
+        super().setUp()
+        self.rdy = RainCloudy(USERNAME, PASSWORD, relogin_backoff=0.01)
+        self.faucets = [f for c in self.rdy.controllers for f in c.faucets]
+        del self.server.requests[:]
+
+    def test_expired_session(self):
+        """Test concurrent updates share one login."""
+        generation = self.rdy.session_generation
+        self.server.sessions.clear()
+
+        barrier = threading.Barrier(len(self.faucets))
+
+        def update(faucet):
+            barrier.wait()
+            faucet.update()
+
+        threads = [
+            threading.Thread(target=update, args=(faucet,)) for faucet in self.faucets
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(login_posts(self.server), 1)
+        self.assertEqual(self.rdy.metrics["relogins"], 1)
+        self.assertEqual(self.rdy.session_generation, generation + 1)
+        self.assertEqual(len(self.rdy.controllers), 2)
+
+    def test_forbidden(self):
+        """Test a session rejected after logging in again raises."""
+        self.server.forbidden = True
+        with self.assertRaises(requests.HTTPError):
+            self.faucets[0].update()
+        self.assertEqual(login_posts(self.server), 1)
+
+    def test_login_retries(self):
+        """Test failed logins are retried a bounded number of times."""
+        self.server.login_status = 500
+        with self.assertRaises(requests.HTTPError):
+            self.rdy.reauthenticate()
+        self.assertEqual(login_posts(self.server), 3)
+        self.assertEqual(self.rdy.metrics["relogin_failures"], 3)
+
+        self.server.login_status = 302
+        self.rdy.reauthenticate()
+        self.assertEqual(self.rdy.metrics["relogins"], 1)
+
+
+class TestRainCloudyReloginAsync(AsyncMockServerTestCase):
+    """Unit tests for re-authentication with the aio client."""
+
+    controllers = 2
+    faucets = 4
+
+    async def asyncSetUp(self):
+        """Start the mock server and log in."""
+        from raincloudy.aio.core import RainCloudy
+
+        self.rdy = RainCloudy(USERNAME, PASSWORD, relogin_backoff=0.01)
+        await self.rdy.login()
+        del self.server.requests[:]
+
+    async def asyncTearDown(self):
+        """Close the client."""
+        await self.rdy.client.close()
+
+    async def test_expired_session(self):
+        """Test gathered updates share one login."""
+        self.server.sessions.clear()
+        await self.rdy.update()
+
+        self.assertEqual(login_posts(self.server), 1)
+        self.assertEqual(self.rdy.metrics["relogins"], 1)
+        self.assertEqual(self.rdy.metrics["relogins_shared"], 7)
+        self.assertEqual(len(self.rdy.controllers), 2)
+
+    async def test_forbidden(self):
+        """Test a session rejected after logging in again raises."""
+        self.server.forbidden = True
+        with self.assertRaises(aiohttp.ClientResponseError):
+            await self.rdy.update()
+        self.assertEqual(login_posts(self.server), 1)
+
+    async def test_login_retries(self):
+        """Test failed logins are retried a bounded number of times."""
+        self.server.login_status = 500
+        with self.assertRaises(aiohttp.ClientResponseError):
+            await self.rdy.reauthenticate()
+        self.assertEqual(login_posts(self.server), 3)
+        self.assertEqual(self.rdy.metrics["relogin_failures"], 3)
+
+        self.server.login_status = 302
+        await self.rdy.reauthenticate()
+        self.assertEqual(self.rdy.metrics["relogins"], 1)
+
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,116 @@
+"""Test the aio PollScheduler."""
+import asyncio
+import time
+from unittest import mock
+
+import aiohttp
+
+from raincloudy.aio.scheduler import PollScheduler
+from tests.extras import PASSWORD, USERNAME, AsyncMockServerTestCase
+
+
+class TestPollScheduler(AsyncMockServerTestCase):
+    """Unit tests for PollScheduler."""
+
+    controllers = 2
+    faucets = 4
+    latency = 0.01
+
+    async def asyncSetUp(self):
+        """Create the connector shared by the clients."""
+        self.connector = aiohttp.TCPConnector()
+
+    async def asyncTearDown(self):
+        """Close the shared connector."""
+        await self.connector.close()
+
+    async def login(self, scheduler):
+        """Return a logged in RainCloudy object sharing the connector."""
+        from raincloudy.aio.core import RainCloudy
+
+        session = aiohttp.ClientSession(connector=self.connector, connector_owner=False)
+        self.addAsyncCleanup(session.close)
+        rdy = RainCloudy(
+            USERNAME, PASSWORD, client_session=session, poll_scheduler=scheduler
+        )
+        await rdy.login()
+        return rdy
+
+    async def test_poll(self):
+        """Test registered accounts are polled within the host limit."""
+        scheduler = PollScheduler(max_concurrency=8, per_host=3)
+        accounts = [await self.login(scheduler) for _ in range(3)]
+        self.assertEqual(set(scheduler.accounts), set(accounts))
+        self.assertEqual(scheduler.max_in_flight, 3)
+
+        del self.server.requests[:]
+        scheduler.max_in_flight = 0
+        await scheduler.poll()
+        status = [r for r in self.server.requests if r[1] == "/get_cu_and_fu_status"]
+        self.assertEqual(len(status), 3 * 8)
+        self.assertEqual(scheduler.max_in_flight, 3)
+        self.assertEqual(scheduler.in_flight, 0)
+
+        scheduler.unregister(accounts[0])
+        self.assertEqual(len(scheduler.accounts), 2)
+
+    async def test_global_limit(self):
+        """Test the global limit applies across hosts."""
+        scheduler = PollScheduler(max_concurrency=4, per_host=2)
+
+        async def request(host):
+            async with scheduler.slot(f"https://{host}/get_cu_and_fu_status"):
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*[request(f"host{index % 5}") for index in range(20)])
+        self.assertEqual(scheduler.max_in_flight, 4)
+
+        scheduler.max_in_flight = 0
+        await asyncio.gather(*[request("host") for index in range(20)])
+        self.assertEqual(scheduler.max_in_flight, 2)
+        self.assertEqual(len(scheduler._hosts), 6)
+
+    async def test_no_scheduler(self):
+        """Test status requests are allowed right away without a scheduler."""
+        from raincloudy.aio.core import RainCloudy
+
+        rdy = RainCloudy(USERNAME, PASSWORD)
+        self.addAsyncCleanup(rdy.client.close)
+        slot = rdy.status_slot("https://host/get_cu_and_fu_status")
+        # nullcontext only supports async with from Python 3.10
+        self.assertTrue(hasattr(slot, "__aenter__"))
+        async with slot:
+            pass
+
+    def test_lazy_semaphores(self):
+        """Test the semaphores are created by the event loop using them."""
+        scheduler = PollScheduler(max_concurrency=2)
+        self.assertIsNone(scheduler._global)
+
+        async def request():
+            async with scheduler.slot("https://host/get_cu_and_fu_status"):
+                pass
+
+        asyncio.run(request())
+        self.assertIsNotNone(scheduler._global)
+
+    async def test_jitter(self):
+        """Test requests wait a random delay."""
+        scheduler = PollScheduler(jitter=0.5)
+        with mock.patch("raincloudy.aio.scheduler.random.uniform") as uniform:
+            uniform.return_value = 0.05
+            start = time.perf_counter()
+            async with scheduler.slot("https://host/"):
+                pass
+        self.assertGreaterEqual(time.perf_counter() - start, 0.05)
+        uniform.assert_called_once_with(0, 0.5)
+
+    def test_invalid_limits(self):
+        """Test limits below 1 are rejected."""
+        with self.assertRaises(ValueError):
+            PollScheduler(max_concurrency=0)
+        with self.assertRaises(ValueError):
+            PollScheduler(per_host=0)
+
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""Test the tracking of the server side selection."""
+
+from tests.extras import PASSWORD, USERNAME, AsyncMockServerTestCase, MockServerTestCase
+
+
+def home_posts(server):
+    """Return the number of forms posted to the home page."""
+    return len([1 for path, _ in server.forms if path == "/home"])
+
+
+class TestSelection(MockServerTestCase):
+    """Unit tests for RainCloudy.selection with the sync client."""
+
+    controllers = 2
+    faucets = 2
+
+    def login(self, **kwargs):
+        """Return a RainCloudy object."""
+        from raincloudy.core import RainCloudy
+
+        rdy = RainCloudy(USERNAME, PASSWORD, status_max_age=60, **kwargs)
+        del self.server.forms[:]
+        return rdy
+
+    def test_tracked_selection(self):
+        """Test a known selection skips the switching form."""
+        rdy = self.login()
+        # the sequential discovery selected another controller
+        self.assertIsNone(rdy.selection)
+        first = rdy.controllers[0].faucets[0]
+        second = rdy.controllers[1].faucets[0]
+
+        first.zone1.auto_watering = True
+        self.assertEqual(home_posts(self.server), 2)
+        self.assertEqual(rdy.selection, (0, 0))
+
+        first.zone2.auto_watering = True
+        self.assertEqual(home_posts(self.server), 3)
+        # the response page is not parsed
+        self.assertFalse(rdy.html["home"].parsed)
+
+        second.zone1.auto_watering = True
+        self.assertEqual(home_posts(self.server), 5)
+        self.assertEqual(rdy.selection, (1, 0))
+        self.assertEqual(
+            self.server.sessions[rdy.export_session()["sessionid"]], [1, 0]
+        )
+
+        from raincloudy import core
+
+        rdy.post({"select_faucet": 1}, url=core.SETUP_ENDPOINT)
+        self.assertEqual(rdy.selection, (1, 1))
+        rdy.controllers[0].name = "Renamed"
+        self.assertIsNone(rdy.selection)
+
+    def test_selection_from_home(self):
+        """Test the selection is read from the home page after login."""
+        rdy = self.login(discovery_workers=4)
+        self.assertEqual(rdy.selection, (0, 0))
+        rdy.controllers[0].faucets[0].zone1.auto_watering = True
+        self.assertEqual(home_posts(self.server), 1)
+
+    def test_reauthenticate(self):
+        """Test logging in again forgets the selection."""
+        rdy = self.login(discovery_workers=4)
+        self.assertEqual(rdy.selection, (0, 0))
+        rdy.reauthenticate()
+        self.assertIsNone(rdy.selection)
+
+        # the home page of the previous session is not read either
+        rdy = self.login(discovery_workers=4)
+        rdy.reauthenticate()
+        self.assertIsNone(rdy.selection)
+
+
+class TestSelectionAsync(AsyncMockServerTestCase):
+    """Unit tests for RainCloudy.selection with the aio client."""
+
+    controllers = 2
+    faucets = 2
+
+    async def test_tracked_selection(self):
+        """Test a known selection skips the switching form."""
+        from raincloudy.aio.core import RainCloudy
+
+        rdy = RainCloudy(USERNAME, PASSWORD, status_max_age=60)
+        await rdy.login()
+        del self.server.forms[:]
+        self.assertIsNone(await rdy.selection())
+        first = rdy.controllers[0].faucets[0]
+        second = rdy.controllers[1].faucets[1]
+
+        await first.zone1.set_auto_watering(True)
+        await first.zone2.set_auto_watering(True)
+        self.assertEqual(home_posts(self.server), 3)
+        await second.zone1.set_auto_watering(True)
+        self.assertEqual(home_posts(self.server), 5)
+        self.assertEqual(await rdy.selection(), (1, 1))
+        await rdy.client.close()
+
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""Test the status snapshot model."""
+import dataclasses
+import json
+import unittest
+
+from tests.extras import benchmark, benchmark_test, load_fixture, report
+
+
+class TestFaucetStatus(unittest.TestCase):
+    """Unit tests for FaucetStatus and ZoneStatus."""
+
+    def setUp(self):
+        """Decode the status fixture."""
+        from raincloudy.status import FaucetStatus
+
+        self.data = json.loads(load_fixture("get_cu_and_fu_status.json"))
+        self.status = FaucetStatus.decode(self.data)
+
+    def test_decode(self):
+        """Test the fields decoded from the status endpoint."""
+        status = self.status
+        self.assertEqual(status.faucet_status, self.data["faucet_status"])
+        self.assertEqual(status.battery_percent, "66%")
+        self.assertEqual(status.battery, 66)
+        self.assertEqual(len(status.zones), 4)
+        for zone, expected in zip(status.zones, self.data["rain_delay_mode"]):
+            self.assertEqual(zone.is_watering, expected["is_watering"])
+            self.assertEqual(
+                zone.watering_time,
+                max(expected["manual_watering_time"], expected["auto_watering_time"]),
+            )
+
+    def test_to_dict(self):
+        """Test a snapshot converts back to the endpoint response."""
+        data = self.status.to_dict()
+        self.assertEqual(set(data), set(self.data))
+        for key, value in data.items():
+            if key != "rain_delay_mode":
+                self.assertEqual(value, self.data[key])
+        for zone, expected in zip(
+            data["rain_delay_mode"], self.data["rain_delay_mode"]
+        ):
+            self.assertNotIn("watering_time", zone)
+            for key, value in zone.items():
+                self.assertEqual(value, expected[key])
+
+    def test_replace_zone(self):
+        """Test replace_zone copies the snapshot and updates derived fields."""
+        status = self.status.replace_zone(1, manual_watering_time=60)
+        self.assertEqual(status.zones[1].manual_watering_time, 60)
+        self.assertEqual(status.zones[1].watering_time, 60)
+        self.assertIs(status.zones[0], self.status.zones[0])
+        self.assertNotEqual(self.status.zones[1].manual_watering_time, 60)
+
+    def test_slots(self):
+        """Test snapshots are frozen and have no instance dict."""
+        for value in (self.status, self.status.zones[0]):
+            self.assertFalse(hasattr(value, "__dict__"))
+            with self.assertRaises(dataclasses.FrozenInstanceError):
+                value.rf_link = False
+
+    def test_battery(self):
+        """Test the battery of unexpected values."""
+        from raincloudy.status import FaucetStatus
+
+        for value, expected in (("100 %", 100), ("", None), ("n/a", None), (40, 40)):
+            status = FaucetStatus.decode(dict(self.data, battery_percent=value))
+            self.assertEqual(status.battery, expected)
+        self.assertEqual(FaucetStatus.decode({}).zones, ())
+
+    def test_diff(self):
+        """Test the changes between two snapshots."""
+        from raincloudy.status import FaucetStatus, diff_status
+
+        self.assertEqual(diff_status(self.status, self.status), [])
+        same = FaucetStatus.decode(self.data)
+        self.assertEqual(diff_status(self.status, same), [])
+
+        status = self.status.replace_zone(1, is_watering=False)
+        status = status.replace_zone(3, manual_watering_time=30)
+        new = FaucetStatus.decode(dict(status.to_dict(), battery_percent="65%"))
+        changes = diff_status(self.status, new)
+        self.assertEqual(
+            [str(change) for change in changes],
+            [
+                "battery_percent '66%' -> '65%'",
+                "zone 2 is_watering True -> False",
+                "zone 4 manual_watering_time 0 -> 30",
+            ],
+        )
+        self.assertEqual(changes[1].zone, 2)
+        self.assertEqual(changes[1].field, "is_watering")
+
+
+class TestDecodeStatus(unittest.TestCase):
+    """Unit tests for decode_status."""
+
+    def setUp(self):
+        """Load the status fixture."""
+        from raincloudy.status import JSON_DECODERS, msgspec, orjson
+
+        self.content = load_fixture("get_cu_and_fu_status.json").encode()
+        installed = {"json": True, "orjson": orjson, "msgspec": msgspec}
+        self.decoders = [name for name in JSON_DECODERS if installed[name]]
+
+    def test_same_status(self):
+        """Test every decoder installed returns the same snapshot."""
+        from raincloudy.status import FaucetStatus, decode_status
+
+        expected = FaucetStatus.decode(json.loads(self.content))
+        for decoder in self.decoders + [None]:
+            with self.subTest(decoder=decoder):
+                self.assertEqual(decode_status(self.content, decoder), expected)
+                self.assertEqual(
+                    decode_status(self.content.decode(), decoder), expected
+                )
+
+    def test_missing_fields(self):
+        """Test missing and null fields get the same defaults."""
+        from raincloudy.status import decode_status
+
+        data = json.loads(self.content)
+        del data["rf_link"]
+        del data["rain_delay_mode"][0]["manual_mode_on"]
+        data["rain_delay_mode"][1]["manual_watering_time"] = None
+        content = json.dumps(data)
+        statuses = [decode_status(content, decoder) for decoder in self.decoders]
+        for status in statuses:
+            self.assertEqual(status, statuses[0])
+        self.assertIsNone(statuses[0].rf_link)
+        self.assertFalse(statuses[0].zones[0].manual_mode_on)
+        self.assertEqual(statuses[0].zones[1].watering_time, 5)
+
+    def test_invalid(self):
+        """Test every decoder rejects a status of an unexpected shape."""
+        from raincloudy.exceptions import RainCloudyException
+        from raincloudy.status import decode_status, msgspec
+
+        data = json.loads(self.content)
+        invalid = [
+            b"[]",
+            b"{not json",
+            json.dumps(dict(data, rain_delay_mode=data["rain_delay_mode"][:3])),
+            json.dumps(dict(data, rain_delay_mode=None)),
+            json.dumps(dict(data, rf_link="yes")),
+            json.dumps(dict(data, rain_delay_mode=[1, 2, 3, 4])),
+        ]
+        zone = dict(data["rain_delay_mode"][0], manual_watering_time=True)
+        invalid.append(json.dumps(dict(data, rain_delay_mode=[zone] * 4)))
+        for decoder in self.decoders:
+            for content in invalid:
+                with self.subTest(decoder=decoder, content=content):
+                    self.assertRaises(ValueError, decode_status, content, decoder)
+
+        self.assertRaises(ValueError, decode_status, self.content, "yaml")
+        if msgspec is None:
+            self.assertRaises(
+                RainCloudyException, decode_status, self.content, "msgspec"
+            )
+
+    @benchmark_test
+    def test_benchmark_decode(self):
+        """Benchmark the decoders installed on the status fixture."""
+        from raincloudy.status import FaucetStatus, decode_status
+
+        def stdlib():
+            return FaucetStatus.decode(json.loads(self.content))
+
+        unchecked = benchmark(stdlib, number=2000)
+        timings = {
+            decoder: benchmark(decode_status, self.content, decoder, number=2000)
+            for decoder in self.decoders
+        }
+        report("decode_status", unchecked=unchecked, **timings)
+        # checking the fields costs a fraction of the decoding
+        for decoder, elapsed in timings.items():
+            with self.subTest(decoder=decoder):
+                self.assertLess(elapsed, unchecked * 3)
+
+
+# vim:sw=4:ts=4:et:
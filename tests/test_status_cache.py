@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""Test the faucet status cache."""
+import time
+
+from tests.extras import PASSWORD, USERNAME, AsyncMockServerTestCase, MockServerTestCase
+
+
+def count(server, method, path):
+    """Return the number of requests sent to path."""
+    return len([1 for request in server.requests if request[:2] == (method, path)])
+
+
+class TestStatusCache(MockServerTestCase):
+    """Unit tests for status_max_age with the sync client."""
+
+    def faucet(self, status_max_age):
+        """Return the faucet of a new RainCloudy object."""
+        from raincloudy.core import RainCloudy
+
+        rdy = RainCloudy(USERNAME, PASSWORD, status_max_age=status_max_age)
+        del self.server.requests[:]
+        del self.server.forms[:]
+        return rdy.controllers[0].faucets[0]
+
+    def test_fresh_snapshot(self):
+        """Test actions trust a fresh snapshot and keep it up to date."""
+        faucet = self.faucet(60)
+        self.assertLess(faucet.status_age, 60)
+        self.assertLess(faucet.zone1.status_age, 60)
+
+        for zone in faucet.zones:
+            zone.auto_watering = True
+
+        self.assertEqual(count(self.server, "GET", "/get_cu_and_fu_status"), 0)
+        self.assertEqual(count(self.server, "POST", "/home"), 4)
+        # earlier settings are not reverted by later actions
+        _, form = self.server.forms[-1]
+        for zone_id in range(1, 5):
+            self.assertEqual(form["zone{}_program_toggle".format(zone_id)], ["on"])
+            self.assertTrue(faucet.zones[zone_id - 1].auto_watering)
+
+        faucet.zone1.manual_watering = 5
+        faucet.zone3.rain_delay = 3
+        self.assertEqual(faucet.zone1.watering_time, 5)
+        self.assertTrue(faucet.zone1.manual_watering)
+        self.assertEqual(faucet.zone3.rain_delay, 3)
+        self.assertEqual(count(self.server, "GET", "/get_cu_and_fu_status"), 0)
+
+    def test_stale_snapshot(self):
+        """Test reads fetch a stale snapshot again."""
+        faucet = self.faucet(0.05)
+        self.assertFalse(faucet.is_stale())
+        self.assertEqual(faucet.status, "Online")
+        self.assertEqual(count(self.server, "GET", "/get_cu_and_fu_status"), 0)
+
+        time.sleep(0.1)
+        self.assertTrue(faucet.is_stale())
+        self.assertEqual(faucet.zone2.watering_time, 15)
+        self.assertEqual(count(self.server, "GET", "/get_cu_and_fu_status"), 1)
+
+    def test_no_max_age(self):
+        """Test every action fetches the status without status_max_age."""
+        faucet = self.faucet(None)
+        self.assertTrue(faucet.is_stale())
+        for zone in faucet.zones:
+            zone.auto_watering = True
+        self.assertEqual(count(self.server, "GET", "/get_cu_and_fu_status"), 4)
+        self.assertEqual(count(self.server, "POST", "/home"), 4)
+
+
+class TestStatusCacheAsync(AsyncMockServerTestCase):
+    """Unit tests for status_max_age with the aio client."""
+
+    async def test_fresh_snapshot(self):
+        """Test actions trust a fresh snapshot and keep it up to date."""
+        from raincloudy.aio.core import RainCloudy
+
+        rdy = RainCloudy(USERNAME, PASSWORD, status_max_age=60)
+        await rdy.login()
+        del self.server.requests[:]
+        faucet = rdy.controllers[0].faucets[0]
+        self.assertLess(faucet.zone1.status_age, 60)
+
+        for zone in faucet.zones:
+            await zone.set_auto_watering(True)
+        await rdy.client.close()
+
+        self.assertEqual(count(self.server, "GET", "/get_cu_and_fu_status"), 0)
+        self.assertEqual(count(self.server, "POST", "/home"), 4)
+        _, form = self.server.forms[-1]
+        for zone_id in range(1, 5):
+            self.assertEqual(form["zone{}_program_toggle".format(zone_id)], ["on"])
+
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""Test the persistent topology and session stores."""
+import os
+import tempfile
+import time
+import unittest
+
+import requests
+
+from raincloudy.store import JSONFileStore
+from tests.extras import (
+    PASSWORD,
+    USERNAME,
+    AsyncMockServerTestCase,
+    MockServer,
+    MockServerTestCase,
+)
+
+TOPOLOGY_KEY = "topology:{}".format(USERNAME)
+SESSION_KEY = "session:{}".format(USERNAME)
+
+
+def logins(server):
+    """Return the number of login forms submitted to server."""
+    return len([1 for _, path, _ in server.requests if path == "/login/"])
+
+
+class TestJSONFileStore(unittest.TestCase):
+    """Unit tests for JSONFileStore."""
+
+    def setUp(self):
+        """Create a temporary directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "raincloudy.json")
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        """Test saving, loading and deleting values."""
+        store = JSONFileStore(self.path)
+        self.assertIsNone(store.load("key"))
+
+        store.save("key", [["ABC", [{"serial": "1", "zones": ["a"]}]]])
+        store.save("other", 1)
+        self.assertEqual(
+            JSONFileStore(self.path).load("key"),
+            [["ABC", [{"serial": "1", "zones": ["a"]}]]],
+        )
+
+        store.delete("key")
+        store.delete("missing")
+        self.assertIsNone(store.load("key"))
+        self.assertEqual(store.load("other"), 1)
+        self.assertEqual(os.listdir(self.tmp.name), ["raincloudy.json"])
+
+    def test_corrupt_file(self):
+        """Test a corrupt file is read as an empty store."""
+        with open(self.path, "w") as fdp:
+            fdp.write("{not json")
+        store = JSONFileStore(self.path)
+        self.assertIsNone(store.load("key"))
+        store.save("key", "value")
+        self.assertEqual(store.load("key"), "value")
+
+
+class TestTopologyStore(MockServerTestCase):
+    """Unit tests for the sync client with a topology store."""
+
+    controllers = 2
+    faucets = 2
+
+    def setUp(self):
+        """Create the store and start the mock server."""
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = JSONFileStore(os.path.join(self.tmp.name, "raincloudy.json"))
+
+    def login(self):
+        """Return a RainCloudy object and the setup requests it made."""
+        from raincloudy.core import RainCloudy
+
+        del self.server.requests[:]
+        rdy = RainCloudy(USERNAME, PASSWORD, topology_store=self.store)
+        setup = [path for _, path, _ in self.server.requests if path == "/setup/"]
+        return rdy, len(setup)
+
+    def test_saved_topology(self):
+        """Test a saved topology skips the setup pages."""
+        rdy, crawled = self.login()
+        self.assertEqual(crawled, 4)
+        saved = self.store.load(TOPOLOGY_KEY)
+        self.assertEqual([serial for serial, _ in saved], ["CTRL0", "CTRL1"])
+
+        rdy, crawled = self.login()
+        self.assertEqual(crawled, 0)
+        self.assertEqual(
+            [faucet.serial for c in rdy.controllers for faucet in c.faucets],
+            ["F00", "F01", "F10", "F11"],
+        )
+        self.assertEqual(
+            rdy.controllers[1].faucets[1].zones[0].name,
+            MockServer.zone_name(1, 1, 1),
+        )
+
+    def test_home_page_mismatch(self):
+        """Test a topology not matching the home page is crawled again."""
+        self.login()
+        self.server.controllers = 3
+
+        rdy, crawled = self.login()
+        self.assertGreater(crawled, 0)
+        self.assertEqual(len(rdy.controllers), 3)
+        self.assertEqual(len(self.store.load(TOPOLOGY_KEY)), 3)
+
+    def test_status_mismatch(self):
+        """Test a faucet rejected by the status endpoint is crawled again."""
+        self.login()
+        saved = self.store.load(TOPOLOGY_KEY)
+        saved[1][1][0]["serial"] = "GONE"
+        self.store.save(TOPOLOGY_KEY, saved)
+
+        rdy, crawled = self.login()
+        self.assertGreater(crawled, 0)
+        self.assertEqual(rdy.controllers[1].faucets[0].serial, "F10")
+        self.assertEqual(self.store.load(TOPOLOGY_KEY)[1][1][0]["serial"], "F10")
+
+    def test_transient_error(self):
+        """Test a failing status request keeps the saved topology."""
+        rdy, _ = self.login()
+        self.server.status_error = 503
+        with self.assertRaises(requests.HTTPError):
+            rdy.controllers[0].faucets[0].update()
+        self.assertIsNotNone(self.store.load(TOPOLOGY_KEY))
+
+    def test_invalidate_topology(self):
+        """Test invalidate_topology forgets the saved topology."""
+        rdy, _ = self.login()
+        rdy.invalidate_topology()
+        self.assertIsNone(self.store.load(TOPOLOGY_KEY))
+
+
+class TestTopologyStoreAsync(AsyncMockServerTestCase):
+    """Unit tests for the aio client with a topology store."""
+
+    controllers = 2
+    faucets = 2
+
+    def setUp(self):
+        """Create the store and start the mock server."""
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = JSONFileStore(os.path.join(self.tmp.name, "raincloudy.json"))
+
+    async def login(self):
+        """Return a RainCloudy object and the setup requests it made."""
+        from raincloudy.aio.core import RainCloudy
+
+        del self.server.requests[:]
+        rdy = RainCloudy(USERNAME, PASSWORD, topology_store=self.store)
+        await rdy.login()
+        await rdy.client.close()
+        setup = [path for _, path, _ in self.server.requests if path == "/setup/"]
+        return rdy, len(setup)
+
+    async def test_saved_topology(self):
+        """Test a saved topology skips the setup pages."""
+        _, crawled = await self.login()
+        self.assertEqual(crawled, 4)
+
+        rdy, crawled = await self.login()
+        self.assertEqual(crawled, 0)
+        self.assertEqual(
+            [faucet.serial for c in rdy.controllers for faucet in c.faucets],
+            ["F00", "F01", "F10", "F11"],
+        )
+
+    async def test_transient_error(self):
+        """Test a failing status request keeps the saved topology."""
+        from aiohttp import ClientResponseError
+
+        from raincloudy.aio.core import RainCloudy
+
+        await self.login()
+        self.server.status_error = 503
+        rdy = RainCloudy(USERNAME, PASSWORD, topology_store=self.store)
+        with self.assertRaises(ClientResponseError):
+            await rdy.login()
+        await rdy.client.close()
+        self.assertIsNotNone(self.store.load(TOPOLOGY_KEY))
+
+    async def test_status_mismatch(self):
+        """Test a faucet rejected by the status endpoint is crawled again."""
+        await self.login()
+        saved = self.store.load(TOPOLOGY_KEY)
+        saved[0][1][1]["serial"] = "GONE"
+        self.store.save(TOPOLOGY_KEY, saved)
+
+        rdy, crawled = await self.login()
+        self.assertGreater(crawled, 0)
+        self.assertEqual(rdy.controllers[0].faucets[1].serial, "F01")
+        self.assertEqual(self.store.load(TOPOLOGY_KEY)[0][1][1]["serial"], "F01")
+
+
+class TestSessionStore(MockServerTestCase):
+    """Unit tests for the sync client with a session store."""
+
+    def setUp(self):
+        """Create the store and start the mock server."""
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = JSONFileStore(os.path.join(self.tmp.name, "raincloudy.json"))
+
+    def login(self):
+        """Return a RainCloudy object using the session store."""
+        from raincloudy.core import RainCloudy
+
+        del self.server.requests[:]
+        return RainCloudy(USERNAME, PASSWORD, session_store=self.store)
+
+    def test_saved_session(self):
+        """Test a saved session skips the login requests."""
+        rdy = self.login()
+        self.assertEqual(logins(self.server), 2)
+        state = self.store.load(SESSION_KEY)
+        self.assertEqual(state, rdy.export_session())
+        self.assertEqual(state["csrftoken"], "TOKEN")
+        self.assertIn(state["sessionid"], self.server.sessions)
+        self.assertGreater(state["expires"], time.time())
+
+        rdy = self.login()
+        self.assertEqual(logins(self.server), 0)
+        self.assertEqual(rdy.export_session()["sessionid"], state["sessionid"])
+        self.assertEqual(rdy.controllers[0].faucets[0].serial, "F00")
+
+    def test_revoked_session(self):
+        """Test a session rejected by the site falls back to a full login."""
+        state = self.login().export_session()
+        self.server.sessions.pop(state["sessionid"])
+
+        rdy = self.login()
+        self.assertEqual(logins(self.server), 2)
+        self.assertNotEqual(rdy.export_session()["sessionid"], state["sessionid"])
+        self.assertEqual(self.store.load(SESSION_KEY), rdy.export_session())
+
+    def test_expired_session(self):
+        """Test an expired session is not sent to the site."""
+        state = self.login().export_session()
+        state["expires"] = time.time() - 1
+        self.store.save(SESSION_KEY, state)
+
+        self.login()
+        self.assertEqual(logins(self.server), 2)
+        self.assertEqual(
+            [path for _, path, _ in self.server.requests][:2], ["/login/"] * 2
+        )
+
+
+class TestSessionStoreAsync(AsyncMockServerTestCase):
+    """Unit tests for the aio client with a session store."""
+
+    def setUp(self):
+        """Create the store and start the mock server."""
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = JSONFileStore(os.path.join(self.tmp.name, "raincloudy.json"))
+
+    async def login(self):
+        """Return a RainCloudy object using the session store."""
+        from raincloudy.aio.core import RainCloudy
+
+        del self.server.requests[:]
+        rdy = RainCloudy(USERNAME, PASSWORD, session_store=self.store)
+        await rdy.login()
+        await rdy.client.close()
+        return rdy
+
+    async def test_saved_session(self):
+        """Test a saved session skips the login requests."""
+        rdy = await self.login()
+        self.assertEqual(logins(self.server), 2)
+        state = self.store.load(SESSION_KEY)
+        self.assertEqual(state["sessionid"], rdy.export_session()["sessionid"])
+        self.assertGreater(state["expires"], time.time())
+
+        rdy = await self.login()
+        self.assertEqual(logins(self.server), 0)
+        self.assertEqual(rdy.export_session()["sessionid"], state["sessionid"])
+
+    async def test_revoked_session(self):
+        """Test a session rejected by the site falls back to a full login."""
+        state = (await self.login()).export_session()
+        self.server.sessions.pop(state["sessionid"])
+
+        rdy = await self.login()
+        self.assertEqual(logins(self.server), 2)
+        self.assertNotEqual(rdy.export_session()["sessionid"], state["sessionid"])
+
+
+# vim:sw=4:ts=4:et:
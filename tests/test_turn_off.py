@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""Test the non-blocking turn-off sequence."""
+import time
+from itertools import groupby
+
+from tests.extras import PASSWORD, USERNAME, MockServerTestCase, home_forms
+
+
+class TestTurnOff(MockServerTestCase):
+    """Unit tests for RainCloudyFaucetZone.turn_off with the sync client."""
+
+    controllers = 2
+    faucets = 2
+
+    def setUp(self):
+        """Start the mock server and log in."""
+        from raincloudy.core import RainCloudy
+
+        super().setUp()
+        self.rdy = RainCloudy(USERNAME, PASSWORD, turn_off_delay=0.2)
+        del self.server.forms[:]
+
+    def test_turn_off(self):
+        """Test the OFF form is sent after turn_off_delay."""
+        zone = self.rdy.controllers[0].faucets[0].zone2
+        start = time.monotonic()
+        future = zone.turn_off()
+        self.assertLess(time.monotonic() - start, 0.2)
+        self.assertFalse(future.done())
+        self.rdy.commands.join(timeout=5)
+        forms = home_forms(self.server)
+        self.assertEqual(forms[-1]["zone2_select_manual_mode"], ["ON"])
+
+        self.assertEqual(future.result(timeout=5), "OFF")
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        self.assertEqual(
+            home_forms(self.server)[-1]["zone2_select_manual_mode"], ["OFF"]
+        )
+        self.assertFalse(zone.manual_watering)
+        self.assertEqual(zone.lookup_attr("manual_watering_time"), 0)
+
+    def test_concurrent_turn_off(self):
+        """Test zones of several faucets wait for their OFF forms together."""
+        faucets = [
+            faucet
+            for controller in self.rdy.controllers
+            for faucet in controller.faucets
+        ]
+        start = time.monotonic()
+        futures = [faucet.zone1.turn_off() for faucet in faucets]
+        for future in futures:
+            future.result(timeout=5)
+
+        # one delay overall instead of one per faucet
+        self.assertLess(time.monotonic() - start, 0.2 * len(faucets))
+        for faucet in faucets:
+            self.assertFalse(faucet.zone1.manual_watering)
+        # every OFF form follows the ON form of its faucet, the switching
+        # forms repeat them
+        for controller in range(2):
+            for faucet in range(2):
+                selected = [
+                    key
+                    for key, _ in groupby(
+                        form["zone1_select_manual_mode"]
+                        for form in home_forms(self.server)
+                        if form["select_controller"] == [str(controller)]
+                        and form["select_faucet"] == [str(faucet)]
+                    )
+                ]
+                self.assertEqual(selected[-2:], [["ON"], ["OFF"]])
+
+    def test_superseded(self):
+        """Test a new manual watering cancels a pending turn-off."""
+        zone = self.rdy.controllers[1].faucets[1].zone3
+        future = zone.turn_off()
+        zone.manual_watering = 30
+        self.assertTrue(future.cancelled())
+
+        time.sleep(0.3)
+        states = [form["zone3_select_manual_mode"] for form in home_forms(self.server)]
+        self.assertNotIn(["OFF"], states)
+        self.assertEqual(states[-1], ["30"])
+        self.assertTrue(zone.manual_watering)
+        self.assertEqual(zone.lookup_attr("manual_watering_time"), 30)
+
+    def test_logout(self):
+        """Test logging out sends the pending OFF forms first."""
+        self.rdy.turn_off_delay = 60
+        zone = self.rdy.controllers[0].faucets[0].zone1
+        future = zone.turn_off()
+        start = time.monotonic()
+        self.rdy.logout()
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(future.result(timeout=0), "OFF")
+        states = [form["zone1_select_manual_mode"] for form in home_forms(self.server)]
+        self.assertEqual(states[-2:], [["ON"], ["OFF"]])
+        self.assertIsNone(self.rdy.client)
+
+    def test_manual_watering_off(self):
+        """Test setting manual_watering to off waits for the OFF form."""
+        zone = self.rdy.controllers[0].faucets[1].zone4
+        start = time.monotonic()
+        zone.manual_watering = "off"
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        self.assertEqual(
+            home_forms(self.server)[-1]["zone4_select_manual_mode"], ["OFF"]
+        )
+        self.assertFalse(zone.manual_watering)
+
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Test concurrent status updates with the sync client."""
+
+import requests
+
+from tests.extras import (
+    PASSWORD,
+    USERNAME,
+    MockServerTestCase,
+    benchmark,
+    benchmark_test,
+    report,
+)
+
+
+class TestRainCloudyUpdate(MockServerTestCase):
+    """Unit tests for update_workers."""
+
+    controllers = 2
+    faucets = 4
+    latency = 0.01
+
+    def login(self, workers):
+        """Return a RainCloudy object with update_workers."""
+        from raincloudy.core import RainCloudy
+
+        return RainCloudy(USERNAME, PASSWORD, update_workers=workers)
+
+    def test_same_attributes(self):
+        """Test concurrent updates store the same attributes."""
+        sequential = self.login(1)
+        concurrent = self.login(8)
+        sequential.update()
+        concurrent.update()
+
+        for expected, controller in zip(sequential.controllers, concurrent.controllers):
+            self.assertEqual(controller.attributes, expected.attributes)
+            for expected_faucet, faucet in zip(expected.faucets, controller.faucets):
+                self.assertEqual(faucet.attributes, expected_faucet.attributes)
+                self.assertEqual(faucet.zone2.watering_time, 15)
+
+        adapter = concurrent.client.get_adapter(self.server.url)
+        self.assertEqual(adapter._pool_maxsize, 10)
+        self.assertEqual(
+            self.login(32).client.get_adapter(self.server.url)._pool_maxsize, 32
+        )
+
+    def test_first_error(self):
+        """Test the first failing faucet raises and stops storing attributes."""
+        rdy = self.login(8)
+        faucets = rdy.controllers[0].faucets + rdy.controllers[1].faucets
+        for faucet in faucets:
+            faucet._status = None
+        faucets[2]._id = "GONE"
+        faucets[5]._id = "GONE"
+
+        with self.assertRaises(requests.HTTPError):
+            rdy.update()
+        self.assertEqual(
+            [bool(faucet.attributes) for faucet in faucets],
+            [True, True] + [False] * 6,
+        )
+
+    @benchmark_test
+    def test_benchmark_update(self):
+        """Benchmark concurrent updates as the number of faucets grows."""
+        results = []
+        for faucets in (1, 4, 16):
+            self.server.faucets = faucets
+            sequential = benchmark(self.login(1).update, number=3)
+            concurrent = benchmark(self.login(16).update, number=3)
+            results.append((faucets * 2, sequential, concurrent))
+            report(
+                f"{faucets * 2} faucets", sequential=sequential, concurrent=concurrent
+            )
+
+        faucets, sequential, concurrent = results[-1]
+        self.assertLess(concurrent * 2, sequential)
+
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""Test the status change subscriptions of the aio client."""
+import asyncio
+import unittest
+
+from tests.extras import PASSWORD, USERNAME, AsyncMockServerTestCase, status_requests
+
+
+def event(field, old, new, faucet="F00", zone=1):
+    """Return a StatusEvent of zone."""
+    from raincloudy.aio.watch import StatusEvent
+
+    return StatusEvent("CTRL0", faucet, zone, field, old, new)
+
+
+class TestSubscription(unittest.IsolatedAsyncioTestCase):
+    """Unit tests for Subscription."""
+
+    async def test_drop(self):
+        """Test the oldest events are dropped once the queue is full."""
+        from raincloudy.aio.watch import Subscription
+
+        subscription = Subscription(maxsize=2, overflow="drop")
+        for minutes in (5, 10, 15):
+            subscription.put(event("manual_watering_time", 0, minutes))
+        self.assertEqual(len(subscription), 2)
+        self.assertEqual(subscription.dropped, 1)
+        self.assertEqual((await subscription.get()).new, 10)
+        self.assertEqual((await subscription.get()).new, 15)
+
+        waiter = asyncio.ensure_future(subscription.get())
+        await asyncio.sleep(0)
+        self.assertFalse(waiter.done())
+        subscription.put(event("is_watering", False, True))
+        self.assertEqual((await waiter).field, "is_watering")
+
+    async def test_coalesce(self):
+        """Test changes of a field waiting are merged into one event."""
+        from raincloudy.aio.watch import Subscription
+
+        subscription = Subscription(maxsize=2)
+        subscription.put(event("manual_watering_time", 0, 5))
+        subscription.put(event("is_watering", False, True))
+        subscription.put(event("manual_watering_time", 5, 15))
+        self.assertEqual(len(subscription), 2)
+        self.assertEqual(subscription.coalesced, 1)
+        self.assertEqual(
+            str(await subscription.get()), "F00 zone 1 manual_watering_time 0 -> 15"
+        )
+
+        # a field changed back is not reported
+        subscription.put(event("is_watering", True, False))
+        self.assertEqual(len(subscription), 0)
+        subscription.put(event("rain_delay_mode", 0, 2, zone=2))
+        subscription.put(event("rain_delay_mode", 0, 2, zone=3))
+        subscription.put(event("rain_delay_mode", 0, 2, zone=4))
+        self.assertEqual(subscription.dropped, 1)
+        self.assertEqual((await subscription.get()).zone, 3)
+
+    def test_filters(self):
+        """Test subscriptions only match the events asked for."""
+        from raincloudy.aio.watch import Subscription
+
+        self.assertTrue(Subscription().matches(event("is_watering", False, True)))
+        self.assertFalse(
+            Subscription(faucet="F01").matches(event("is_watering", False, True))
+        )
+        subscription = Subscription(controller="CTRL0", zone=1, fields=["is_watering"])
+        self.assertTrue(subscription.matches(event("is_watering", False, True)))
+        self.assertFalse(
+            subscription.matches(event("is_watering", False, True, zone=2))
+        )
+        self.assertFalse(subscription.matches(event("rain_delay_mode", 0, 1)))
+
+        self.assertRaises(ValueError, Subscription, maxsize=0)
+        self.assertRaises(ValueError, Subscription, overflow="block")
+
+
+class TestWatch(AsyncMockServerTestCase):
+    """Unit tests for RainCloudy.watch."""
+
+    controllers = 2
+    faucets = 2
+
+    async def test_watch(self):
+        """Test subscribers share the polls and get the changes they want."""
+        from raincloudy.aio.core import RainCloudy
+        from raincloudy.polling import PollPolicy
+
+        rdy = RainCloudy(USERNAME, PASSWORD, status_max_age=60)
+        await rdy.login()
+        rdy.watcher.poller.policy = PollPolicy(
+            watering_interval=0.05, action_interval=0.05, action_window=1
+        )
+        del self.server.requests[:]
+
+        first = rdy.watch(faucet="F00")
+        second = rdy.watch(zone=1, fields=["program_mode_on"])
+        third = rdy.watch(faucet="F11")
+        pending = [
+            asyncio.ensure_future(watch.__anext__()) for watch in (first, second, third)
+        ]
+        await asyncio.sleep(0.1)
+        self.assertEqual(len(rdy.watcher.subscriptions), 3)
+
+        await rdy.controllers[0].faucets[0].zone1.set_auto_watering(True)
+        results = await asyncio.wait_for(asyncio.gather(*pending[:2]), 5)
+        for result in results:
+            self.assertEqual(str(result), "F00 zone 1 program_mode_on False -> True")
+            self.assertEqual(result.controller, "CTRL0")
+        # the site still reports the program off on the next poll
+        result = await asyncio.wait_for(first.__anext__(), 5)
+        self.assertEqual(str(result), "F00 zone 1 program_mode_on True -> False")
+        self.assertFalse(pending[2].done())
+
+        # cancelling a pending event unsubscribes too
+        pending[2].cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending[2]
+        self.assertEqual(len(rdy.watcher.subscriptions), 2)
+        for watch in (first, second, third):
+            await watch.aclose()
+        self.assertEqual(rdy.watcher.subscriptions, [])
+        polls = rdy.watcher.poller.metrics["polls"]
+        self.assertGreaterEqual(polls, 8)
+        self.assertEqual(len(status_requests(self.server)), polls)
+
+        # polling stopped with the last subscriber
+        await asyncio.sleep(0.1)
+        self.assertEqual(rdy.watcher.poller.metrics["polls"], polls)
+        self.assertEqual(rdy.watcher.errors, 0)
+        await rdy.client.close()
+
+    async def test_poll_errors(self):
+        """Test polling goes on after an unexpected error."""
+        from raincloudy.aio.core import RainCloudy
+        from raincloudy.polling import PollPolicy
+
+        rdy = RainCloudy(USERNAME, PASSWORD, status_max_age=60)
+        await rdy.login()
+        rdy.watcher.poller.policy = PollPolicy(
+            watering_interval=0.05, action_interval=0.05, idle_interval=0.05
+        )
+        broken = rdy.controllers[0].faucets[0]
+
+        async def update():
+            raise RuntimeError("update failed")
+
+        broken.update = update
+        watch = rdy.watch(faucet="F01")
+        pending = asyncio.ensure_future(watch.__anext__())
+        with self.assertLogs("raincloudy.aio.watch", level="ERROR"):
+            await asyncio.sleep(0.2)
+        self.assertGreaterEqual(rdy.watcher.errors, 2)
+        self.assertIsInstance(rdy.watcher.last_error, RuntimeError)
+
+        await rdy.controllers[0].faucets[1].zone4.set_auto_watering(True)
+        result = await asyncio.wait_for(pending, 5)
+        self.assertEqual(str(result), "F01 zone 4 program_mode_on False -> True")
+        await watch.aclose()
+        await rdy.client.close()
+
+
+# vim:sw=4:ts=4:et: